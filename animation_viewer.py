@@ -3,13 +3,12 @@ import json
 import os
 import math
 import async_helpers
-import requests
 import _thread
 import binascii
-import gc
 import time
 import wifi
 import asyncio
+from array import array
 from tildagonos import tildagonos
 
 from events.input import ButtonDownEvent, BUTTON_TYPES, ButtonUpEvent
@@ -21,11 +20,63 @@ from .lj_utils.lj_button_labels import ButtonLabels
 from .lj_utils.lj_notification import Notification
 from .lj_utils.wifi_utils import check_wifi, wifi_is_connecting
 from .lj_utils.file_utils import file_exists, folder_exists
+from .lj_utils import async_http
+from .lj_utils import tracer
+from .lj_utils.lru_file_cache import LruFileCache
+from .lj_utils.json_stream import JsonArrayStream
+from .lj_utils.memory_manager import MemoryManager
+from .fastload import FastloadDecoder, palette_colors, expand_palette_frame, compact_palette_frame
+from .sequence_list import SequenceListDecoder, is_sequence_list_blob
+from .sequence import sequence_from_json
 
 APP_BASE_PATH = "/apps/pixelbadge/"
 DATA_BASE_PATH = "/data/pixelbadge/"
 USE_IMAGE_FALLBACK = True
 FASTLOAD_FRAMES = True
+# ask for palette indexed fastload blobs, see fastload.py
+FASTLOAD_PALETTE = True
+# ask for keyframe + delta encoded frames on top of the palette format
+FASTLOAD_DELTA = True
+# bytes read from the socket at a time while streaming fastload frames
+FASTLOAD_CHUNK_SIZE = 1024
+# draw all rectangles of the same color as a single path, with one fill per color
+BATCH_COLOR_FILLS = True
+# print dns/handshake/wait/transfer times for every request
+LOG_HTTP_TIMINGS = False
+# how many thumbnails of a page are downloaded at the same time
+THUMBNAIL_DOWNLOAD_CONCURRENCY = 3
+# fetch all thumbnails of a page in a single request, see download_thumbnail_bundle
+BATCH_THUMBNAILS = True
+THUMBNAIL_BUNDLE_CHUNK_SIZE = 1024
+# load the next page in the background once the current one has finished loading
+PREFETCH_NEXT_PAGE = True
+# bytes of list json and thumbnails the prefetched page may hold
+PAGE_PREFETCH_BUDGET = 48 * 1024
+# start downloading the frames of the selected thumbnail once the selection has rested on it for SPECULATIVE_DWELL_MS
+SPECULATIVE_FRAME_PREFETCH = False
+SPECULATIVE_DWELL_MS = 800
+# keep downloaded fastload blobs on flash, so reopening an animation doesn't need the network
+CACHE_ANIMATIONS = True
+ANIMATION_CACHE_MAX_BYTES = 512 * 1024
+ANIMATION_CACHE_PATH = DATA_BASE_PATH + "animation_cache/"
+# keep sequence lists and thumbnails with their ETag / Last-Modified, and only download them again if they changed
+REVALIDATE_REQUESTS = True
+HTTP_CACHE_MAX_BYTES = 128 * 1024
+HTTP_CACHE_PATH = DATA_BASE_PATH + "http_cache/"
+# recently seen pages are kept in RAM, up to this many bytes of list and thumbnail data, and shown
+# straight away when they're opened again while the list is fetched again in the background
+PAGE_CACHE_MAX_BYTES = 32 * 1024
+# parse the sequence list as it arrives, one sequence at a time, instead of reading the whole response
+# and parsing it at once, which needs the text and the whole object tree in RAM together
+STREAM_SEQUENCES_LIST = True
+# ask for the binary sequence list (see sequence_list.py), servers that don't support it send JSON
+BINARY_SEQUENCES_LIST = True
+# inline base64 thumbnails are only decoded once they're drawn, and encoded ones are kept so the
+# decoded copy can be dropped again when the thumbnail is this many indices away from the drawn range
+THUMBNAIL_EVICT_DISTANCE = 6
+# bytes of decoded frames, thumbnails and cached or prefetched pages kept in RAM, the least recently
+# used ones are dropped past this, see lj_utils/memory_manager.py
+MEMORY_BUDGET_BYTES = 256 * 1024
 
 # for f in os.listdir("/apps"):
 #     if app.startswith("lucasjones-pixelbadge"):
@@ -48,55 +99,39 @@ api_base_url = "https://badge.pixelbadge.xyz"
 auth_file = DATA_BASE_PATH + "auth_token.json"
 favorites_file = DATA_BASE_PATH + "favorite_animations.json"
 
-async def download_thumbnails(thumbnail_browser, i, sequence, sequences_len, page_identifier):
-    print("Downloading thumbnails...")
-    erased_thumbnails = False
+# downloads a single thumbnail, gives up early if the batch gets cancelled
+async def download_thumbnail(thumbnail_browser, sequence, batch):
     thumb_path = None
-    if i >= sequences_len:
-        thumbnail_browser.parent.app.print_error(f"WARNING: download_thumbnails called with invalid index: {i} (sequences len: {sequences_len})")
-        return
     max_retries = 15
     retries = 0
     while retries < max_retries:
         if retries > 0:
-            print(f"Download of thumbnail for {sequence['id']} failed, retrying... (retry {retries}/{max_retries})")
+            print(f"Download of thumbnail for {sequence.id} failed, retrying... (retry {retries}/{max_retries})")
             await asyncio.sleep(1)
+            if batch['cancelled']:
+                return None
         retries += 1
         try:
-            thumb_url = f"{api_base_url}/api/sequence/{sequence['id']}/thumbnail"
+            thumb_url = f"{api_base_url}/api/sequence/{sequence.id}/thumbnail"
             if USE_IMAGE_FALLBACK:
                 thumb_url += "?fallback=true"
-            thumb_response = requests.get(thumb_url, headers=thumbnail_browser.parent.get_auth_headers())
-            # thumbnail_browser.download_task = async_helpers.unblock(requests.get, thumbnail_browser.periodic_func, thumb_url)
-            # thumb_response = await thumbnail_browser.download_task
-            if thumbnail_browser.page_identifier() != page_identifier:
-                return
+            thumb_response = await thumbnail_browser.parent.http.get(thumb_url, headers=thumbnail_browser.parent.get_auth_headers(), revalidate=True)
+            if batch['cancelled']:
+                return None
             if thumb_response.status_code == 200:
-                print(f"Downloaded thumbnail for {sequence['id']}")
+                print(f"Downloaded thumbnail for {sequence.id}")
                 if USE_IMAGE_FALLBACK:
-                    # thumb_data = thumb_response.json()
-                    # thumb_path = thumb_data
                     thumb_path = thumb_response.content
                 else:
-                    img_file = f"thumbs/{sequence['id']}.png"
+                    img_file = f"thumbs/{sequence.id}.png"
                     thumb_path = get_image_path(img_file)
-                    if not erased_thumbnails:
-                        erased_thumbnails = True
                     with open(thumb_path, "wb") as f:
                         f.write(thumb_response.content)
-                # sequence['thumbnail_path'] = thumb_path
                 break
             else:
-                print(f"Failed to download thumbnail for {sequence['id']}")
+                print(f"Failed to download thumbnail for {sequence.id}")
         except Exception as e:
-            thumbnail_browser.parent.app.print_error(f"Error downloading thumbnail for {sequence['id']}: {e}")
-    if i < sequences_len - 1:
-        # _thread.start_new_thread(self.download_thumbnails, (i + 1, page_identifier))
-        # self.download_thumbnails(i + 1, page_identifier)
-        asyncio.create_task(thumbnail_browser.run_download_thumbnails(i + 1, page_identifier))
-    elif i == sequences_len - 1:
-        print("[download_thumbnails] running gc.collect()")
-        gc.collect()
+            thumbnail_browser.parent.app.print_error(f"Error downloading thumbnail for {sequence.id}: {e}")
     if thumb_path is not None:
         return {
             "thumb_path": thumb_path,
@@ -104,9 +139,81 @@ async def download_thumbnails(thumbnail_browser, i, sequence, sequences_len, pag
     
     return None
 
-def fallback_image_renderer(ctx, data, x, y, w, h, pixel_perfect=True, center_overflow=True, glitch_effect=False):
-    width = data[0]
-    height = data[1]
+# Fetches the thumbnails of every pending sequence of the batch from /api/thumbnails?ids=a,b,c
+# The response is a bundle with, for every requested id in order, [length (u32, big endian), raw thumbnail...]
+# where a length of 0 means there is no thumbnail. Thumbnails are handed out as soon as they arrive.
+# Returns False if the server doesn't support the endpoint.
+async def download_thumbnail_bundle(thumbnail_browser, batch):
+    # request them in download order, so the ones closest to the selection show up first
+    pending = list(batch['pending'])
+    order = []
+    while len(pending) > 0:
+        order.append(thumbnail_browser.next_thumbnail_index(pending))
+    ids = [batch['sequences'][i].id for i in order]
+    bundle_url = f"{api_base_url}/api/thumbnails?ids=" + ",".join(ids) + "&fallback=true"
+    response = await thumbnail_browser.parent.http.get(bundle_url, headers=thumbnail_browser.parent.get_auth_headers(), stream=True, revalidate=True)
+    try:
+        if response.status_code == 404:
+            print("Thumbnail bundles not supported by the server, downloading thumbnails one by one")
+            return False
+        if response.status_code != 200:
+            print(f"Failed to download thumbnail bundle, status code: {response.status_code}")
+            return True
+        data = b""
+        k = 0
+        over_budget = False
+        while k < len(order) and not over_budget:
+            chunk = await response.read(THUMBNAIL_BUNDLE_CHUNK_SIZE)
+            if batch['cancelled'] or not chunk:
+                break
+            data += chunk
+            while k < len(order) and len(data) >= 4 and not over_budget:
+                length = (data[0] << 24) | (data[1] << 16) | (data[2] << 8) | data[3]
+                if len(data) < 4 + length:
+                    break
+                sequence = batch['sequences'][order[k]]
+                # prefetched pages have a limited amount of memory to fill, stop before going over it
+                if 'budget' in batch and batch['bytes'] + length > batch['budget']:
+                    batch['budget_reached'] = True
+                    over_budget = True
+                    break
+                if length > 0:
+                    sequence.thumbnail_path = data[4:4 + length]
+                    sequence.thumbnail_render_cache = None
+                else:
+                    print(f"No thumbnail in bundle for {sequence.id}")
+                batch['pending'].remove(order[k])
+                data = data[4 + length:]
+                k += 1
+                if 'budget' in batch:
+                    batch['bytes'] += length
+        print(f"Got {k}/{len(order)} thumbnails from bundle")
+    finally:
+        response.close()
+    return True
+
+# parser for a sequence list starting with chunk, binary or JSON depending on what the server sent,
+# on_item gets every Sequence of the list
+def new_sequences_page_parser(chunk, on_item):
+    if is_sequence_list_blob(chunk):
+        return SequenceListDecoder(on_item)
+    return JsonArrayStream('sequences', lambda item: on_item(sequence_from_json(item)))
+
+# returns (result, sequences) of a whole sequence list response body
+def parse_sequences_page(content):
+    if is_sequence_list_blob(content):
+        sequences = []
+        decoder = SequenceListDecoder(sequences.append)
+        decoder.feed(content)
+        result = decoder.finish()
+        result['sequences'] = sequences
+        return result, sequences
+    result = json.loads(content)
+    sequences = [sequence_from_json(item) for item in result.get('sequences') or []]
+    result['sequences'] = sequences
+    return result, sequences
+
+def fallback_image_layout(width, height, x, y, w, h, pixel_perfect=True, center_overflow=True):
     rect_width = w / width
     rect_height = h / height
     if pixel_perfect:
@@ -114,18 +221,6 @@ def fallback_image_renderer(ctx, data, x, y, w, h, pixel_perfect=True, center_ov
         rect_height = math.ceil(rect_height)
         x = math.floor(x)
         y = math.floor(y)
-    
-    index = 2  # Start after width and height
-    if glitch_effect:
-        if glitch_effect < 0:
-            glitch_effect = 0
-        elif glitch_effect > 2:
-            glitch_effect = 2
-        index = index - glitch_effect
-    pixel_mul = 1.0 / 255.0
-
-    rect_width_plus_one = rect_width + 1
-    rect_height_plus_one = rect_height + 1
 
     if pixel_perfect and center_overflow:
         # Calculate overflow and subtract half of it from x and y
@@ -135,19 +230,116 @@ def fallback_image_renderer(ctx, data, x, y, w, h, pixel_perfect=True, center_ov
             x -= math.floor(overflow_x * 0.5)
         if overflow_y > 0:
             y -= math.floor(overflow_y * 0.5)
+    return x, y, rect_width, rect_height
+
+# Converts fallback image data into horizontal runs of identical color, so it can be drawn with one
+# rectangle per run instead of one per pixel. Returns (width, height, colors, spans), where colors
+# holds the normalized rgb tuples and spans is a flat array of (column, row, run_length, color_index).
+# If palette (normalized colors) is given, data holds one palette index per pixel instead of rgb.
+# If previous is given, only pixels that differ from the same pixel in previous are included.
+def build_image_spans(data, glitch_effect=0, palette=None, previous=None):
+    width = data[0]
+    height = data[1]
+    index = 2  # Start after width and height
+    if glitch_effect:
+        index = index - min(max(glitch_effect, 0), 2)
+    pixel_mul = 1.0 / 255.0
 
-    start = time.ticks_ms()
-
+    colors = []
+    color_indices = {}
+    spans = array('H')
     for j in range(height):
-        for i in range(width):
-            r = data[index]
-            g = data[index + 1]
-            b = data[index + 2]
-            ctx.rgb(r * pixel_mul, g * pixel_mul, b * pixel_mul)
-            ctx.rectangle(x + i * rect_width, y + j * rect_height, rect_width_plus_one, rect_height_plus_one).fill()
-            index += 3
-    
-    # print("Fallback image render time:", time.ticks_diff(time.ticks_ms(), start))
+        run_start = 0
+        run_color = -1
+        for i in range(width + 1):
+            color = -1
+            if i < width:
+                if palette is None:
+                    if previous is None or previous[index] != data[index] or previous[index + 1] != data[index + 1] or previous[index + 2] != data[index + 2]:
+                        color = (data[index] << 16) | (data[index + 1] << 8) | data[index + 2]
+                    index += 3
+                else:
+                    if previous is None or previous[index] != data[index]:
+                        color = data[index]
+                    index += 1
+            if color == run_color:
+                continue
+            if run_color != -1:
+                color_index = color_indices.get(run_color)
+                if color_index is None:
+                    color_index = len(colors)
+                    color_indices[run_color] = color_index
+                    if palette is None:
+                        colors.append(((run_color >> 16) * pixel_mul, ((run_color >> 8) & 0xff) * pixel_mul, (run_color & 0xff) * pixel_mul))
+                    else:
+                        colors.append(palette[run_color])
+                spans.append(run_start)
+                spans.append(j)
+                spans.append(i - run_start)
+                spans.append(color_index)
+            run_start = i
+            run_color = color
+    return width, height, colors, spans
+
+# Draws the output of build_image_spans, laid out by fallback_image_layout.
+# Pass overlap=False when drawing over an existing image, so runs don't bleed into their neighbours.
+def span_image_renderer(ctx, image_spans, x, y, w, h, pixel_perfect=True, center_overflow=True, overlap=True):
+    width, height, colors, spans = image_spans
+    x, y, rect_width, rect_height = fallback_image_layout(width, height, x, y, w, h, pixel_perfect, center_overflow)
+    overlap_size = 1 if overlap else 0
+    rect_height_plus_one = rect_height + overlap_size
+    last_color_index = -1
+    for k in range(0, len(spans), 4):
+        color_index = spans[k + 3]
+        if color_index != last_color_index:
+            ctx.rgb(*colors[color_index])
+            last_color_index = color_index
+        ctx.rectangle(x + spans[k] * rect_width, y + spans[k + 1] * rect_height, spans[k + 2] * rect_width + overlap_size, rect_height_plus_one).fill()
+
+# Groups the spans from build_image_spans by color. Returns (width, height, colors, batches), where
+# batches[color_index] is a flat array of (column, row, run_length) for every run of that color.
+def build_color_batches(image_spans):
+    width, height, colors, spans = image_spans
+    batches = [array('H') for _ in range(len(colors))]
+    for k in range(0, len(spans), 4):
+        batch = batches[spans[k + 3]]
+        batch.append(spans[k])
+        batch.append(spans[k + 1])
+        batch.append(spans[k + 2])
+    return width, height, colors, batches
+
+# Draws the output of build_color_batches, setting the color and filling once per distinct color.
+# Batches aren't drawn in scanline order, so unlike the other renderers rectangles don't overlap
+# their neighbours by a pixel, otherwise they would bleed into runs that were already filled.
+def batched_image_renderer(ctx, image_batches, x, y, w, h, pixel_perfect=True, center_overflow=True):
+    width, height, colors, batches = image_batches
+    x, y, rect_width, rect_height = fallback_image_layout(width, height, x, y, w, h, pixel_perfect, center_overflow)
+    for color_index in range(len(batches)):
+        batch = batches[color_index]
+        ctx.rgb(*colors[color_index])
+        ctx.begin_path()
+        for k in range(0, len(batch), 3):
+            ctx.rectangle(x + batch[k] * rect_width, y + batch[k + 1] * rect_height, batch[k + 2] * rect_width, rect_height)
+        ctx.fill()
+
+# kind of a render cache, the first item of what build_image_render_cache returns
+RENDER_CACHE_SPANS = 0
+RENDER_CACHE_BATCHES = 1
+
+# Precomputed draw data for fallback image data, in the format used by the current render mode.
+# Returns (kind, draw data), so caches built before the render mode changed are still drawn correctly.
+def build_image_render_cache(data, glitch_effect=0, palette=None, previous=None):
+    image_spans = build_image_spans(data, glitch_effect, palette, previous)
+    if BATCH_COLOR_FILLS:
+        return RENDER_CACHE_BATCHES, build_color_batches(image_spans)
+    return RENDER_CACHE_SPANS, image_spans
+
+def cached_image_renderer(ctx, render_cache, x, y, w, h, pixel_perfect=True, center_overflow=True, overlap=True):
+    kind, image_data = render_cache
+    if kind == RENDER_CACHE_BATCHES:
+        batched_image_renderer(ctx, image_data, x, y, w, h, pixel_perfect, center_overflow)
+    else:
+        span_image_renderer(ctx, image_data, x, y, w, h, pixel_perfect, center_overflow, overlap)
 
 class ThumbnailBrowser(Utility):
     def __init__(self, app, parent):
@@ -167,6 +359,27 @@ class ThumbnailBrowser(Utility):
         self.any_sequences_loaded = False
         self.fetch_sequences_error = False
         self.spinner_time = 0
+        # thumbnail downloads of the current page, see start_thumbnail_downloads
+        self.thumbnail_batch = None
+        # cleared when the server answers thumbnail bundle requests with a 404
+        self.thumbnail_bundles_supported = True
+        # the next page, loaded in the background, see start_page_prefetch
+        self.page_prefetch = None
+        # how long the selection has been on the current thumbnail
+        self.selection_dwell_ms = 0
+        # page_identifier() -> {"result", "sequences", "bytes", "used"} of pages seen recently, see cache_loaded_page
+        self.page_cache = {}
+        self.page_cache_bytes = 0
+        self.page_cache_clock = 0
+        # range of thumbnails last marked as used in the memory manager, see draw
+        self.touched_start_index = -1
+        self.touched_end_index = -1
+        # identifier and list response of the page on screen
+        self.loaded_page_identifier = None
+        self.loaded_page_result = None
+        self.parent.memory.add_holder("thumbnails", self.evict_decoded_thumbnail)
+        self.parent.memory.add_holder("page_cache", self.remove_cached_page)
+        self.parent.memory.add_holder("page_prefetch", self.evict_page_prefetch)
 
         self.button_managers = [
             RepeatingButtonManager(self.app, BUTTON_TYPES['DOWN'], self.navigate_down),
@@ -177,7 +390,7 @@ class ThumbnailBrowser(Utility):
     def on_start(self):
         if self.sequences is None or len(self.sequences) == 0:
             # _thread.start_new_thread(self.fetch_sequences, ())
-            asyncio.create_task(self.fetch_sequences())
+            asyncio.create_task(tracer.trace_task(self.fetch_sequences(), "fetch_sequences"))
         thumbs_dir = get_image_path("thumbs")
         tmp_dir = get_image_path("tmp")
         try:
@@ -202,11 +415,140 @@ class ThumbnailBrowser(Utility):
     def page_identifier(self):
         return f"{self.sort_mode()}_{self.current_page_index}"
 
+    async def request_sequences_page(self, sort_mode, page_index, stream=False):
+        req_url = api_base_url + '/api/sequences?page=' + str(page_index)
+        if BINARY_SEQUENCES_LIST:
+            req_url += "&format=binary"
+        if sort_mode == "favorites":
+            favorites = self.parent.load_favorites_file()
+            if USE_IMAGE_FALLBACK:
+                req_url += "&fallback=true"
+            return await self.parent.http.get(req_url, json=favorites, headers=self.parent.get_auth_headers(), stream=stream)
+        req_url += "&sort=" + sort_mode
+        if USE_IMAGE_FALLBACK:
+            req_url += "&fallback=true"
+        return await self.parent.http.get(req_url, headers=self.parent.get_auth_headers(), stream=stream, revalidate=True)
+
+    # returns (result, sequences) of a successful request_sequences_page, streamed responses are
+    # parsed a sequence at a time, so the raw data of each one is freed as soon as it's parsed
+    async def read_sequences_page(self, response):
+        if response.content is not None:
+            # read already, or the cached copy of a 304
+            return parse_sequences_page(response.content)
+        sequences = []
+        parser = None
+        try:
+            while True:
+                chunk = await response.read()
+                if not chunk:
+                    break
+                if parser is None:
+                    parser = new_sequences_page_parser(chunk, sequences.append)
+                parser.feed(chunk)
+        finally:
+            response.close()
+        if parser is None:
+            raise ValueError("empty sequence list")
+        result = parser.finish()
+        result['sequences'] = sequences
+        return result, sequences
+
+    # makes a fetched page the current one, inline thumbnails are left base64 encoded until they're drawn
+    def apply_sequences_page(self, result, sequences):
+        self.sequences = sequences
+        self.touched_start_index = -1
+        self.loaded_page_identifier = self.page_identifier()
+        self.loaded_page_result = result
+        if result.get('total_page_count', 0) > 0:
+            self.max_page_index = result['total_page_count']
+        if result.get('next_page_exists', False):
+            if self.current_page_index + 1 > self.max_page_index:
+                self.max_page_index = self.current_page_index + 1
+        else:
+            self.max_page_index = self.current_page_index
+        print(f"Fetched {len(self.sequences)} sequences. Next page exists: {result.get('next_page_exists', False)}")
+        self.is_loading_sequences_list = False
+        self.any_sequences_loaded = True
+        self.fetch_sequences_error = False
+        self.parent.delete_all_files(get_image_path("thumbs"))
+        for seq in self.sequences:
+            # thumbnail files are only downloaded after this, so strings are base64 from the list
+            if isinstance(seq.thumbnail_path, str):
+                seq.thumbnail_inline = True
+        if 'random_uuid' in result and result['random_uuid'] != "" and (self.parent.badge_uuid is None or self.parent.badge_uuid == ""):
+            self.parent.badge_uuid = result['random_uuid']
+            self.parent.save_auth_info(badge_uuid=self.parent.badge_uuid)
+        self.track_thumbnails()
+        if len(self.sequences) > 0 and any(seq.thumbnail_path is None for seq in self.sequences):
+            self.start_thumbnail_downloads()
+        else:
+            # nothing left to download for this page
+            self.start_page_prefetch()
+
+    # counts the thumbnails of the page towards the memory budget, only decoded copies of inline ones can be evicted
+    def track_thumbnails(self):
+        memory = self.parent.memory
+        memory.untrack_all("thumbnails")
+        for seq in self.sequences:
+            # strings that aren't inline thumbnails are file paths
+            if seq.thumbnail_path is not None and (seq.thumbnail_inline or not isinstance(seq.thumbnail_path, str)):
+                memory.track("thumbnails", seq.id, len(seq.thumbnail_path), pinned=seq.thumbnail_base64 is None)
+
+    # decodes an inline base64 thumbnail, keeping the encoded one so it can be evicted again, and
+    # returns the decoded data, or None if it has been evicted already
+    def decode_thumbnail(self, seq):
+        seq.thumbnail_base64 = seq.thumbnail_path
+        seq.thumbnail_path = binascii.a2b_base64(seq.thumbnail_base64)
+        seq.thumbnail_render_cache = None
+        if not self.parent.memory.track("thumbnails", seq.id, len(seq.thumbnail_path)):
+            # everything else left is pinned, if decoding the next thumbnail evicted this one it would be
+            # decoded again on every frame, so it's kept until it's scrolled away
+            self.parent.memory.set_pinned("thumbnails", seq.id, True)
+        if seq.thumbnail_base64 is None:
+            return None
+        return seq.thumbnail_path
+
+    def evict_thumbnail(self, seq):
+        seq.thumbnail_path = seq.thumbnail_base64
+        seq.thumbnail_base64 = None
+        seq.thumbnail_render_cache = None
+        if seq in self.sequences:
+            self.parent.memory.track("thumbnails", seq.id, len(seq.thumbnail_path), pinned=True)
+
+    def evict_decoded_thumbnail(self, sequence_id):
+        for seq in self.sequences:
+            if seq.id == sequence_id and seq.thumbnail_base64 is not None:
+                self.evict_thumbnail(seq)
+
+    # drops the decoded copy of inline thumbnails far from the range being drawn
+    def evict_offscreen_thumbnails(self, start_index, end_index):
+        for i in range(len(self.sequences)):
+            if start_index - THUMBNAIL_EVICT_DISTANCE <= i < end_index + THUMBNAIL_EVICT_DISTANCE:
+                continue
+            if self.sequences[i].thumbnail_base64 is not None:
+                self.evict_thumbnail(self.sequences[i])
+
     async def fetch_sequences(self):
         print("Fetching sequences... sort mode:", self.sort_mode())
+        self.cancel_thumbnail_downloads()
+        self.selection_changed()
+        if self.prefetched_page_ready():
+            # keep it from being evicted to make room for the page being cached
+            self.parent.memory.set_pinned("page_prefetch", self.page_prefetch['page_index'], True)
+        self.cache_loaded_page()
+        if self.use_prefetched_page():
+            return
+        self.cancel_page_prefetch()
+        page_identifier = self.page_identifier()
+        # a recently seen page is shown right away, and only replaced if the server's list differs
+        cached_page = self.take_cached_page(page_identifier)
+        if cached_page is not None:
+            print(f"Showing cached page {page_identifier}, revalidating")
+            self.apply_sequences_page(cached_page['result'], cached_page['sequences'])
         max_retries = 30
+        if cached_page is not None:
+            max_retries = 3
         retries = 0
-        should_gc_collect = False
 
         while retries < max_retries:
             if retries > 0:
@@ -217,96 +559,347 @@ class ThumbnailBrowser(Utility):
             while not self.app.wifi_manager.is_connected():
                 print("[fetch_sequences] Waiting for Wi-Fi connection...")
                 await asyncio.sleep(0.2)
+            if self.page_identifier() != page_identifier:
+                # another page has been opened meanwhile, it's fetched by its own call
+                return
             
-            self.sequences = []
-            try:
+            if cached_page is None:
+                self.sequences = []
                 self.is_loading_sequences_list = True
-                if self.sort_mode() == "favorites":
-                    favorites = self.parent.load_favorites_file()
-                    req_url = api_base_url + '/api/sequences?page=' + str(self.current_page_index)
-                    if USE_IMAGE_FALLBACK:
-                        req_url += "&fallback=true"
-                    response = requests.get(req_url, json=favorites, headers=self.parent.get_auth_headers())
-                else:
-                    req_url = api_base_url + '/api/sequences?page=' + str(self.current_page_index) + "&sort=" + self.sort_mode()
-                    if USE_IMAGE_FALLBACK:
-                        req_url += "&fallback=true"
-                    response = requests.get(req_url, headers=self.parent.get_auth_headers())
+            try:
+                response = await self.request_sequences_page(self.sort_mode(), self.current_page_index, stream=STREAM_SEQUENCES_LIST)
+                if self.page_identifier() != page_identifier:
+                    response.close()
+                    return
                 if response.status_code == 200:
-                    result = response.json()
-                    if result.get('sequences') is not None:
-                        self.sequences = result['sequences']
+                    result, sequences = await self.read_sequences_page(response)
+                    if self.page_identifier() != page_identifier:
+                        return
+                    if cached_page is None:
+                        self.apply_sequences_page(result, sequences)
                     else:
-                        self.sequences = []
-                    if result.get('total_page_count', 0) > 0:
-                        self.max_page_index = result['total_page_count']
-                    if result.get('next_page_exists', False):
-                        if self.current_page_index + 1 > self.max_page_index:
-                            self.max_page_index = self.current_page_index + 1
-                    else:
-                        self.max_page_index = self.current_page_index
-                    print(f"Fetched {len(self.sequences)} sequences. Next page exists: {result['next_page_exists']}")
-                    self.is_loading_sequences_list = False
-                    self.any_sequences_loaded = True
-                    self.fetch_sequences_error = False
-                    self.parent.delete_all_files(get_image_path("thumbs"))
-                    if len(self.sequences) > 0 and 'thumbnail_path' in self.sequences[0]:
-                        # decode base64 for each thumbnail
-                        for seq in self.sequences:
-                            seq['thumbnail_path'] = binascii.a2b_base64(seq['thumbnail_path'])
-                        should_gc_collect = True
-                    if len(self.sequences) > 0 and 'thumbnail_path' not in self.sequences[0]:
-                        # _thread.start_new_thread(self.download_thumbnails, (0, self.page_identifier))
-                        # self.download_thumbnails(0, self.page_identifier)
-                        asyncio.create_task(self.run_download_thumbnails(0, self.page_identifier()))
-                    if 'random_uuid' in result and result['random_uuid'] != "" and (self.parent.badge_uuid is None or self.parent.badge_uuid == ""):
-                        self.parent.badge_uuid = result['random_uuid']
-                        self.parent.save_auth_info(badge_uuid=self.parent.badge_uuid)
+                        self.apply_revalidated_page(result, sequences)
                     break
                 else:
+                    response.close()
                     self.is_loading_sequences_list = False
                     print("Failed to fetch sequences, status code:", response.status_code)
             except Exception as e:
                 self.is_loading_sequences_list = False
                 print(f"Error fetching sequences: {e}")
+                self.app.heap_monitor.mark(f"fetch_sequences failed: {e}", dump=isinstance(e, MemoryError))
         
-        if retries >= max_retries:
+        if retries >= max_retries and cached_page is None:
             self.fetch_sequences_error = True
             print("Failed to fetch sequences after max retries")
-        
-        if should_gc_collect:
-            print("[fetch_sequences] gc.collect()")
-            gc.collect()
-    
-    async def run_download_thumbnails(self, i, page_identifier):
-        while not self.app.wifi_manager.is_connected():
-            print("[download_thumbnails] Waiting for Wi-Fi connection...")
-            await asyncio.sleep(0.2)
-        if self.page_identifier() != page_identifier:
-            # stop downloading if the page has changed
+
+    # updates the cached page on screen with the list the server just returned, if it's any different
+    def apply_revalidated_page(self, result, sequences):
+        old_sequences = self.sequences
+        changed = len(sequences) != len(old_sequences)
+        if not changed:
+            for k in range(len(sequences)):
+                if not sequences[k].same_as(old_sequences[k]):
+                    changed = True
+                    break
+        if not changed:
+            print("Cached page is up to date")
+            result['sequences'] = old_sequences
+            self.loaded_page_result = result
+            if result.get('total_page_count', 0) > 0:
+                self.max_page_index = result['total_page_count']
             return
-        sequence = None
-        if self.sequences is not None and i < len(self.sequences):
-            sequence = self.sequences[i]
-        # result = await async_helpers.unblock(
-        #     download_thumbnails,
-        #     self.periodic_func,
-        #     self,
-        #     i,
-        #     sequence,
-        #     len(self.sequences),
-        #     page_identifier
-        # )
-        result = await download_thumbnails(self, i, sequence, len(self.sequences), page_identifier)
-        if USE_IMAGE_FALLBACK:
-            print("Got thumbnail result:", result is not None)
-        else:
-            print("Got thumbnail result:", result)
-        if self.page_identifier() != page_identifier:
-            # stop downloading if the page has changed
+        print("Cached page changed, updating it")
+        # thumbnails of sequences that are still on the page don't need downloading again
+        old_thumbnails = {}
+        for seq in old_sequences:
+            if seq.thumbnail_path is not None:
+                old_thumbnails[seq.id] = seq.thumbnail_path
+        for seq in sequences:
+            if seq.thumbnail_path is None and seq.id in old_thumbnails:
+                seq.thumbnail_path = old_thumbnails[seq.id]
+        self.cancel_thumbnail_downloads()
+        if self.selected_thumbnail >= len(sequences):
+            self.selected_thumbnail = 0
+            self.scroll_target_y = 0
+            self.render_start_index = 0
+        self.apply_sequences_page(result, sequences)
+
+    # Moves the page on screen to the page cache before another one is opened. Thumbnails are stored
+    # palette indexed, and their render caches dropped, the least recently used pages make room for it.
+    def cache_loaded_page(self):
+        identifier = self.loaded_page_identifier
+        result = self.loaded_page_result
+        sequences = self.sequences
+        self.loaded_page_identifier = None
+        self.loaded_page_result = None
+        if PAGE_CACHE_MAX_BYTES <= 0 or identifier is None or result is None or sequences is None or len(sequences) == 0:
+            return
+        # taken off screen first, its thumbnails can't be drawn once they're compacted below
+        self.sequences = []
+        self.is_loading_sequences_list = True
+        self.parent.memory.untrack_all("thumbnails")
+        result['sequences'] = None
+        page_bytes = len(json.dumps(result))
+        for seq in sequences:
+            if seq.thumbnail_base64 is not None:
+                self.evict_thumbnail(seq)
+            seq.thumbnail_render_cache = None
+            thumbnail = seq.thumbnail_path
+            if seq.thumbnail_inline:
+                # still base64 encoded, it's decoded again when drawn
+                pass
+            elif not USE_IMAGE_FALLBACK:
+                # thumbnail files are deleted when the next page is shown
+                seq.thumbnail_path = None
+            elif thumbnail is not None and seq.thumbnail_palette is None:
+                compact = compact_palette_frame(thumbnail)
+                if compact is not None:
+                    seq.thumbnail_path, seq.thumbnail_palette = compact
+            if seq.thumbnail_path is not None:
+                page_bytes += len(seq.thumbnail_path)
+            if seq.thumbnail_palette is not None:
+                page_bytes += len(seq.thumbnail_palette)
+            page_bytes += seq.packed_size()
+        if page_bytes > PAGE_CACHE_MAX_BYTES:
+            print(f"[page_cache] Page {identifier} is {page_bytes} bytes, too big to cache")
             return
-        if result is not None and 'thumb_path' in result and result['thumb_path'] is not None:
-            self.sequences[i]['thumbnail_path'] = result['thumb_path']
+        self.remove_cached_page(identifier)
+        while self.page_cache_bytes + page_bytes > PAGE_CACHE_MAX_BYTES:
+            oldest = None
+            for key in self.page_cache:
+                if oldest is None or self.page_cache[key]['used'] < self.page_cache[oldest]['used']:
+                    oldest = key
+            print(f"[page_cache] Evicting page {oldest}")
+            self.remove_cached_page(oldest)
+        self.page_cache_clock += 1
+        self.page_cache[identifier] = {
+            "result": result,
+            "sequences": sequences,
+            "bytes": page_bytes,
+            "used": self.page_cache_clock,
+        }
+        self.page_cache_bytes += page_bytes
+        self.parent.memory.track("page_cache", identifier, page_bytes)
+        print(f"[page_cache] Cached page {identifier}, {page_bytes} bytes ({self.page_cache_bytes}/{PAGE_CACHE_MAX_BYTES})")
+
+    def remove_cached_page(self, identifier):
+        page = self.page_cache.pop(identifier, None)
+        if page is not None:
+            self.page_cache_bytes -= page['bytes']
+            self.parent.memory.untrack("page_cache", identifier)
+        return page
+
+    # removes the page from the cache, with its thumbnails expanded back to rgb
+    def take_cached_page(self, identifier):
+        page = self.remove_cached_page(identifier)
+        if page is None:
+            return None
+        for seq in page['sequences']:
+            if seq.thumbnail_palette is not None:
+                seq.thumbnail_path = expand_palette_frame(seq.thumbnail_path, seq.thumbnail_palette)
+                seq.thumbnail_palette = None
+        return page
+
+    # Speculatively fetches the next page of the current sort mode, list and thumbnails, once the
+    # current page has finished loading, so pressing NEXT doesn't have to wait for the network.
+    # Only one page is buffered, and thumbnails stop being prefetched once PAGE_PREFETCH_BUDGET is used up.
+    def start_page_prefetch(self):
+        if not PREFETCH_NEXT_PAGE or self.current_page_index >= self.max_page_index:
+            return
+        sort_mode = self.sort_mode()
+        page_index = self.current_page_index + 1
+        prefetch = self.page_prefetch
+        if prefetch is not None and prefetch['sort_mode'] == sort_mode and prefetch['page_index'] == page_index:
+            return
+        self.cancel_page_prefetch()
+        self.page_prefetch = {
+            "sort_mode": sort_mode,
+            "page_index": page_index,
+            "result": None,
+            "sequences": None,
+            "bytes": 0,
+            "budget": PAGE_PREFETCH_BUDGET,
+            # set once a thumbnail didn't fit in the budget, no more are prefetched after that
+            "budget_reached": False,
+            "pending": [],
+            "cancelled": False,
+        }
+        asyncio.create_task(tracer.trace_task(self.run_page_prefetch(self.page_prefetch), "run_page_prefetch"))
+
+    def cancel_page_prefetch(self):
+        if self.page_prefetch is not None:
+            self.page_prefetch['cancelled'] = True
+            self.page_prefetch = None
+        self.parent.memory.untrack_all("page_prefetch")
+
+    def evict_page_prefetch(self, page_index):
+        if self.page_prefetch is not None and self.page_prefetch['page_index'] == page_index:
+            self.cancel_page_prefetch()
+
+    # True if the page being opened has been prefetched
+    def prefetched_page_ready(self):
+        prefetch = self.page_prefetch
+        if prefetch is None or prefetch['sequences'] is None:
+            return False
+        return prefetch['sort_mode'] == self.sort_mode() and prefetch['page_index'] == self.current_page_index
+
+    # switches to the prefetched page if it's the one being opened, returns False if there is none
+    def use_prefetched_page(self):
+        if not self.prefetched_page_ready():
+            return False
+        prefetch = self.page_prefetch
+        print(f"Using prefetched page {prefetch['page_index']} ({prefetch['bytes']} bytes)")
+        # stops its thumbnail downloads, the missing ones are downloaded as part of the current page
+        self.cancel_page_prefetch()
+        self.apply_sequences_page(prefetch['result'], prefetch['sequences'])
+        return True
+
+    async def run_page_prefetch(self, prefetch):
+        try:
+            while not self.app.wifi_manager.is_connected():
+                await asyncio.sleep(0.2)
+                if prefetch['cancelled']:
+                    return
+            print(f"[page_prefetch] Prefetching page {prefetch['page_index']} ({prefetch['sort_mode']})")
+            response = await self.request_sequences_page(prefetch['sort_mode'], prefetch['page_index'])
+            if prefetch['cancelled']:
+                return
+            if response.status_code != 200:
+                print(f"[page_prefetch] Failed to prefetch page, status code: {response.status_code}")
+                self.page_prefetch = None
+                return
+            prefetch['bytes'] = len(response.content)
+            if prefetch['bytes'] > prefetch['budget']:
+                print(f"[page_prefetch] Page list is {prefetch['bytes']} bytes, over the prefetch budget")
+                self.page_prefetch = None
+                return
+            result, sequences = parse_sequences_page(response.content)
+            # free the raw list before downloading thumbnails
+            response = None
+            # the list is kept apart from the sequences, so a partly prefetched page can still be applied
+            result['sequences'] = None
+            prefetch['result'] = result
+            prefetch['sequences'] = sequences
+            self.parent.memory.track("page_prefetch", prefetch['page_index'], prefetch['bytes'])
+            if not USE_IMAGE_FALLBACK:
+                # thumbnails are stored as files in the thumbs directory, which belongs to the current page
+                return
+            prefetch['pending'] = [i for i in range(len(sequences)) if sequences[i].thumbnail_path is None]
+            if BATCH_THUMBNAILS and self.thumbnail_bundles_supported and len(prefetch['pending']) > 0:
+                if not await download_thumbnail_bundle(self, prefetch):
+                    self.thumbnail_bundles_supported = False
+            while len(prefetch['pending']) > 0 and not prefetch['cancelled'] and not prefetch['budget_reached']:
+                sequence = sequences[prefetch['pending'].pop(0)]
+                thumbnail = await download_thumbnail(self, sequence, prefetch)
+                if thumbnail is None or prefetch['cancelled']:
+                    continue
+                if prefetch['bytes'] + len(thumbnail['thumb_path']) > prefetch['budget']:
+                    # left for the page to download once it's shown
+                    prefetch['budget_reached'] = True
+                else:
+                    sequence.thumbnail_path = thumbnail['thumb_path']
+                    prefetch['bytes'] += len(thumbnail['thumb_path'])
+            if not prefetch['cancelled']:
+                self.parent.memory.track("page_prefetch", prefetch['page_index'], prefetch['bytes'])
+            print(f"[page_prefetch] Prefetched page {prefetch['page_index']}, {prefetch['bytes']} bytes")
+        except Exception as e:
+            print(f"[page_prefetch] Error prefetching page: {e}")
+            if self.page_prefetch is prefetch and prefetch['sequences'] is None:
+                self.page_prefetch = None
+
+    # Downloads the thumbnails of the current page, as a single bundle if the server supports it,
+    # otherwise with up to THUMBNAIL_DOWNLOAD_CONCURRENCY requests in flight.
+    def start_thumbnail_downloads(self):
+        self.cancel_thumbnail_downloads()
+        batch = {
+            "sequences": self.sequences,
+            "pending": [i for i in range(len(self.sequences)) if self.sequences[i].thumbnail_path is None],
+            "workers": 0,
+            "cancelled": False,
+        }
+        self.thumbnail_batch = batch
+        if USE_IMAGE_FALLBACK and BATCH_THUMBNAILS and self.thumbnail_bundles_supported:
+            batch['workers'] += 1
+            asyncio.create_task(tracer.trace_task(self.run_thumbnail_bundle_download(batch), "run_thumbnail_bundle_download"))
+        else:
+            self.start_thumbnail_workers(batch)
+
+    # workers pick the next thumbnail when they become free, see next_thumbnail_index
+    def start_thumbnail_workers(self, batch):
+        for _ in range(min(THUMBNAIL_DOWNLOAD_CONCURRENCY, len(batch['pending']))):
+            batch['workers'] += 1
+            asyncio.create_task(tracer.trace_task(self.run_thumbnail_worker(batch), "run_thumbnail_worker"))
+
+    # stops every download of the current batch, the workers check the flag between requests
+    def cancel_thumbnail_downloads(self):
+        if self.thumbnail_batch is not None:
+            self.thumbnail_batch['cancelled'] = True
+            self.thumbnail_batch = None
+
+    # removes and returns the pending thumbnail to download next: visible ones first, closest to the selection first
+    def next_thumbnail_index(self, pending):
+        selected_row = self.selected_thumbnail // 3
+        selected_col = self.selected_thumbnail % 3
+        best = 0
+        best_key = None
+        for k in range(len(pending)):
+            i = pending[k]
+            visible = self.render_start_index <= i < self.render_start_index + self.visible_thumbnails
+            row_distance = abs(i // 3 - selected_row)
+            col_distance = abs(i % 3 - selected_col)
+            key = (0 if visible else 1, max(row_distance, col_distance), row_distance + col_distance)
+            if best_key is None or key < best_key:
+                best = k
+                best_key = key
+        return pending.pop(best)
+
+    def thumbnail_worker_done(self, batch):
+        batch['workers'] -= 1
+        if batch['workers'] == 0 and not batch['cancelled']:
+            self.track_thumbnails()
+            self.parent.memory.request_collect()
+            self.start_page_prefetch()
+
+    async def run_thumbnail_bundle_download(self, batch):
+        try:
+            while not self.app.wifi_manager.is_connected():
+                print("[download_thumbnails] Waiting for Wi-Fi connection...")
+                await asyncio.sleep(0.2)
+            if batch['cancelled']:
+                return
+            if not await download_thumbnail_bundle(self, batch):
+                self.thumbnail_bundles_supported = False
+        except Exception as e:
+            self.app.print_error(f"Error downloading thumbnail bundle: {e}")
+        finally:
+            # anything the bundle didn't deliver is fetched one by one
+            if not batch['cancelled'] and len(batch['pending']) > 0:
+                self.start_thumbnail_workers(batch)
+            self.thumbnail_worker_done(batch)
+
+    async def run_thumbnail_worker(self, batch):
+        try:
+            while not batch['cancelled'] and len(batch['pending']) > 0:
+                while not self.app.wifi_manager.is_connected():
+                    print("[download_thumbnails] Waiting for Wi-Fi connection...")
+                    await asyncio.sleep(0.2)
+                if batch['cancelled']:
+                    return
+                i = self.next_thumbnail_index(batch['pending'])
+                sequence = batch['sequences'][i]
+                result = await download_thumbnail(self, sequence, batch)
+                if USE_IMAGE_FALLBACK:
+                    print("Got thumbnail result:", result is not None)
+                else:
+                    print("Got thumbnail result:", result)
+                if batch['cancelled']:
+                    return
+                if result is not None and 'thumb_path' in result and result['thumb_path'] is not None:
+                    sequence.thumbnail_path = result['thumb_path']
+                    sequence.thumbnail_render_cache = None
+        finally:
+            self.thumbnail_worker_done(batch)
 
     async def periodic_func(self):
         pass
@@ -337,15 +930,29 @@ class ThumbnailBrowser(Utility):
         start_index = max(0, self.render_start_index - 6)
         end_index = min(self.render_start_index + self.visible_thumbnails + 6, len(self.sequences))
 
+        self.evict_offscreen_thumbnails(start_index, end_index)
+        if start_index != self.touched_start_index or end_index != self.touched_end_index:
+            # the decoded thumbnails in view are the most recently used, so the ones scrolled away are evicted first
+            self.touched_start_index = start_index
+            self.touched_end_index = end_index
+            for i in range(start_index, end_index):
+                if self.sequences[i].thumbnail_base64 is not None:
+                    self.parent.memory.touch("thumbnails", self.sequences[i].id)
+
         # draw visible thumbnails
         for i in range(start_index, end_index):
             seq = self.sequences[i]
             x, y = self.get_thumbnail_screen_coords(i)
-            if 'thumbnail_path' in seq:
+            thumbnail = seq.thumbnail_path
+            if seq.thumbnail_inline and seq.thumbnail_base64 is None:
+                thumbnail = self.decode_thumbnail(seq)
+            if thumbnail is not None:
                 if USE_IMAGE_FALLBACK:
-                    fallback_image_renderer(ctx, seq['thumbnail_path'], x, y, self.icon_size, self.icon_size)
+                    if seq.thumbnail_render_cache is None:
+                        seq.thumbnail_render_cache = build_image_render_cache(thumbnail)
+                    cached_image_renderer(ctx, seq.thumbnail_render_cache, x, y, self.icon_size, self.icon_size)
                 else:
-                    ctx.move_to(0, 0).image(seq['thumbnail_path'], x, y, self.icon_size - 5, self.icon_size - 5)
+                    ctx.move_to(0, 0).image(thumbnail, x, y, self.icon_size - 5, self.icon_size - 5)
             else:
                 # draw a small grey square if thumbnail is not loaded
                 ctx.rgb(0.5, 0.5, 0.5)
@@ -445,7 +1052,7 @@ class ThumbnailBrowser(Utility):
                     self.current_page_index = 1
                 # _thread.start_new_thread(self.fetch_sequences, ())
                 # self.fetch_sequences()
-                asyncio.create_task(self.fetch_sequences())
+                asyncio.create_task(tracer.trace_task(self.fetch_sequences(), "fetch_sequences"))
                 self.selected_thumbnail = 0
                 self.scroll_target_y = 0
                 self.render_start_index = 0
@@ -453,7 +1060,7 @@ class ThumbnailBrowser(Utility):
                 if self.current_page_index > 1:
                     self.current_page_index -= 1
                 # _thread.start_new_thread(self.fetch_sequences, ())
-                asyncio.create_task(self.fetch_sequences())
+                asyncio.create_task(tracer.trace_task(self.fetch_sequences(), "fetch_sequences"))
                 self.selected_thumbnail = 0
                 self.scroll_target_y = 0
                 self.render_start_index = 0
@@ -470,13 +1077,14 @@ class ThumbnailBrowser(Utility):
         if self.sort_mode_index == new_val:
             return
         self.sort_mode_index = new_val
+        self.cancel_page_prefetch()
         self.current_page_index = 1
         self.max_page_index = 1
         self.selected_thumbnail = 0
         self.scroll_target_y = 0
         self.render_start_index = 0
         # _thread.start_new_thread(self.fetch_sequences, ())
-        asyncio.create_task(self.fetch_sequences())
+        asyncio.create_task(tracer.trace_task(self.fetch_sequences(), "fetch_sequences"))
 
     def get_max_index(self):
         max_index = len(self.sequences)
@@ -491,14 +1099,29 @@ class ThumbnailBrowser(Utility):
     def navigate_left(self):
         self.selected_thumbnail = (self.selected_thumbnail - 1) % self.get_max_index()
         self.ensure_thumbnail_visible(self.selected_thumbnail)
+        self.selection_changed()
 
     def navigate_right(self):
         self.selected_thumbnail = (self.selected_thumbnail + 1) % self.get_max_index()
         self.ensure_thumbnail_visible(self.selected_thumbnail)
+        self.selection_changed()
 
     def navigate_down(self):
         self.selected_thumbnail = (self.selected_thumbnail + 3) % self.get_max_index()
         self.ensure_thumbnail_visible(self.selected_thumbnail)
+        self.selection_changed()
+
+    # restarts the dwell time, and abandons the speculative download of the previous selection
+    def selection_changed(self):
+        self.selection_dwell_ms = 0
+        self.parent.animation_player.cancel_speculative_download()
+
+    def update_speculative_prefetch(self, delta):
+        if self.selection_dwell_ms >= SPECULATIVE_DWELL_MS:
+            return
+        self.selection_dwell_ms += delta
+        if self.selection_dwell_ms >= SPECULATIVE_DWELL_MS and self.selected_thumbnail < len(self.sequences):
+            self.parent.animation_player.prefetch_animation(self.sequences[self.selected_thumbnail])
 
     def ensure_thumbnail_visible(self, previous_selected_thumbnail):
         while self.selected_thumbnail < self.render_start_index:
@@ -512,6 +1135,8 @@ class ThumbnailBrowser(Utility):
         for btn_manager in self.button_managers:
             btn_manager.update(delta)
         self.spinner_time += delta
+        if SPECULATIVE_FRAME_PREFETCH:
+            self.update_speculative_prefetch(delta)
         if self.scroll_current_y != self.scroll_target_y:
             self.scroll_current_y += (self.scroll_target_y - self.scroll_current_y) * 4.0 * (delta * 0.001)
             if abs(self.scroll_target_y - self.scroll_current_y) < 0.1:
@@ -520,7 +1145,7 @@ class ThumbnailBrowser(Utility):
     def handle_thumbnail_select(self):
         self.parent.state = PLAYING_ANIMATION_STATE
         # _thread.start_new_thread(self.parent.animation_player.download_animation, (self.sequences[self.selected_thumbnail],))
-        asyncio.create_task(self.parent.animation_player.download_animation(self.sequences[self.selected_thumbnail], 0))
+        asyncio.create_task(tracer.trace_task(self.parent.animation_player.download_animation(self.sequences[self.selected_thumbnail], 0), "download_animation"))
 
 
 class AnimationPlayer(Utility):
@@ -534,13 +1159,57 @@ class AnimationPlayer(Utility):
         self.total_to_download = 0
         self.glitch_effect = 0
         self.frame_time = self.parent.default_frame_time
+        # frame currently on screen, or -1 if the next draw has to repaint everything
+        self.drawn_frame = -1
+        # background download of the highlighted thumbnail's frames, see prefetch_animation
+        self.speculative_download = None
+        # created on first use, see get_animation_cache
+        self.animation_cache = None
+        # main colors of led_colors_frame of led_colors_sequence, decoded once per frame rather than on every LED update
+        self.led_colors_sequence = None
+        self.led_colors_frame = -1
+        self.led_colors = None
+        self.parent.memory.add_holder("frames", self.evict_sequence_frames)
         self.reset()
 
     def reset(self):
         self.frame_timer = 0
         self.current_frame = 0
+        self.invalidate()
+
+    def draws_incrementally(self):
+        return self.drawn_frame >= 0
+
+    def invalidate(self):
+        self.drawn_frame = -1
+
+    # Repaints only the pixels that changed since the frame on screen, when the animation advanced by
+    # exactly one frame. Returns False if a full repaint is needed instead.
+    def draw_changed_pixels(self, ctx):
+        if self.drawn_frame < 0 or self.current_sequence is None or self.current_sequence.frame_changes_render_cache is None:
+            return False
+        current_frame, frame_data = self.get_current_frame_or_last_downloaded()
+        if frame_data is None:
+            return False
+        if current_frame == self.drawn_frame:
+            return True
+        # wrapping around to the first frame always repaints everything
+        if current_frame != self.drawn_frame + 1:
+            return False
+        changes_render_cache = self.current_sequence.frame_changes_render_cache[current_frame]
+        if changes_render_cache is None:
+            return False
+        ctx.save()
+        ctx.image_smoothing = 0
+        cached_image_renderer(ctx, changes_render_cache, -display_x * 0.5, -display_y * 0.5, display_x, display_y, overlap=False)
+        ctx.restore()
+        self.drawn_frame = current_frame
+        return True
 
     def draw(self, ctx):
+        if self.draw_changed_pixels(ctx):
+            return
+        self.drawn_frame = -1
         clear_background(ctx, (0, 0, 0))
         ctx.save()
         ctx.image_smoothing = 0
@@ -551,12 +1220,14 @@ class AnimationPlayer(Utility):
         #     except Exception as e:
         #         print(f"Error updating frame leds: {e}")
         
-        if self.current_sequence and 'local_frames' in self.current_sequence:
+        if self.current_sequence and self.current_sequence.local_frames is not None:
             current_frame, frame_path = self.get_current_frame_or_last_downloaded()
             if frame_path is not None:
                 ctx.move_to(0, 0)
                 if USE_IMAGE_FALLBACK:
-                    fallback_image_renderer(ctx, frame_path, -display_x * 0.5, -display_y * 0.5, display_x, display_y, glitch_effect=self.glitch_effect)
+                    cached_image_renderer(ctx, self.get_frame_render_cache(current_frame, frame_path), -display_x * 0.5, -display_y * 0.5, display_x, display_y)
+                    if self.glitch_effect == 0 and self.downloaded_count >= self.total_to_download:
+                        self.drawn_frame = current_frame
                 else:
                     ctx.image(frame_path, -display_x * 0.5, -display_y * 0.5, display_x, display_y)
                 frame_drawn = True
@@ -593,18 +1264,18 @@ class AnimationPlayer(Utility):
         ctx.restore()
 
         # Start downloading next frame if we're not already downloading
-        if self.current_sequence and 'local_frames' in self.current_sequence and not self.downloading and self.downloaded_count < self.total_to_download:
+        if self.current_sequence and self.current_sequence.local_frames is not None and not self.downloading and self.downloaded_count < self.total_to_download:
             next_frame = 0
-            while next_frame < len(self.current_sequence['local_frames']) and self.current_sequence['local_frames'][next_frame] is not None:
+            while next_frame < len(self.current_sequence.local_frames) and self.current_sequence.local_frames[next_frame] is not None:
                 next_frame += 1
-            if next_frame < len(self.current_sequence['frames']):
-                asyncio.create_task(self.download_animation(self.current_sequence, next_frame))
+            if next_frame < self.current_sequence.frame_count():
+                asyncio.create_task(tracer.trace_task(self.download_animation(self.current_sequence, next_frame), "download_animation"))
 
     def update(self, delta):
         if self.current_sequence:
             self.frame_timer += delta
             if self.frame_timer >= self.frame_time:
-                self.current_frame = (self.current_frame + 1) % len(self.current_sequence['frames'])
+                self.current_frame = (self.current_frame + 1) % self.current_sequence.frame_count()
                 self.frame_timer = 0
             if self.leds_enabled:
                 try:
@@ -613,21 +1284,51 @@ class AnimationPlayer(Utility):
                     print(f"Error updating frame leds: {e}")
     
     def get_current_frame_or_last_downloaded(self):
-        if self.current_sequence and 'local_frames' in self.current_sequence:
-            current_frame = self.current_frame % len(self.current_sequence['local_frames'])
+        if self.current_sequence and self.current_sequence.local_frames is not None:
+            current_frame = self.current_frame % len(self.current_sequence.local_frames)
             frame_path = None
             while frame_path is None and current_frame >= 0:
-                frame_path = self.current_sequence['local_frames'][current_frame]
+                frame_path = self.current_sequence.local_frames[current_frame]
                 if frame_path is None:
                     current_frame -= 1
             return current_frame, frame_path
         return None
 
+    # render cache for the frame at the current glitch level, see build_image_render_cache
+    def get_frame_render_cache(self, frame_index, frame_data):
+        render_caches = self.current_sequence.frame_render_cache[frame_index]
+        if render_caches is None:
+            render_caches = [None, None, None]
+            self.current_sequence.frame_render_cache[frame_index] = render_caches
+        if render_caches[self.glitch_effect] is None:
+            palette = self.current_sequence.frame_palette
+            if palette is not None and self.glitch_effect:
+                # the glitch effect offsets into the rgb bytes, so palette frames need expanding first
+                frame_data = expand_palette_frame(frame_data, self.current_sequence.frame_palette_rgb)
+                palette = None
+            render_caches[self.glitch_effect] = build_image_render_cache(frame_data, self.glitch_effect, palette)
+        return render_caches[self.glitch_effect]
+
+    # glitch render caches are built lazily, only keep the ones for the glitch level being shown
+    def clear_glitch_render_caches(self):
+        if self.current_sequence is None or self.current_sequence.frame_render_cache is None:
+            return
+        for render_caches in self.current_sequence.frame_render_cache:
+            if render_caches is not None:
+                for level in range(1, len(render_caches)):
+                    if level != self.glitch_effect:
+                        render_caches[level] = None
+
     def update_f_leds(self):
-        if self.current_sequence and 'local_frames' in self.current_sequence:
+        if self.current_sequence and self.current_sequence.local_frames is not None:
             current_frame, frame_path = self.get_current_frame_or_last_downloaded()
-            if frame_path is not None and 'frame_main_colors' in self.current_sequence and self.current_sequence['frame_main_colors'] is not None:
-                colors = self.current_sequence['frame_main_colors'][current_frame]
+            if frame_path is not None:
+                sequence = self.current_sequence
+                if self.led_colors is None or sequence is not self.led_colors_sequence or current_frame != self.led_colors_frame:
+                    self.led_colors = sequence.frame_main_colors(current_frame)
+                    self.led_colors_sequence = sequence
+                    self.led_colors_frame = current_frame
+                colors = self.led_colors
                 if colors is not None and len(colors) > 0:
                     for i in range(12):
                         color = colors[i % len(colors)]
@@ -643,119 +1344,340 @@ class AnimationPlayer(Utility):
             self.parent.set_state(VIEW_METADATA_STATE)
         elif BUTTON_TYPES['UP'] in event.button:
             self.glitch_effect = (self.glitch_effect + 1) % 3
+            self.clear_glitch_render_caches()
+            self.invalidate()
         return True
 
+    def get_animation_cache(self):
+        if self.animation_cache is None:
+            self.animation_cache = LruFileCache(ANIMATION_CACHE_PATH, ANIMATION_CACHE_MAX_BYTES)
+        return self.animation_cache
+
+    def use_animation_cache(self):
+        return USE_IMAGE_FALLBACK and FASTLOAD_FRAMES and CACHE_ANIMATIONS
+
+    # fills in sequence fields that are missing, from the cached copy of the animation
+    def restore_cached_fields(self, sequence):
+        if not self.use_animation_cache():
+            return
+        meta = self.get_animation_cache().meta(sequence.id)
+        if meta is None:
+            return
+        sequence.restore_cached_fields(meta)
+
+    # decodes the animation from the cache, returns False if it isn't cached (or the cached copy is broken)
+    async def load_cached_animation(self, download):
+        sequence = download['sequence']
+        reader = self.get_animation_cache().open(sequence.id)
+        if reader is None:
+            return False
+        print(f"Loading {sequence.id} from the animation cache")
+        if not await self.stream_fastload_frames(reader, download):
+            return True
+        if download['error'] is not None:
+            print(f"Cached copy of {sequence.id} is broken, downloading it again")
+            self.get_animation_cache().remove(sequence.id)
+            self.reset_sequence_frames(sequence)
+            return False
+        return True
+
+    # drops the frames a failed fastload download or cache read got through before starting over
+    def reset_sequence_frames(self, sequence):
+        self.parent.memory.untrack("frames", sequence.id)
+        self.init_sequence_frames(sequence)
+        if sequence is self.current_sequence:
+            self.downloaded_count = 0
+            self.invalidate()
+
+    # frame storage of a sequence, filled in by the download
+    def init_sequence_frames(self, sequence):
+        frame_count = sequence.frame_count()
+        sequence.local_frames = [None] * frame_count
+        sequence.frame_render_cache = [None] * frame_count
+        sequence.frame_changes_render_cache = [None] * frame_count
+        sequence.frame_palette = None
+        sequence.frame_palette_rgb = None
+        sequence.frame_arena = None
+
+    # makes sequence the one being played, starting from whatever part of it has been downloaded already
+    def start_playback(self, sequence):
+        self.current_sequence = sequence
+        self.parent.memory.set_pinned("frames", sequence.id, True)
+        self.glitch_effect = 0
+        self.downloaded_count = 0
+        for frame_data in sequence.local_frames:
+            if frame_data is not None:
+                self.downloaded_count += 1
+        self.total_to_download = sequence.frame_count()
+        if sequence.frame_time_ms > 0:
+            self.frame_time = sequence.frame_time_ms
+            print("Loaded frame time from sequence:", self.frame_time)
+        else:
+            self.frame_time = self.parent.default_frame_time
+        self.invalidate()
+
+    # a speculative download keeps going until it's cancelled, the player's own download only while its sequence is playing
+    def download_wanted(self, download):
+        if download['speculative']:
+            return not download['cancelled']
+        return self.downloading and self.current_sequence is not None and self.current_sequence.id == download['sequence'].id
+
+    # Starts downloading the frames of a sequence that is likely to be opened next, without touching
+    # the animation that is playing. download_animation picks it up if the sequence does get opened.
+    def prefetch_animation(self, sequence):
+        if not (USE_IMAGE_FALLBACK and FASTLOAD_FRAMES):
+            return
+        if self.current_sequence is not None and self.current_sequence.id == sequence.id:
+            return
+        if self.speculative_download is not None and self.speculative_download['sequence'] is sequence:
+            return
+        self.cancel_speculative_download()
+        print(f"Speculatively downloading {sequence.id}")
+        self.speculative_download = self.new_download(sequence, True)
+        self.restore_cached_fields(sequence)
+        self.init_sequence_frames(sequence)
+        asyncio.create_task(tracer.trace_task(self.run_download(self.speculative_download, 0), "run_download"))
+
+    def cancel_speculative_download(self):
+        download = self.speculative_download
+        if download is None:
+            return
+        self.speculative_download = None
+        download['cancelled'] = True
+        print(f"Abandoned speculative download of {download['sequence'].id}")
+        if download['sequence'] is not self.current_sequence:
+            self.release_sequence_frames(download['sequence'])
+
+    def new_download(self, sequence, speculative):
+        return {
+            "sequence": sequence,
+            "speculative": speculative,
+            "cancelled": False,
+            "done": False,
+            # what went wrong decoding the fastload blob, if anything
+            "error": None,
+        }
+
     async def download_animation(self, sequence, frame):
         if USE_IMAGE_FALLBACK and FASTLOAD_FRAMES and frame != 0:
             return
+        speculative_download = self.speculative_download
+        if speculative_download is not None and speculative_download['sequence'] is sequence:
+            # already downloading (or downloaded) in the background, take it over
+            print(f"Using speculative download of {sequence.id}")
+            self.speculative_download = None
+            speculative_download['speculative'] = False
+            self.downloading = not speculative_download['done']
+            self.start_playback(sequence)
+            return
+        self.cancel_speculative_download()
         self.current_sequence = sequence
-        self.glitch_effect = 0
         self.downloading = True
-        sequence_id = sequence.get("id")
         if frame == 0:
-            self.downloaded_count = 0
-            self.total_to_download = len(self.current_sequence['frames'])
-            if 'frame_time_ms' in self.current_sequence and self.current_sequence['frame_time_ms'] > 0:
-                self.frame_time = self.current_sequence['frame_time_ms']
-                print("Loaded frame time from sequence:", self.frame_time)
-            else:
-                self.frame_time = self.parent.default_frame_time
-            self.current_sequence['local_frames'] = [None] * len(self.current_sequence['frames'])
+            self.restore_cached_fields(sequence)
+            self.init_sequence_frames(sequence)
+            self.start_playback(sequence)
         await asyncio.sleep(0.2)
-        if self.current_sequence is None or self.current_sequence.get("id") != sequence_id:
-            self.downloading = False
+        await self.run_download(self.new_download(sequence, False), frame)
+
+    async def run_download(self, download, frame):
+        sequence = download['sequence']
+        sequence_id = sequence.id
+        if not self.download_wanted(download):
+            self.finish_download(download)
             return
-        # for i, frame_id in enumerate(self.current_sequence['frames']):
-        i = frame
-        frame_id = self.current_sequence['frames'][frame]
-        if not self.downloading or self.current_sequence is None:
-            self.downloading = False
+        if frame == 0 and self.use_animation_cache() and await self.load_cached_animation(download):
+            self.finish_download(download)
             return
-        print(f"Downloading frame {i} for {self.current_sequence['id']}")
-        frame_url = f"{api_base_url}/images/{self.current_sequence['id']}/{frame_id}"
+        # for i in range(sequence.frame_count()):
+        i = frame
+        frame_id = sequence.frame_id(frame)
+        print(f"Downloading frame {i} for {sequence_id}")
+        frame_url = f"{api_base_url}/images/{sequence_id}/{frame_id}"
         if USE_IMAGE_FALLBACK:
             frame_url += "?fallback=true"
             if FASTLOAD_FRAMES:
                 frame_url += "&fastload=true"
+                if FASTLOAD_PALETTE:
+                    frame_url += "&palette=true"
+                    if FASTLOAD_DELTA:
+                        frame_url += "&delta=true"
         
         max_retries = 30
         retries = 0
 
         while retries < max_retries:
             if retries > 0:
-                print(f"Download of frame {i} for {self.current_sequence['id']} failed, retrying... (retry {retries}/{max_retries})")
+                print(f"Download of frame {i} for {sequence_id} failed, retrying... (retry {retries}/{max_retries})")
                 await asyncio.sleep(1)
             retries += 1
             while not self.app.wifi_manager.is_connected():
                 print("[download_animation] Waiting for Wi-Fi connection...")
                 await asyncio.sleep(0.2)
-            if self.current_sequence is None or self.current_sequence.get("id") != sequence_id:
-                self.downloading = False
+            if not self.download_wanted(download):
+                self.finish_download(download)
                 return
             try:
-                frame_response = requests.get(frame_url, headers=self.parent.get_auth_headers())
-                if not self.downloading or self.current_sequence is None or 'local_frames' not in self.current_sequence or self.current_sequence['local_frames'] is None:
-                    self.downloading = False
-                    return
-                if self.current_sequence is None or self.current_sequence.get("id") != sequence_id:
-                    self.downloading = False
+                # fastload frames are streamed, see stream_fastload_frames
+                frame_response = await self.parent.http.get(frame_url, headers=self.parent.get_auth_headers(), stream=USE_IMAGE_FALLBACK and FASTLOAD_FRAMES)
+                if not self.download_wanted(download) or sequence.local_frames is None:
+                    frame_response.close()
+                    self.finish_download(download)
                     return
                 if frame_response.status_code == 200:
-                    print(f"Downloaded frame {i} for {self.current_sequence['id']}")
+                    print(f"Downloaded frame {i} for {sequence_id}")
                     if USE_IMAGE_FALLBACK:
                         if not FASTLOAD_FRAMES:
                             try:
-                                self.current_sequence['local_frames'][i] = frame_response.content
+                                sequence.local_frames[i] = frame_response.content
+                                sequence.frame_render_cache[i] = [build_image_render_cache(frame_response.content), None, None]
+                                self.track_sequence_frames(sequence)
                             except Exception as e:
                                 print(f"Error parsing fallback frame response: {e}")
                         else:
-                            # all frames will be returned in a single response. We need to split the data based on the width and height of each frame
-                            full_data = frame_response.content
-                            width = full_data[0]
-                            height = full_data[1]
-                            frame_length = 2 + width * height * 3
-                            if len(full_data) != frame_length * len(self.current_sequence['local_frames']):
-                                print(f"Error: frame data length mismatch: {len(full_data)} != {frame_length * len(self.current_sequence['local_frames'])} width: {width} height: {height} num frames: {len(self.current_sequence['local_frames'])}")
-                            loaded_frame_count = min(len(full_data) // frame_length, len(self.current_sequence['local_frames']))
-                            for j in range(loaded_frame_count):
-                                frame_data = full_data[j * frame_length:(j + 1) * frame_length]
-                                self.current_sequence['local_frames'][j] = frame_data
-                            self.downloaded_count = loaded_frame_count
+                            # all frames will be returned in a single response, they're split up as they arrive
+                            cache_writer = None
+                            if self.use_animation_cache():
+                                cache_writer = self.get_animation_cache().begin_write(sequence_id)
+                            if not await self.stream_fastload_frames(frame_response, download, cache_writer):
+                                self.finish_download(download)
+                                return
+                            if download['error'] is not None:
+                                # the whole blob is requested again, drop the frames of this attempt
+                                self.reset_sequence_frames(sequence)
+                                continue
                     else:
-                        frame_path = get_image_path(f"tmp/{self.current_sequence['id']}-{i}.jpg")
+                        frame_path = get_image_path(f"tmp/{sequence_id}-{i}.jpg")
                         with open(frame_path, "wb") as f:
                             f.write(frame_response.content)
-                        print(f"Saved frame {i} for {self.current_sequence['id']} to {frame_path}")
-                        self.current_sequence['local_frames'][i] = frame_path
+                        print(f"Saved frame {i} for {sequence_id} to {frame_path}")
+                        sequence.local_frames[i] = frame_path
                     if not FASTLOAD_FRAMES:
                         self.downloaded_count += 1
                     break
                 else:
-                    print(f"Failed to download frame {i} for {self.current_sequence['id']}")
+                    frame_response.close()
+                    print(f"Failed to download frame {i} for {sequence_id}")
             except Exception as e:
-                print(f"Error downloading frame {i} for {self.current_sequence['id']}: {e}")
+                print(f"Error downloading frame {i} for {sequence_id}: {e}")
             await asyncio.sleep(0.1)
         
-        self.downloading = False
-        if i == len(self.current_sequence['frames']) - 1:
-            print("[download_animation] running gc.collect()")
-            gc.collect()
+        self.finish_download(download)
+        if i == sequence.frame_count() - 1:
+            self.parent.memory.request_collect()
+
+    def finish_download(self, download):
+        download['done'] = True
+        # a speculative download that got taken over is the player's download now
+        if not download['speculative']:
+            self.downloading = False
+
+    # Reads the fastload blob in chunks, from a response or the animation cache, publishing each frame to
+    # local_frames as soon as it's complete, so playback can start while the rest is downloading.
+    # With a cache_writer, the blob is stored in the cache once it has been decoded successfully.
+    # Returns False if the download isn't wanted anymore, decoding errors are left in download['error'].
+    async def stream_fastload_frames(self, frame_response, download, cache_writer=None):
+        sequence = download['sequence']
+        download['error'] = None
+        decoder = FastloadDecoder(len(sequence.local_frames))
+        try:
+            while not decoder.done():
+                chunk = await frame_response.read(FASTLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                if cache_writer is not None:
+                    cache_writer.write(chunk)
+                frames = decoder.feed(chunk)
+                if not self.download_wanted(download):
+                    return False
+                if len(frames) > 0:
+                    self.add_decoded_frames(sequence, decoder, frames)
+                # let the animation draw while the rest of the frames are downloading
+                await asyncio.sleep(0)
+        except Exception as e:
+            download['error'] = f"{e}"
+        finally:
+            frame_response.close()
+            if cache_writer is not None:
+                if download['error'] is None and decoder.error() is None:
+                    # stored with the blob, so it can be played without the sequence list
+                    cache_writer.commit(sequence.cached_fields())
+                else:
+                    cache_writer.abort()
+        if download['error'] is None:
+            download['error'] = decoder.error()
+        if download['error'] is not None:
+            print(f"Error: {download['error']}")
+        return True
+
+    # frames are the latest frames returned by decoder.feed(), views into the decoder's frame arena
+    def add_decoded_frames(self, sequence, decoder, frames):
+        if sequence.frame_arena is None:
+            sequence.frame_arena = decoder.arena
+            self.track_sequence_frames(sequence)
+        if decoder.palette_rgb is not None and sequence.frame_palette is None:
+            sequence.frame_palette_rgb = decoder.palette_rgb
+            sequence.frame_palette = palette_colors(decoder.palette_rgb)
+        palette = sequence.frame_palette
+        local_frames = sequence.local_frames
+        first_frame = decoder.frames_decoded - len(frames)
+        for k in range(len(frames)):
+            j = first_frame + k
+            sequence.frame_render_cache[j] = [build_image_render_cache(frames[k], palette=palette), None, None]
+            if j > 0 and local_frames[j - 1] is not None:
+                sequence.frame_changes_render_cache[j] = build_image_render_cache(frames[k], palette=palette, previous=local_frames[j - 1])
+            local_frames[j] = frames[k]
+        if sequence is self.current_sequence:
+            self.downloaded_count = max(self.downloaded_count, decoder.frames_decoded)
+
+    # counts the downloaded frames of a sequence towards the memory budget, they can only be evicted if they aren't playing
+    def track_sequence_frames(self, sequence):
+        size = 0
+        if sequence.frame_arena is not None:
+            size = len(sequence.frame_arena)
+        elif sequence.local_frames is not None:
+            for frame_data in sequence.local_frames:
+                if frame_data is not None and not isinstance(frame_data, str):
+                    size += len(frame_data)
+        self.parent.memory.track("frames", sequence.id, size, pinned=sequence is self.current_sequence)
+
+    # only speculatively downloaded frames can be evicted
+    def evict_sequence_frames(self, sequence_id):
+        download = self.speculative_download
+        if download is not None and download['sequence'].id == sequence_id:
+            self.cancel_speculative_download()
+
+    # drops the downloaded frames of a fallback sequence
+    def release_sequence_frames(self, sequence):
+        self.parent.memory.untrack("frames", sequence.id)
+        # delete sequence.local_frames as it contains the image data
+        # set each element to None
+        if sequence.local_frames is not None:
+            for i in range(len(sequence.local_frames)):
+                sequence.local_frames[i] = None
+        if sequence.frame_render_cache is not None:
+            sequence.frame_render_cache = None
+        sequence.frame_changes_render_cache = None
+        sequence.frame_palette = None
+        sequence.frame_palette_rgb = None
+        # fastload frames are all views into this one allocation
+        sequence.frame_arena = None
 
     def cleanup(self):
         if self.current_sequence:
             if USE_IMAGE_FALLBACK:
-                # delete self.current_sequence['local_frames'] as it contains the image data
-                # set each element to None
-                if self.current_sequence is not None and 'local_frames' in self.current_sequence and self.current_sequence['local_frames'] is not None:
-                    for i in range(len(self.current_sequence['local_frames'])):
-                        self.current_sequence['local_frames'][i] = None
+                self.release_sequence_frames(self.current_sequence)
             else:
-                for frame_path in self.current_sequence['local_frames']:
+                for frame_path in self.current_sequence.local_frames:
                     if frame_path is not None:
                         os.remove(frame_path)
             self.current_sequence = None
-            print("[AnimationPlayer.cleanup] running gc.collect()")
-            gc.collect()
+            self.led_colors_sequence = None
+            self.led_colors = None
+            self.invalidate()
+            if self.animation_cache is not None:
+                self.animation_cache.flush()
+            self.parent.memory.request_collect()
 
     def on_start(self):
         self.reset()
@@ -776,7 +1698,7 @@ class AnimationMetadataViewer(Utility):
 
     def set_sequence(self, sequence):
         self.sequence = sequence
-        self.is_favorited = sequence.get('favorited_by_current_user', False) or self.check_is_local_favorite(sequence['id'])
+        self.is_favorited = sequence.favorited_by_current_user or self.check_is_local_favorite(sequence.id)
 
     def draw(self, ctx):
         ctx.save()
@@ -785,9 +1707,9 @@ class AnimationMetadataViewer(Utility):
         ctx.text_align = ctx.CENTER
         ctx.text_baseline = ctx.MIDDLE
         ctx.move_to(0, -70).text(f"Uploaded by:")
-        ctx.move_to(0, -45).text(f"@{self.sequence.get('username')}")
+        ctx.move_to(0, -45).text(f"@{self.sequence.username}")
         ctx.move_to(0, -20).text(f"Title:")
-        ctx.move_to(0, 5).text(f"{self.sequence.get('title')}")
+        ctx.move_to(0, 5).text(f"{self.sequence.title}")
         heart_x, heart_y = 0, 60
         ctx.move_to(heart_x, heart_y)
         # check if user logged in
@@ -807,11 +1729,11 @@ class AnimationMetadataViewer(Utility):
         elif BUTTON_TYPES['CONFIRM'] in event.button:
             if self.parent.logged_in():
                 # _thread.start_new_thread(self.favorite_animation, ())
-                asyncio.create_task(self.favorite_animation())
+                asyncio.create_task(tracer.trace_task(self.favorite_animation(), "favorite_animation"))
         return True
 
     async def favorite_animation(self):
-        current_sequence_id = self.sequence['id']
+        current_sequence_id = self.sequence.id
         self.is_favorited = not self.is_favorited
         is_favorited = self.is_favorited
         print(f"Setting favorite state for {current_sequence_id} to {is_favorited}")
@@ -829,12 +1751,12 @@ class AnimationMetadataViewer(Utility):
                     print("[favorite_animation] Waiting for Wi-Fi connection...")
                     await asyncio.sleep(0.2)
                 if is_favorited:
-                    response = requests.post(f"{api_base_url}/api/sequence/{current_sequence_id}/mark_favorite", headers=self.parent.get_auth_headers())
+                    response = await self.parent.http.post(f"{api_base_url}/api/sequence/{current_sequence_id}/mark_favorite", headers=self.parent.get_auth_headers())
                 else:
-                    response = requests.post(f"{api_base_url}/api/sequence/{current_sequence_id}/remove_favorite", headers=self.parent.get_auth_headers())
+                    response = await self.parent.http.post(f"{api_base_url}/api/sequence/{current_sequence_id}/remove_favorite", headers=self.parent.get_auth_headers())
                 if response.status_code == 200:
                     print("Successfully updated animation favorite state")
-                    self.sequence['favorited_by_current_user'] = is_favorited
+                    self.sequence.favorited_by_current_user = is_favorited
                     return
                 else:
                     print(f"Failed to favorite animation, status code: {response.status_code}")
@@ -888,7 +1810,7 @@ class LoginUtility(Utility):
         if not self.parent.logged_in():
             # _thread.start_new_thread(self.fetch_login_code, ())
             # self.fetch_login_code()
-            self.fetch_task = asyncio.create_task(self.fetch_login_code())
+            self.fetch_task = asyncio.create_task(tracer.trace_task(self.fetch_login_code(), "fetch_login_code"))
 
     def update_button_labels(self):
         if self.parent.logged_in():
@@ -919,7 +1841,7 @@ class LoginUtility(Utility):
                 print("[fetch_login_code] Waiting for Wi-Fi connection...")
                 await asyncio.sleep(0.2)
             try:
-                response = requests.post(api_base_url + '/api/get_login_code', json={"badge_uuid": self.parent.badge_uuid}, headers=self.parent.get_auth_headers())
+                response = await self.parent.http.post(api_base_url + '/api/get_login_code', json={"badge_uuid": self.parent.badge_uuid}, headers=self.parent.get_auth_headers())
                 if response.status_code == 200:
                     data = response.json()
                     self.login_code = data.get('code')
@@ -928,7 +1850,7 @@ class LoginUtility(Utility):
                         self.parent.save_auth_info(badge_uuid=self.parent.badge_uuid)
                     print(f"Received login code: {self.login_code} and badge uuid: {self.parent.badge_uuid}")
                     # self.polling_task = _thread.start_new_thread(self.poll_for_auth, ())
-                    self.polling_task = asyncio.create_task(self.run_poll_for_auth())
+                    self.polling_task = asyncio.create_task(tracer.trace_task(self.run_poll_for_auth(), "run_poll_for_auth"))
                     return
                 else:
                     print(f"Failed to fetch login code, status code: {response.status_code}")
@@ -950,12 +1872,12 @@ class LoginUtility(Utility):
                 return
             if self.polling_task is None:
                 return
-            self.check_for_auth()
+            await self.check_for_auth()
 
-    def check_for_auth(self):
+    async def check_for_auth(self):
         try:
             print("Checking for auth token...")
-            response = requests.post(api_base_url + '/api/check_login_code', json={"code": self.login_code}, headers=self.parent.get_auth_headers())
+            response = await self.parent.http.post(api_base_url + '/api/check_login_code', json={"code": self.login_code}, headers=self.parent.get_auth_headers())
             if response.status_code == 200:
                 data = response.json()
                 self.parent.auth_token = data.get('auth_token')
@@ -1011,7 +1933,7 @@ class LoginUtility(Utility):
                 auth_token = self.parent.auth_token
                 # _thread.start_new_thread(self.logout_user, (auth_token,))
                 # self.logout_user(auth_token)
-                asyncio.create_task(self.logout_user(auth_token))
+                asyncio.create_task(tracer.trace_task(self.logout_user(auth_token), "logout_user"))
                 self.parent.auth_token = None
                 self.parent.save_auth_info(auth_token="")
                 self.parent.set_state(DISPLAY_THUMBNAILS_STATE)
@@ -1024,7 +1946,7 @@ class LoginUtility(Utility):
             while not self.app.wifi_manager.is_connected():
                 print("[logout_user] Waiting for Wi-Fi connection...")
                 await asyncio.sleep(0.2)
-            response = requests.post(api_base_url + '/api/logout_badge', json={"auth_token": auth_token}, headers=self.parent.get_auth_headers())
+            response = await self.parent.http.post(api_base_url + '/api/logout_badge', json={"auth_token": auth_token}, headers=self.parent.get_auth_headers())
             if response.status_code == 200:
                 print("Successfully logged out user")
             else:
@@ -1079,6 +2001,8 @@ class AnimationApp(Utility):
         self.state = DISPLAY_THUMBNAILS_STATE
         self.current_frame = 0
         self.default_frame_time = 200
+        # shared by every utility, see MEMORY_BUDGET_BYTES
+        self.memory = MemoryManager(MEMORY_BUDGET_BYTES)
         self.thumbnail_browser = ThumbnailBrowser(app, self)
         self.animation_player = AnimationPlayer(app, self)
         self.metadata_viewer = AnimationMetadataViewer(app, self)
@@ -1094,6 +2018,12 @@ class AnimationApp(Utility):
 
         self.auth_token = None
         self.badge_uuid = None
+        # shared by every utility, so requests to api_base_url reuse the same connection,
+        # keeps enough idle connections around for all parallel thumbnail downloads
+        validator_cache = None
+        if REVALIDATE_REQUESTS:
+            validator_cache = LruFileCache(HTTP_CACHE_PATH, HTTP_CACHE_MAX_BYTES)
+        self.http = async_http.HttpSession(pool_size=THUMBNAIL_DOWNLOAD_CONCURRENCY, log_timings=LOG_HTTP_TIMINGS, validator_cache=validator_cache)
 
     def on_start(self):
         self.load_auth_info()
@@ -1109,6 +2039,13 @@ class AnimationApp(Utility):
         self.states[self.state].on_start()
     
     def on_exit(self):
+        self.animation_player.cancel_speculative_download()
+        if self.animation_player.animation_cache is not None:
+            self.animation_player.animation_cache.flush()
+        if self.http.validator_cache is not None:
+            self.http.validator_cache.flush()
+            print(f"[http] {self.http.stats['not_modified']}/{self.http.stats['conditional_requests']} revalidated requests served from cache, {self.http.stats['bytes_saved']} bytes saved")
+        self.http.close()
         self.delete_all_files(get_image_path("thumbs"))
         self.delete_all_files(get_image_path("tmp"))
 
@@ -1193,12 +2130,28 @@ class AnimationApp(Utility):
             headers["badge_uuid"] = self.badge_uuid
         return headers
 
+    def draws_incrementally(self):
+        return self.states[self.state].draws_incrementally()
+
+    def invalidate(self):
+        self.states[self.state].invalidate()
+
     def draw(self, ctx):
-        clear_background(ctx)
+        if not self.draws_incrementally():
+            clear_background(ctx)
         self.states[self.state].draw(ctx)
 
     def update(self, delta):
         self.states[self.state].update(delta)
+        self.memory.update(self.ms_until_next_frame())
+
+    # how long until the screen has to change again, None if nothing is animating
+    def ms_until_next_frame(self):
+        if self.state == PLAYING_ANIMATION_STATE and self.animation_player.current_sequence is not None:
+            return max(0, self.animation_player.frame_time - self.animation_player.frame_timer)
+        if self.state == DISPLAY_THUMBNAILS_STATE and self.thumbnail_browser.scroll_current_y != self.thumbnail_browser.scroll_target_y:
+            return 0
+        return None
 
     def handle_buttondown(self, event: ButtonDownEvent):
         if BUTTON_TYPES['CANCEL'] in event.button:
@@ -11,6 +11,16 @@ import wifi
 import time
 
 BLUETOOTH_ENABLED = False
+# hold LEFT and RIGHT this long to show or hide the heap overlay, hiding it writes HEAP_DUMP_FILE
+HEAP_OVERLAY_CHORD_MS = 1000
+HEAP_DUMP_FILE = "heap_dump.json"
+# hold UP and LEFT this long to show or hide the frame time overlay, hiding it prints the timings of every utility
+PROFILER_OVERLAY_CHORD_MS = 1000
+# records frame calls, task steps and HTTP requests, see lj_utils/tracer.py. Holding UP and RIGHT for
+# TRACE_FLUSH_CHORD_MS writes them to TRACE_FILE, which is also written when the app loses focus
+TRACE_ENABLED = False
+TRACE_FLUSH_CHORD_MS = 1000
+TRACE_FILE = "trace.json"
 
 APP_VERSION = "1.0.1"
 APP_VERSION_IOTA = 2
@@ -37,6 +47,9 @@ from .lj_utils.lj_notification import Notification
 from .lj_utils.wifi_utils import check_wifi, WiFiManager
 from .lj_utils.file_utils import file_exists, folder_exists
 from .lj_utils.color import hsv_to_rgb
+from .lj_utils.heap_monitor import HeapMonitor
+from .lj_utils.profiler import FrameProfiler
+from .lj_utils import tracer
 
 from .animation_viewer import AnimationApp, api_base_url, APP_BASE_PATH, DATA_BASE_PATH, PLAYING_ANIMATION_STATE
 from .basic_utils import Torch, Rainbow, Strobe, Spiral, CreditsScreen, UserUploadedDisclaimerScreen, WaitingForWifiScreen
@@ -120,7 +133,16 @@ class UtilityMenuApp(ImprovedAppBase):
             print(f"Error creating /data/pixelbadge directory: {e}")
         
         self.current_menu = "main"
+        if TRACE_ENABLED:
+            tracer.enable()
+        self.heap_monitor = HeapMonitor(DATA_BASE_PATH + HEAP_DUMP_FILE)
+        self.heap_overlay_visible = False
+        self.profiler = FrameProfiler()
+        self.profiler_overlay_visible = False
+        # chord name -> True while its buttons are held, so it only toggles once per press
+        self.held_chords = {}
         self.animation_app = AnimationApp(self)
+        self.animation_app.memory.on_collect = self.heap_monitor.record_collection
         self.animation_app_state = "Pixel Art"
         self.utilities = {
             self.animation_app_state: self.animation_app,
@@ -157,6 +179,7 @@ class UtilityMenuApp(ImprovedAppBase):
             text_color=(1, 1, 1),
         )
         self.notifications = []
+        self.overlays_drawn = False
 
         # Initialize the WiFiManager
         self.wifi_manager = WiFiManager(
@@ -190,18 +213,46 @@ class UtilityMenuApp(ImprovedAppBase):
             self.set_screen("main")
 
     def draw(self, ctx):
-        clear_background(ctx)
-        self.utilities[self.current_menu].draw(ctx)
+        utility = self.utilities[self.current_menu]
+        # anything drawn on top of the utility means it can't just repaint what changed,
+        # including on the frame after the overlay goes away
+        overlays_visible = self.button_labels.visible or len(self.notifications) > 0 or self.heap_overlay_visible or self.profiler_overlay_visible
+        if overlays_visible or self.overlays_drawn or not utility.draws_incrementally():
+            clear_background(ctx)
+            utility.invalidate()
+        self.overlays_drawn = overlays_visible
+        utility_name = self.active_utility_name()
+        start = self.profiler.start()
+        utility.draw(ctx)
+        self.profiler.stop(utility_name, "draw", start)
+        tracer.end_span("draw", utility_name, start)
+        self.profiler.end_frame(utility_name)
         self.button_labels.draw(ctx)
         for notification in self.notifications:
             notification.draw(ctx)
+        if self.heap_overlay_visible:
+            self.heap_monitor.draw_overlay(ctx)
+        if self.profiler_overlay_visible:
+            self.profiler.draw_overlay(ctx, utility_name)
+
+    # name of the Utility allocations are attributed to, the AnimationApp one is whichever of its states is shown
+    def active_utility_name(self):
+        utility = self.utilities[self.current_menu]
+        if utility is self.animation_app:
+            utility = self.animation_app.states[self.animation_app.state]
+        return type(utility).__name__
 
     def update(self, delta):
         super().update(delta)
+        self.heap_monitor.sample(self.active_utility_name())
         if delta > 5000:
             print("Delta too high, skipping update. Delta:", delta)
             return
+        utility_name = self.active_utility_name()
+        start = self.profiler.start()
         self.utilities[self.current_menu].update(delta)
+        self.profiler.stop(utility_name, "update", start)
+        tracer.end_span("update", utility_name, start)
         self.update_leds()
         self.button_labels.update(delta)
         # don't update notifications for very high delta as they won't animate properly
@@ -220,8 +271,33 @@ class UtilityMenuApp(ImprovedAppBase):
         if self.button_hold_duration(BUTTON_TYPES["UP"]) > 2000 and self.button_hold_duration(BUTTON_TYPES["DOWN"]) > 2000:
             self.set_screen("credits")
 
+        # only one of the debug overlays is shown at a time
+        if self.chord_triggered("heap_overlay", "LEFT", "RIGHT", HEAP_OVERLAY_CHORD_MS):
+            self.heap_overlay_visible = not self.heap_overlay_visible
+            self.profiler_overlay_visible = False
+            if not self.heap_overlay_visible:
+                self.heap_monitor.dump("overlay closed")
+        if self.chord_triggered("profiler_overlay", "UP", "LEFT", PROFILER_OVERLAY_CHORD_MS):
+            self.profiler_overlay_visible = not self.profiler_overlay_visible
+            self.heap_overlay_visible = False
+            if not self.profiler_overlay_visible:
+                self.profiler.print_stats()
+        if self.chord_triggered("trace_flush", "UP", "RIGHT", TRACE_FLUSH_CHORD_MS):
+            tracer.flush(DATA_BASE_PATH + TRACE_FILE)
+
+    # True on the first update both buttons have been held for longer than hold_ms
+    def chord_triggered(self, name, first_button, second_button, hold_ms):
+        held = self.button_hold_duration(BUTTON_TYPES[first_button]) > hold_ms and self.button_hold_duration(BUTTON_TYPES[second_button]) > hold_ms
+        triggered = held and not self.held_chords.get(name, False)
+        self.held_chords[name] = held
+        return triggered
+
     def update_leds(self):
+        utility_name = self.active_utility_name()
+        start = self.profiler.start()
         self.utilities[self.current_menu].update_leds()
+        self.profiler.stop(utility_name, "update_leds", start)
+        tracer.end_span("update_leds", utility_name, start)
     
     def handle_buttondown(self, event: ButtonDownEvent):
         handled_cancel_button = self.utilities[self.current_menu].handle_buttondown(event)
@@ -242,6 +318,7 @@ class UtilityMenuApp(ImprovedAppBase):
         super().on_app_unfocused()
         eventbus.emit(PatternEnable())
         self.utilities[self.current_menu].on_exit()
+        tracer.flush(DATA_BASE_PATH + TRACE_FILE)
 
     def on_first_wifi_connect(self, is_first_connection):
         if is_first_connection:
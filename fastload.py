@@ -0,0 +1,349 @@
+# Decoding for the fastload frame blobs returned by /images/{id}/{frame}?fallback=true&fastload=true
+#
+# Raw format (the default):
+#   every frame is [width, height, r, g, b, r, g, b, ...]
+#
+# Palette format (requested with &palette=true, servers that don't support it send the raw format):
+#   [0, bits_per_index, palette_size, palette rgb...] followed by [width, height, indices...] per frame
+#   a raw blob always starts with a non-zero width, so a leading 0 marks the palette format.
+#   bits_per_index is 8 or 4 (two pixels per byte, high nibble first), palette_size 0 means 256.
+#
+# Delta frames (requested with &delta=true on top of &palette=true):
+#   bits_per_index has DELTA_FRAMES_FLAG set, and every frame starts with a frame type byte.
+#   KEYFRAME is followed by a full palette frame as above.
+#   DELTA_FRAME is followed by [run count (u16)] and for each run [start pixel (u16), length (u8), indices...],
+#   holding only the pixels that changed since the previous frame. Run indices are packed the same
+#   way as keyframe indices, each run starting on a new byte. u16 values are big endian.
+#
+# Decoded frames are [width, height, ...] followed by one palette index per pixel for palette blobs,
+# or by rgb triplets for raw blobs, which is what build_image_render_cache expects. All frames of an
+# animation have the same size, and are decoded into one preallocated arena (see FastloadDecoder).
+
+PALETTE_FORMAT_MARKER = 0
+PALETTE_HEADER_LENGTH = 3
+DELTA_FRAMES_FLAG = 0x80
+KEYFRAME = 0
+DELTA_FRAME = 1
+
+
+def is_palette_blob(data):
+    return len(data) > 0 and data[0] == PALETTE_FORMAT_MARKER
+
+
+# returns (palette_rgb, bits_per_index, delta_frames, header_length), palette_rgb holds 3 bytes per color
+def parse_palette_header(data):
+    if len(data) < PALETTE_HEADER_LENGTH:
+        raise ValueError("palette header truncated")
+    delta_frames = (data[1] & DELTA_FRAMES_FLAG) != 0
+    bits_per_index = data[1] & ~DELTA_FRAMES_FLAG
+    if bits_per_index != 8 and bits_per_index != 4:
+        raise ValueError(f"unsupported bits per index: {bits_per_index}")
+    palette_size = data[2]
+    if palette_size == 0:
+        palette_size = 256
+    header_length = PALETTE_HEADER_LENGTH + palette_size * 3
+    if len(data) < header_length:
+        raise ValueError("palette truncated")
+    palette_rgb = bytes(data[PALETTE_HEADER_LENGTH:header_length])
+    return palette_rgb, bits_per_index, delta_frames, header_length
+
+
+# normalized float colors for each palette entry, so they don't need converting on every draw
+def palette_colors(palette_rgb):
+    pixel_mul = 1.0 / 255.0
+    return [
+        (palette_rgb[i] * pixel_mul, palette_rgb[i + 1] * pixel_mul, palette_rgb[i + 2] * pixel_mul)
+        for i in range(0, len(palette_rgb), 3)
+    ]
+
+
+def packed_length(pixel_count, bits_per_index):
+    if bits_per_index == 4:
+        return (pixel_count + 1) // 2
+    return pixel_count
+
+
+def encoded_frame_length(width, height, bits_per_index):
+    return 2 + packed_length(width * height, bits_per_index)
+
+
+def unpack_indices(data, src, dst_frame, dst, pixel_count, bits_per_index):
+    if bits_per_index == 8:
+        dst_frame[dst:dst + pixel_count] = data[src:src + pixel_count]
+        return
+    for k in range(0, pixel_count - 1, 2):
+        packed = data[src]
+        dst_frame[dst + k] = packed >> 4
+        dst_frame[dst + k + 1] = packed & 0x0f
+        src += 1
+    if pixel_count % 2:
+        dst_frame[dst + pixel_count - 1] = data[src] >> 4
+
+
+# expands one encoded palette frame into frame at frame_offset, with the decoded [width, height, index, index, ...] layout
+def decode_palette_frame(data, offset, bits_per_index, frame, frame_offset):
+    width = data[offset]
+    height = data[offset + 1]
+    frame[frame_offset] = width
+    frame[frame_offset + 1] = height
+    unpack_indices(data, offset + 2, frame, frame_offset + 2, width * height, bits_per_index)
+
+
+# Length of the delta frame body at offset (after the frame type byte), or -1 if it's incomplete
+def delta_frame_length(data, offset, bits_per_index):
+    if offset + 2 > len(data):
+        return -1
+    run_count = (data[offset] << 8) | data[offset + 1]
+    pos = offset + 2
+    for _ in range(run_count):
+        if pos + 3 > len(data):
+            return -1
+        pos += 3 + packed_length(data[pos + 2], bits_per_index)
+    if pos > len(data):
+        return -1
+    return pos - offset
+
+
+# applies the changed runs of a delta frame to frame at frame_offset, which has to hold a copy of the previous decoded frame
+def decode_delta_frame(data, offset, bits_per_index, frame, frame_offset):
+    pixel_count = frame[frame_offset] * frame[frame_offset + 1]
+    run_count = (data[offset] << 8) | data[offset + 1]
+    pos = offset + 2
+    for _ in range(run_count):
+        start = (data[pos] << 8) | data[pos + 1]
+        length = data[pos + 2]
+        pos += 3
+        if start + length > pixel_count:
+            raise ValueError(f"delta run out of bounds: {start}+{length} > {pixel_count}")
+        unpack_indices(data, pos, frame, frame_offset + 2 + start, length, bits_per_index)
+        pos += packed_length(length, bits_per_index)
+
+
+# Decodes a fastload blob as it arrives, see feed(). Frames are decoded into a single bytearray
+# arena, allocated once the size of the first frame is known, and returned as memoryview slices
+# of it. Dropping the arena and its views frees every frame at once.
+class FastloadDecoder:
+    def __init__(self, frame_count):
+        self.frame_count = frame_count
+        self.frames_decoded = 0
+        self.bytes_received = 0
+        # None until the first byte arrives
+        self.is_palette = None
+        self.palette_rgb = None
+        self.bits_per_index = 0
+        self.delta_frames = False
+        # the encoded frame (or palette header) split across chunks is assembled here, reused for every frame
+        self.pending = bytearray()
+        self.pending_view = memoryview(self.pending)
+        self.pending_length = 0
+        self.trailing_bytes = 0
+        # why the blob was rejected, nothing more is decoded once it's set
+        self.failure = None
+        self.arena = None
+        self.arena_view = None
+        self.frame_length = 0
+        self.width = 0
+        self.height = 0
+
+    def allocate_arena(self, width, height):
+        self.width = width
+        self.height = height
+        if self.is_palette:
+            self.frame_length = 2 + width * height
+        else:
+            self.frame_length = 2 + width * height * 3
+        self.arena = bytearray(self.frame_count * self.frame_length)
+        self.arena_view = memoryview(self.arena)
+
+    def done(self):
+        return self.frames_decoded >= self.frame_count
+
+    # Consumes the next chunk of the blob, and returns the list of frames that it completed.
+    # Frames that are whole in the chunk are decoded straight from it, a frame split across chunks
+    # is copied into pending once, a chunk at a time, and decoded when its last chunk arrives.
+    def feed(self, chunk):
+        self.bytes_received += len(chunk)
+        if self.failure is not None:
+            return []
+        try:
+            return self.feed_chunk(memoryview(chunk))
+        except ValueError as e:
+            self.failure = f"{e}"
+            raise
+
+    def feed_chunk(self, chunk):
+        frames = []
+        offset = 0
+        while offset < len(chunk):
+            if self.done():
+                self.trailing_bytes += len(chunk) - offset
+                break
+            if self.pending_length > 0:
+                offset = self.assemble(chunk, offset, frames)
+                continue
+            length = self.unit_length(chunk, offset)
+            if length < 0 or offset + length > len(chunk):
+                # everything left belongs to the next frame, or it would be whole
+                self.append_pending(chunk[offset:], length)
+                break
+            self.decode_unit(chunk, offset, frames)
+            offset += length
+        return frames
+
+    # adds the start of chunk at offset to the frame in pending, decoding it once it's complete, and
+    # returns the offset in chunk after the bytes used
+    def assemble(self, chunk, offset, frames):
+        length = self.unit_length(self.pending_view[:self.pending_length], 0)
+        if length >= 0:
+            used = min(length - self.pending_length, len(chunk) - offset)
+            self.append_pending(chunk[offset:offset + used], length)
+            offset += used
+        else:
+            # not enough yet to tell its length, take the rest of the chunk and look again
+            previous_length = self.pending_length
+            self.append_pending(chunk[offset:], -1)
+            length = self.unit_length(self.pending_view[:self.pending_length], 0)
+            if length < 0 or length > self.pending_length:
+                return len(chunk)
+            # the bytes after it are the next frame's, they're read from chunk again
+            offset += length - previous_length
+            self.pending_length = length
+        if self.pending_length == length:
+            self.pending_length = 0
+            self.decode_unit(self.pending_view[:length], 0, frames)
+        return offset
+
+    # copies data to the end of pending, growing it to hold length bytes when that's known
+    def append_pending(self, data, length):
+        needed = self.pending_length + len(data)
+        if needed > len(self.pending):
+            grown = bytearray(max(needed, length, 2 * len(self.pending)))
+            grown[:self.pending_length] = self.pending_view[:self.pending_length]
+            self.pending = grown
+            self.pending_view = memoryview(grown)
+        self.pending_view[self.pending_length:needed] = data
+        self.pending_length = needed
+
+    # length of the palette header or encoded frame at offset, or -1 if there isn't enough data yet to tell
+    def unit_length(self, data, offset):
+        if self.is_palette is None:
+            self.is_palette = is_palette_blob(data[offset:offset + 1])
+        if self.is_palette and self.palette_rgb is None:
+            if offset + PALETTE_HEADER_LENGTH > len(data):
+                return -1
+            return PALETTE_HEADER_LENGTH + (data[offset + 2] or 256) * 3
+        return self.next_frame_length(data, offset)
+
+    def decode_unit(self, data, offset, frames):
+        if self.is_palette and self.palette_rgb is None:
+            self.palette_rgb, self.bits_per_index, self.delta_frames, _ = parse_palette_header(data[offset:])
+            return
+        frame_offset = self.frames_decoded * self.frame_length
+        self.decode_frame(data, offset, frame_offset)
+        if self.is_palette:
+            self.check_palette_indices(frame_offset)
+        self.frames_decoded += 1
+        frames.append(self.arena_view[frame_offset:frame_offset + self.frame_length])
+
+    # returns a message describing what went wrong if the blob didn't hold exactly frame_count frames
+    def error(self):
+        if self.failure is not None:
+            return f"fastload blob rejected: {self.failure}"
+        if not self.done():
+            return f"fastload blob truncated: decoded {self.frames_decoded}/{self.frame_count} frames from {self.bytes_received} bytes"
+        if self.trailing_bytes > 0:
+            return f"fastload blob has {self.trailing_bytes} unexpected trailing bytes"
+        return None
+
+    # length of the encoded frame at offset, or -1 if there isn't enough data yet to tell
+    def next_frame_length(self, data, offset):
+        if not self.is_palette:
+            if offset + 2 > len(data):
+                return -1
+            return 2 + data[offset] * data[offset + 1] * 3
+        type_length = 0
+        if self.delta_frames:
+            if offset + 1 > len(data):
+                return -1
+            type_length = 1
+            if data[offset] == DELTA_FRAME:
+                length = delta_frame_length(data, offset + 1, self.bits_per_index)
+                if length < 0:
+                    return -1
+                return 1 + length
+            elif data[offset] != KEYFRAME:
+                raise ValueError(f"unknown frame type: {data[offset]}")
+        if offset + type_length + 2 > len(data):
+            return -1
+        return type_length + encoded_frame_length(data[offset + type_length], data[offset + type_length + 1], self.bits_per_index)
+
+    # decodes the encoded frame at offset into the arena at frame_offset
+    def decode_frame(self, data, offset, frame_offset):
+        if self.delta_frames:
+            frame_type = data[offset]
+            offset += 1
+            if frame_type == DELTA_FRAME:
+                if self.frames_decoded == 0:
+                    raise ValueError("delta frame without a keyframe")
+                # delta frames only hold the changes, start from a copy of the previous frame
+                self.arena[frame_offset:frame_offset + self.frame_length] = self.arena_view[frame_offset - self.frame_length:frame_offset]
+                decode_delta_frame(data, offset, self.bits_per_index, self.arena, frame_offset)
+                return
+        width = data[offset]
+        height = data[offset + 1]
+        if self.arena is None:
+            self.allocate_arena(width, height)
+        elif width != self.width or height != self.height:
+            raise ValueError(f"frame size changed from {self.width}x{self.height} to {width}x{height}")
+        if self.is_palette:
+            decode_palette_frame(data, offset, self.bits_per_index, self.arena, frame_offset)
+        else:
+            self.arena[frame_offset:frame_offset + self.frame_length] = data[offset:offset + self.frame_length]
+
+    # frames are published as soon as they're decoded, so an index past the palette of a corrupt blob
+    # has to be caught here rather than when the frame is drawn
+    def check_palette_indices(self, frame_offset):
+        palette_size = len(self.palette_rgb) // 3
+        if palette_size < 256 and max(self.arena_view[frame_offset + 2:frame_offset + self.frame_length]) >= palette_size:
+            raise ValueError(f"palette index out of range in frame {self.frames_decoded}, the palette has {palette_size} colors")
+
+
+# converts a decoded palette frame back to the raw rgb layout
+def expand_palette_frame(frame, palette_rgb):
+    pixel_count = frame[0] * frame[1]
+    expanded = bytearray(2 + pixel_count * 3)
+    expanded[0] = frame[0]
+    expanded[1] = frame[1]
+    dst = 2
+    for k in range(2, 2 + pixel_count):
+        src = frame[k] * 3
+        expanded[dst] = palette_rgb[src]
+        expanded[dst + 1] = palette_rgb[src + 1]
+        expanded[dst + 2] = palette_rgb[src + 2]
+        dst += 3
+    return expanded
+
+
+# converts a raw rgb frame to the decoded palette layout, returns (frame, palette_rgb), or None if it has more than 256 colors
+def compact_palette_frame(frame):
+    pixel_count = frame[0] * frame[1]
+    compact = bytearray(2 + pixel_count)
+    compact[0] = frame[0]
+    compact[1] = frame[1]
+    palette_rgb = bytearray()
+    indices = {}
+    src = 2
+    for k in range(2, 2 + pixel_count):
+        color = (frame[src] << 16) | (frame[src + 1] << 8) | frame[src + 2]
+        index = indices.get(color)
+        if index is None:
+            index = len(indices)
+            if index == 256:
+                return None
+            indices[color] = index
+            palette_rgb.append(frame[src])
+            palette_rgb.append(frame[src + 1])
+            palette_rgb.append(frame[src + 2])
+        compact[k] = index
+        src += 3
+    return compact, bytes(palette_rgb)
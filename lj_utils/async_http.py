@@ -0,0 +1,414 @@
+# Minimal HTTP/1.1 client built on asyncio streams, so network calls don't block drawing, button
+# handling and LED updates while waiting on the socket. The API mirrors the parts of requests
+# that the app uses:
+#   http = HttpSession()
+#   response = await http.get(url, headers=headers)
+#   if response.status_code == 200:
+#       data = response.json()
+# With stream=True the body isn't read up front, use `await response.read(size)` and close() instead.
+#
+# A session keeps finished connections open and reuses them for the next request to the same host,
+# and caches resolved addresses, so repeated requests skip the DNS lookup and the TCP/TLS handshake.
+# A reused connection that the server has closed in the meantime is replaced transparently.
+#
+# Given a validator_cache (an LruFileCache), GET requests made with revalidate=True store the body
+# together with the ETag / Last-Modified of the response, send them back as If-None-Match /
+# If-Modified-Since next time, and turn a 304 into a 200 holding the cached body.
+import asyncio
+import binascii
+import hashlib
+import json as json_module
+import socket
+import time
+from . import tracer
+
+DEFAULT_TIMEOUT = 30
+READ_SIZE = 1024
+# idle connections kept per host, TLS connections are expensive to keep around on the badge
+POOL_SIZE = 2
+# servers drop idle keep-alive connections after a while, don't bother reusing older ones
+IDLE_TIMEOUT_MS = 15000
+DNS_CACHE_MS = 10 * 60 * 1000
+
+
+def parse_url(url):
+    if url.startswith("https://"):
+        use_ssl = True
+        port = 443
+        rest = url[8:]
+    elif url.startswith("http://"):
+        use_ssl = False
+        port = 80
+        rest = url[7:]
+    else:
+        raise ValueError(f"Unsupported URL: {url}")
+    slash = rest.find("/")
+    if slash == -1:
+        host = rest
+        path = "/"
+    else:
+        host = rest[:slash]
+        path = rest[slash:]
+    if ":" in host:
+        host, port = host.split(":", 1)
+        port = int(port)
+    return use_ssl, host, port, path
+
+
+class Response:
+    def __init__(self, session, key, reader, writer, status_code, headers, keep_alive, has_body, timings, timeout=DEFAULT_TIMEOUT):
+        self.session = session
+        self.key = key
+        self.reader = reader
+        self.writer = writer
+        self.status_code = status_code
+        self.headers = headers
+        self.content = None
+        # True if the server answered 304 and the body is the cached copy, see HttpSession.revalidate
+        self.from_cache = False
+        self.cache_offset = 0
+        # stores the body in the validator cache as it's read, with cache_meta
+        self.cache_writer = None
+        self.cache_meta = None
+        self.keep_alive = keep_alive
+        self.timeout = timeout
+        # dns_ms, handshake_ms (TCP + TLS), wait_ms (until the response head), transfer_ms (body), reused
+        self.timings = timings
+        self.finished = not has_body
+        self.chunked = headers.get("transfer-encoding", "").lower() == "chunked"
+        # bytes left in the body (or in the current chunk), None if the body ends when the socket closes
+        self.remaining = None
+        if self.chunked:
+            self.remaining = 0
+        elif "content-length" in headers:
+            self.remaining = int(headers["content-length"])
+            if self.remaining == 0:
+                self.finished = True
+        else:
+            self.keep_alive = False
+
+    async def read_chunk_header(self):
+        line = await asyncio.wait_for(self.reader.readline(), self.timeout)
+        if not line:
+            raise OSError("connection closed in chunked body")
+        self.remaining = int(line.split(b";")[0].strip(), 16)
+        if self.remaining == 0:
+            # skip the trailers
+            while True:
+                line = await asyncio.wait_for(self.reader.readline(), self.timeout)
+                if not line or line == b"\r\n":
+                    break
+            self.finish()
+
+    # reads up to size bytes of the body, returns b"" once it's finished
+    async def read(self, size=READ_SIZE):
+        if self.from_cache:
+            data = self.content[self.cache_offset:self.cache_offset + size]
+            self.cache_offset += len(data)
+            return data
+        if self.reader is None or self.finished:
+            return b""
+        start = time.ticks_ms()
+        if self.chunked and self.remaining == 0:
+            await self.read_chunk_header()
+            if self.finished:
+                return b""
+        if self.remaining is not None:
+            size = min(size, self.remaining)
+        data = await asyncio.wait_for(self.reader.read(size), self.timeout)
+        self.timings["transfer_ms"] += time.ticks_diff(time.ticks_ms(), start)
+        if self.cache_writer is not None and data:
+            self.cache_writer.write(data)
+        if self.remaining is None:
+            if not data:
+                self.finish()
+            return data
+        if not data:
+            raise OSError(f"connection closed with {self.remaining} bytes left")
+        self.remaining -= len(data)
+        if self.remaining == 0:
+            if self.chunked:
+                # every chunk ends with a CRLF
+                await asyncio.wait_for(self.reader.readline(), self.timeout)
+            else:
+                self.finish()
+        return data
+
+    async def read_all(self):
+        if self.from_cache:
+            return self.content
+        chunks = []
+        while True:
+            data = await self.read()
+            if not data:
+                break
+            chunks.append(data)
+        self.content = b"".join(chunks)
+        return self.content
+
+    def json(self):
+        return json_module.loads(self.content)
+
+    # the body has been read completely, hand the connection back to the session
+    def finish(self):
+        if self.finished and self.reader is None:
+            return
+        self.finished = True
+        if self.cache_writer is not None:
+            self.cache_writer.commit(self.cache_meta)
+            self.cache_writer = None
+        if self.writer is not None:
+            self.session.release(self, self.keep_alive)
+            self.writer = None
+            self.reader = None
+
+    # closes the response, the connection is only reused if the whole body was read
+    def close(self):
+        if self.cache_writer is not None:
+            self.cache_writer.abort()
+            self.cache_writer = None
+        if self.writer is not None:
+            self.session.release(self, self.finished and self.keep_alive)
+            self.writer = None
+            self.reader = None
+
+
+async def read_response_head(reader):
+    status_line = await reader.readline()
+    if not status_line:
+        raise OSError("connection closed before response")
+    parts = status_line.split(None, 2)
+    if len(parts) < 2:
+        raise OSError(f"invalid status line: {status_line}")
+    status_code = int(parts[1])
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if not line or line == b"\r\n":
+            break
+        name, _, value = line.decode().partition(":")
+        headers[name.strip().lower()] = value.strip()
+    return parts[0], status_code, headers
+
+
+# label of a request in traces, the method and the path of url without the query and the segments with a
+# digit in them (ids), so all requests of a route share one: GET /images, GET /api/sequence/thumbnail
+def trace_route(method, url):
+    path = url.split("?")[0]
+    scheme_end = path.find("://")
+    if scheme_end >= 0:
+        slash = path.find("/", scheme_end + 3)
+        path = path[slash:] if slash >= 0 else ""
+    route = method + " "
+    for segment in path.split("/"):
+        if segment and not any(c.isdigit() for c in segment):
+            route += "/" + segment
+    return route if len(route) > len(method) + 1 else route + "/"
+
+
+# validator cache keys, urls can be too long for file names
+def url_cache_key(url):
+    return binascii.hexlify(hashlib.sha256(url.encode()).digest()[:12]).decode()
+
+
+class HttpSession:
+    def __init__(self, pool_size=POOL_SIZE, log_timings=False, validator_cache=None):
+        self.pool_size = pool_size
+        self.log_timings = log_timings
+        self.validator_cache = validator_cache
+        # host -> (address, resolved at)
+        self.addresses = {}
+        # (use_ssl, host, port) -> list of idle (reader, writer, released at)
+        self.idle_connections = {}
+        self.stats = {
+            "requests": 0,
+            "connections": 0,
+            "reused": 0,
+            "reconnects": 0,
+            "dns_lookups": 0,
+            "handshake_ms": 0,
+            "transfer_ms": 0,
+            # requests sent with validators, how many of them got a 304, and the body bytes that didn't need sending
+            "conditional_requests": 0,
+            "not_modified": 0,
+            "bytes_saved": 0,
+        }
+
+    # share of conditional requests answered from the validator cache
+    def cache_hit_rate(self):
+        if self.stats["conditional_requests"] == 0:
+            return 0
+        return self.stats["not_modified"] / self.stats["conditional_requests"]
+
+    # returns (cache key, validator headers) for a revalidated request, or (None, None)
+    def conditional_headers(self, url):
+        key = url_cache_key(url)
+        meta = self.validator_cache.meta(key)
+        if meta is None or meta.get("url") != url:
+            return key, None
+        headers = {}
+        if meta.get("etag") is not None:
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified") is not None:
+            headers["If-Modified-Since"] = meta["last_modified"]
+        return key, headers
+
+    # serves a 304 from the validator cache, or starts storing a 200 that came with validators
+    def revalidate(self, response, url, key, conditional):
+        if conditional and response.status_code == 304:
+            content = self.validator_cache.read(key)
+            if content is None:
+                return
+            self.stats["not_modified"] += 1
+            self.stats["bytes_saved"] += len(content)
+            response.status_code = 200
+            response.content = content
+            response.from_cache = True
+            return
+        if response.status_code != 200 or response.finished:
+            return
+        etag = response.headers.get("etag")
+        last_modified = response.headers.get("last-modified")
+        if etag is None and last_modified is None:
+            return
+        response.cache_writer = self.validator_cache.begin_write(key)
+        response.cache_meta = {"url": url, "etag": etag, "last_modified": last_modified}
+
+    def resolve(self, host, port):
+        cached = self.addresses.get(host)
+        if cached is not None and time.ticks_diff(time.ticks_ms(), cached[1]) < DNS_CACHE_MS:
+            return cached[0]
+        self.stats["dns_lookups"] += 1
+        address = socket.getaddrinfo(host, port)[0][-1][0]
+        self.addresses[host] = (address, time.ticks_ms())
+        return address
+
+    async def connect(self, key, timings):
+        idle = self.idle_connections.get(key)
+        while idle:
+            reader, writer, released_at = idle.pop()
+            if time.ticks_diff(time.ticks_ms(), released_at) < IDLE_TIMEOUT_MS:
+                timings["reused"] = True
+                return reader, writer
+            writer.close()
+        use_ssl, host, port = key
+        start = time.ticks_ms()
+        address = self.resolve(host, port)
+        connect_start = time.ticks_ms()
+        timings["dns_ms"] = time.ticks_diff(connect_start, start)
+        if use_ssl:
+            # connect to the cached address, but verify the certificate against the host name
+            reader, writer = await asyncio.open_connection(address, port, ssl=True, server_hostname=host)
+        else:
+            reader, writer = await asyncio.open_connection(address, port)
+        timings["handshake_ms"] = time.ticks_diff(time.ticks_ms(), connect_start)
+        self.stats["connections"] += 1
+        return reader, writer
+
+    def release(self, response, reusable):
+        timings = response.timings
+        self.stats["transfer_ms"] += timings["transfer_ms"]
+        if self.log_timings:
+            print(f"[HttpSession] {response.status_code} {response.key[1]} dns {timings['dns_ms']}ms handshake {timings['handshake_ms']}ms wait {timings['wait_ms']}ms transfer {timings['transfer_ms']}ms" + (" (reused)" if timings["reused"] else ""))
+        idle = self.idle_connections.setdefault(response.key, [])
+        if reusable and len(idle) < self.pool_size:
+            idle.append((response.reader, response.writer, time.ticks_ms()))
+        else:
+            response.writer.close()
+
+    def close_idle(self, key):
+        for reader, writer, released_at in self.idle_connections.pop(key, []):
+            writer.close()
+
+    def close(self):
+        for key in list(self.idle_connections):
+            self.close_idle(key)
+
+    async def send_request(self, method, url, data, json, headers, stream, timeout, revalidate):
+        use_ssl, host, port, path = parse_url(url)
+        if json is not None:
+            data = json_module.dumps(json)
+        if isinstance(data, str):
+            data = data.encode()
+        cache_key = None
+        conditional = None
+        # only plain GETs, the response to a request with a body depends on more than the url
+        if revalidate and self.validator_cache is not None and method == "GET" and data is None:
+            cache_key, conditional = self.conditional_headers(url)
+        request_head = f"{method} {path} HTTP/1.1\r\nHost: {host}\r\nConnection: keep-alive\r\n"
+        for extra_headers in (headers, conditional):
+            if extra_headers:
+                for name in extra_headers:
+                    request_head += f"{name}: {extra_headers[name]}\r\n"
+        if json is not None:
+            request_head += "Content-Type: application/json\r\n"
+        request_head += f"Content-Length: {len(data) if data is not None else 0}\r\n\r\n"
+        request_head = request_head.encode()
+        key = (use_ssl, host, port)
+        self.stats["requests"] += 1
+        if conditional:
+            self.stats["conditional_requests"] += 1
+        # a reused connection may have been closed by the server while idle, retry once on a fresh one
+        for attempt in range(2):
+            timings = {"dns_ms": 0, "handshake_ms": 0, "wait_ms": 0, "transfer_ms": 0, "reused": False}
+            reader, writer = await self.connect(key, timings)
+            start = time.ticks_ms()
+            try:
+                writer.write(request_head)
+                if data is not None:
+                    writer.write(data)
+                await writer.drain()
+                version, status_code, response_headers = await read_response_head(reader)
+            except Exception as e:
+                writer.close()
+                if timings["reused"] and attempt == 0:
+                    print(f"[HttpSession] Reused connection to {host} failed ({e}), reconnecting")
+                    self.stats["reconnects"] += 1
+                    # the other idle connections to this host are most likely dead as well
+                    self.close_idle(key)
+                    continue
+                # the address might have changed
+                self.addresses.pop(host, None)
+                raise
+            except BaseException:
+                writer.close()
+                raise
+            break
+        timings["wait_ms"] = time.ticks_diff(time.ticks_ms(), start)
+        if timings["reused"]:
+            self.stats["reused"] += 1
+        self.stats["handshake_ms"] += timings["handshake_ms"]
+        connection = response_headers.get("connection", "").lower()
+        if version == b"HTTP/1.0":
+            keep_alive = connection == "keep-alive"
+        else:
+            keep_alive = connection != "close"
+        has_body = method != "HEAD" and status_code not in (204, 304) and status_code >= 200
+        response = Response(self, key, reader, writer, status_code, response_headers, keep_alive, has_body, timings, timeout)
+        if cache_key is not None:
+            self.revalidate(response, url, cache_key, conditional)
+        if response.finished:
+            if not response.from_cache:
+                response.content = b""
+            response.finish()
+        elif not stream:
+            try:
+                await response.read_all()
+            finally:
+                response.close()
+        return response
+
+    # with stream=True the traced span ends once the response head is in, the body is read by the caller's task
+    async def request(self, method, url, data=None, json=None, headers=None, stream=False, timeout=DEFAULT_TIMEOUT, revalidate=False):
+        start = tracer.start_span()
+        try:
+            return await asyncio.wait_for(self.send_request(method, url, data, json, headers, stream, timeout, revalidate), timeout)
+        finally:
+            if start is not None:
+                tracer.end_span("http", trace_route(method, url), start)
+
+    async def get(self, url, **kwargs):
+        return await self.request("GET", url, **kwargs)
+
+    async def post(self, url, **kwargs):
+        return await self.request("POST", url, **kwargs)
@@ -22,6 +22,15 @@ class Utility:
     def update_leds(self):
         pass
 
+    # return True if the next draw only repaints what changed on screen since the last one,
+    # the screen isn't cleared before calling draw() then
+    def draws_incrementally(self):
+        return False
+
+    # called when the screen was cleared or drawn over, so the next draw has to repaint everything
+    def invalidate(self):
+        pass
+
     # returns True if this app handles the CANCEL button press
     def handle_buttondown(self, event: ButtonDownEvent):
         return False
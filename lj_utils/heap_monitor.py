@@ -0,0 +1,224 @@
+import array
+import gc
+import json
+import time
+
+try:
+    import esp32
+except ImportError:
+    esp32 = None
+
+# frames of samples kept for the overlay and the dump
+HEAP_SAMPLE_COUNT = 120
+# bytes allocated by a utility within a single frame to be recorded as a burst
+ALLOCATION_BURST_BYTES = 4 * 1024
+# bursts and collections kept, the oldest ones are dropped first
+EVENT_COUNT = 32
+# a drop in allocated bytes this big without a collection of ours means the allocator ran one itself
+AUTO_COLLECT_DROP_BYTES = 2 * 1024
+# free heap under which a dump is written, once until it goes back over twice that
+LOW_HEAP_BYTES = 16 * 1024
+
+
+def heap_free():
+    return gc.mem_free() if hasattr(gc, "mem_free") else 0
+
+
+def heap_alloc():
+    return gc.mem_alloc() if hasattr(gc, "mem_alloc") else 0
+
+
+# largest block that can still be allocated from the IDF heap the MicroPython heap grows into, None if unknown
+def largest_free_block():
+    if esp32 is None:
+        return None
+    try:
+        largest = 0
+        for region in esp32.idf_heap_info(esp32.HEAP_DATA):
+            largest = max(largest, region[2])
+        return largest
+    except Exception:
+        return None
+
+
+def format_bytes(size):
+    if size is None:
+        return "?"
+    if size >= 1024:
+        return f"{size / 1024:.1f}K"
+    return str(size)
+
+
+# Samples the heap once a frame, from UtilityMenuApp.update, and attributes the bytes allocated since the last
+# sample to the utility that was active meanwhile. Collections run by MemoryManager are reported with their
+# duration through record_collection, the ones the allocator runs by itself are noticed from the drop in
+# allocated bytes, their duration is unknown.
+# Samples are kept in fixed arrays so sampling doesn't allocate itself, the sample's own allocations are left
+# out of the next frame's figure.
+#   monitor = HeapMonitor(DATA_BASE_PATH + "heap_dump.json")
+#   monitor.sample("ThumbnailBrowser")
+#   monitor.record_collection(18, forced=False)
+#   monitor.draw_overlay(ctx)
+#   monitor.dump("overlay closed")
+class HeapMonitor:
+    def __init__(self, dump_path):
+        self.dump_path = dump_path
+        self.sample_times = array.array("i", [0] * HEAP_SAMPLE_COUNT)
+        self.sample_free = array.array("i", [0] * HEAP_SAMPLE_COUNT)
+        self.sample_alloc = array.array("i", [0] * HEAP_SAMPLE_COUNT)
+        # -1 if unknown
+        self.sample_largest = array.array("i", [0] * HEAP_SAMPLE_COUNT)
+        self.sample_collections = array.array("i", [0] * HEAP_SAMPLE_COUNT)
+        # index into utility_names
+        self.sample_utility = array.array("B", [0] * HEAP_SAMPLE_COUNT)
+        self.sample_index = 0
+        self.sample_count = 0
+        self.utility_names = []
+        # utility name -> {"frames", "allocated", "largest_burst"}
+        self.utility_stats = {}
+        # {"t", "utility", "bytes"}, oldest first
+        self.bursts = []
+        # {"t", "ms": None if run by the allocator, "forced", "freed"}, oldest first
+        self.collections = []
+        # {"t", "message"}, things worth finding in the dump like failed downloads
+        self.marks = []
+        self.collection_count = 0
+        self.auto_collection_count = 0
+        self.collected_since_sample = False
+        self.last_alloc = None
+        self.last_utility = None
+        self.low_heap_dumped = False
+
+    def utility_index(self, name):
+        if name not in self.utility_names:
+            if len(self.utility_names) >= 255:
+                return 0
+            self.utility_names.append(name)
+        return self.utility_names.index(name)
+
+    def sample(self, utility_name):
+        now = time.ticks_ms()
+        alloc = heap_alloc()
+        free = heap_free()
+        if self.last_alloc is not None and self.last_utility is not None:
+            allocated = alloc - self.last_alloc
+            if allocated < -AUTO_COLLECT_DROP_BYTES and not self.collected_since_sample:
+                self.auto_collection_count += 1
+                self.add_event(self.collections, {"t": now, "ms": None, "forced": False, "freed": -allocated})
+            stats = self.utility_stats.get(self.last_utility)
+            if stats is None:
+                stats = {"frames": 0, "allocated": 0, "largest_burst": 0}
+                self.utility_stats[self.last_utility] = stats
+            stats["frames"] += 1
+            if allocated > 0:
+                stats["allocated"] += allocated
+                stats["largest_burst"] = max(stats["largest_burst"], allocated)
+            if allocated >= ALLOCATION_BURST_BYTES:
+                self.add_event(self.bursts, {"t": now, "utility": self.last_utility, "bytes": allocated})
+        largest = largest_free_block()
+        k = self.sample_index
+        self.sample_times[k] = now
+        self.sample_free[k] = free
+        self.sample_alloc[k] = alloc
+        self.sample_largest[k] = largest if largest is not None else -1
+        self.sample_collections[k] = self.collection_count + self.auto_collection_count
+        self.sample_utility[k] = self.utility_index(utility_name)
+        self.sample_index = (k + 1) % HEAP_SAMPLE_COUNT
+        self.sample_count = min(self.sample_count + 1, HEAP_SAMPLE_COUNT)
+        self.collected_since_sample = False
+        self.last_utility = utility_name
+        if free > 0 and free < LOW_HEAP_BYTES and not self.low_heap_dumped:
+            self.low_heap_dumped = True
+            self.dump(f"free heap down to {free} bytes")
+        elif free > LOW_HEAP_BYTES * 2:
+            self.low_heap_dumped = False
+        # leave what sampling allocated out of the next frame
+        self.last_alloc = heap_alloc()
+
+    def add_event(self, events, event):
+        events.append(event)
+        if len(events) > EVENT_COUNT:
+            events.pop(0)
+
+    # called by MemoryManager after each gc.collect(), forced if no idle frame came in time
+    def record_collection(self, duration_ms, forced):
+        freed = 0
+        if self.last_alloc is not None:
+            freed = max(0, self.last_alloc - heap_alloc())
+        self.collection_count += 1
+        self.collected_since_sample = True
+        self.add_event(self.collections, {"t": time.ticks_ms(), "ms": duration_ms, "forced": forced, "freed": freed})
+
+    def mark(self, message, dump=False):
+        print(f"[HeapMonitor] {message}")
+        self.add_event(self.marks, {"t": time.ticks_ms(), "message": message})
+        if dump:
+            self.dump(message)
+
+    # the samples oldest first, as (ticks_ms, free, alloc, largest free block or None, collections, utility)
+    def samples(self):
+        start = (self.sample_index - self.sample_count) % HEAP_SAMPLE_COUNT
+        for i in range(self.sample_count):
+            k = (start + i) % HEAP_SAMPLE_COUNT
+            largest = self.sample_largest[k] if self.sample_largest[k] >= 0 else None
+            yield (self.sample_times[k], self.sample_free[k], self.sample_alloc[k], largest,
+                   self.sample_collections[k], self.utility_names[self.sample_utility[k]])
+
+    def latest_sample(self):
+        if self.sample_count == 0:
+            return None
+        k = (self.sample_index - 1) % HEAP_SAMPLE_COUNT
+        return self.sample_free[k], self.sample_alloc[k], self.sample_largest[k] if self.sample_largest[k] >= 0 else None
+
+    # writes everything kept so far as JSON, one sample per line so it can be written without building it all in memory
+    def dump(self, reason):
+        print(f"[HeapMonitor] Writing heap dump to {self.dump_path}: {reason}")
+        try:
+            with open(self.dump_path, "w") as f:
+                f.write('{"reason": ' + json.dumps(reason) + ', "t": ' + str(time.ticks_ms()))
+                f.write(', "collections": ' + str(self.collection_count) + ', "auto_collections": ' + str(self.auto_collection_count))
+                f.write(',\n"samples": [')
+                first = True
+                for t, free, alloc, largest, collections, utility in self.samples():
+                    f.write(("\n" if first else ",\n") + json.dumps({
+                        "t": t, "free": free, "alloc": alloc, "largest_free": largest, "collections": collections, "utility": utility,
+                    }))
+                    first = False
+                f.write('],\n"utilities": ' + json.dumps(self.utility_stats))
+                f.write(',\n"bursts": ' + json.dumps(self.bursts))
+                f.write(',\n"gc_pauses": ' + json.dumps(self.collections))
+                f.write(',\n"marks": ' + json.dumps(self.marks) + '}\n')
+        except Exception as e:
+            print(f"[HeapMonitor] Error writing heap dump: {e}")
+
+    def draw_overlay(self, ctx):
+        ctx.save()
+        ctx.rgba(0, 0, 0, 0.75).rectangle(-100, -70, 200, 140).fill()
+        ctx.font_size = 14
+        ctx.text_align = ctx.LEFT
+        ctx.text_baseline = ctx.TOP
+        ctx.rgb(1, 1, 1)
+        latest = self.latest_sample()
+        if latest is not None:
+            free, alloc, largest = latest
+            ctx.move_to(-92, -64).text(f"free {format_bytes(free)} alloc {format_bytes(alloc)}")
+            ctx.move_to(-92, -48).text(f"largest free {format_bytes(largest)}")
+        last_pause = "-"
+        for collection in self.collections:
+            if collection["ms"] is not None:
+                last_pause = f"{collection['ms']}ms"
+        ctx.move_to(-92, -32).text(f"gc {self.collection_count} auto {self.auto_collection_count} last {last_pause}")
+        if len(self.bursts) > 0:
+            burst = self.bursts[-1]
+            ctx.move_to(-92, -16).text(f"burst {burst['utility']} {format_bytes(burst['bytes'])}")
+        # free heap of every sample, relative to the total heap
+        ctx.rgb(0.3, 0.8, 0.3)
+        x = -90
+        for t, free, alloc, largest, collections, utility in self.samples():
+            total = free + alloc
+            if total > 0:
+                height = 60 * free // total
+                ctx.rectangle(x, 62 - height, 1.5, height)
+            x += 1.5
+        ctx.fill()
+        ctx.restore()
@@ -0,0 +1,152 @@
+import json
+
+# space, tab, carriage return, line feed
+WHITESPACE = (0x20, 0x09, 0x0d, 0x0a)
+QUOTE = 0x22
+
+# Reads a JSON object chunk by chunk, handing every element of the array under array_key to on_item
+# as soon as it's complete, instead of parsing the whole document at once. Only the element being read
+# is kept as text, so the peak is one element rather than the whole response plus its object tree.
+# The other members of the object are collected into the dict returned by finish():
+#   parser = JsonArrayStream("sequences", sequences.append)
+#   parser.feed(chunk)
+#   ...
+#   result = parser.finish()
+# Values are validated by json.loads one at a time, the structure around them only as far as it's read.
+class JsonArrayStream:
+    def __init__(self, array_key, on_item):
+        self.array_key = array_key
+        self.on_item = on_item
+        self.result = {}
+        # nesting depth, 1 inside the top level object, 2 inside the array
+        self.depth = 0
+        self.in_array = False
+        self.done = False
+        # member name being read at the top level, and whether its value comes next
+        self.key = None
+        self.expect_value = False
+        # text of the value (or member name) being read, None between values
+        self.capture = None
+        self.capture_depth = 0
+        self.reading_key = False
+        self.in_string = False
+        self.escaped = False
+
+    def start_capture(self, reading_key):
+        self.capture = bytearray()
+        self.capture_depth = self.depth
+        self.reading_key = reading_key
+
+    def end_capture(self):
+        value = json.loads(bytes(self.capture))
+        self.capture = None
+        if self.reading_key:
+            self.key = value
+        elif self.in_array:
+            self.on_item(value)
+        else:
+            self.result[self.key] = value
+            self.key = None
+            self.expect_value = False
+
+    # reads the rest of a string, skipping straight to its closing quote, returns the offset after it
+    def read_string(self, chunk, i):
+        n = len(chunk)
+        while i < n:
+            if self.escaped:
+                self.capture.append(chunk[i])
+                self.escaped = False
+                i += 1
+                continue
+            quote = chunk.find(b'"', i)
+            backslash = chunk.find(b"\\", i)
+            if backslash >= 0 and (quote < 0 or backslash < quote):
+                self.capture += chunk[i:backslash + 1]
+                self.escaped = True
+                i = backslash + 1
+            elif quote < 0:
+                self.capture += chunk[i:]
+                return n
+            else:
+                self.capture += chunk[i:quote + 1]
+                self.in_string = False
+                if self.depth == self.capture_depth:
+                    self.end_capture()
+                return quote + 1
+        return i
+
+    def feed(self, chunk):
+        i = 0
+        n = len(chunk)
+        while i < n:
+            if self.in_string:
+                i = self.read_string(chunk, i)
+                continue
+            c = chunk[i]
+            if self.capture is not None:
+                if c == QUOTE:
+                    self.capture.append(c)
+                    self.in_string = True
+                elif c == 0x7b or c == 0x5b:  # { [
+                    self.capture.append(c)
+                    self.depth += 1
+                elif c == 0x7d or c == 0x5d:  # } ]
+                    if self.depth == self.capture_depth:
+                        # end of a number or literal, the bracket is read again below
+                        self.end_capture()
+                        continue
+                    self.capture.append(c)
+                    self.depth -= 1
+                    if self.depth == self.capture_depth:
+                        self.end_capture()
+                elif self.depth == self.capture_depth and (c == 0x2c or c in WHITESPACE):  # ,
+                    self.end_capture()
+                    continue
+                else:
+                    self.capture.append(c)
+                i += 1
+                continue
+            i += 1
+            if c in WHITESPACE:
+                continue
+            if self.done:
+                raise ValueError("unexpected data after the JSON object")
+            if self.depth == 0:
+                if c != 0x7b:
+                    raise ValueError("expected a JSON object")
+                self.depth = 1
+            elif self.in_array:
+                if c == 0x5d:
+                    self.in_array = False
+                    self.depth = 1
+                    self.key = None
+                    self.expect_value = False
+                elif c != 0x2c:
+                    self.start_capture(False)
+                    i -= 1
+            elif self.expect_value:
+                if c == 0x3a and self.key is not None and self.capture is None:  # :
+                    continue
+                if self.key == self.array_key and c == 0x5b:
+                    self.in_array = True
+                    self.depth = 2
+                else:
+                    self.start_capture(False)
+                    i -= 1
+            elif c == QUOTE:
+                self.start_capture(True)
+                self.capture.append(c)
+                self.in_string = True
+                self.expect_value = True
+            elif c == 0x7d:
+                self.depth = 0
+                self.done = True
+            elif c != 0x2c:
+                raise ValueError(f"unexpected character {chr(c)} in JSON object")
+
+    # returns the members of the object other than the array, raises ValueError if it was cut short
+    def finish(self):
+        if not self.done:
+            raise ValueError("JSON object truncated")
+        return self.result
+
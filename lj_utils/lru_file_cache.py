@@ -0,0 +1,257 @@
+import os
+import json
+import asyncio
+from .file_utils import file_exists, folder_exists
+
+INDEX_FILE = "index.json"
+READ_SIZE = 1024
+
+
+# Keeps blobs as files in a directory, up to max_bytes in total, evicting the least recently used
+# ones first. A single index file holds the size, last use and metadata of every entry, so nothing
+# but the index has to be read at startup:
+#   cache = LruFileCache("/data/app/cache/", 256 * 1024)
+#   writer = cache.begin_write(key)
+#   writer.write(chunk)
+#   writer.commit({"some": "metadata"})
+#   reader = cache.open(key)
+#   chunk = await reader.read(1024)
+class LruFileCache:
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        # key -> {"size": bytes, "used": clock value of the last use, "meta": metadata}
+        self.entries = {}
+        self.clock = 0
+        self.total_bytes = 0
+        # entries being read, they aren't evicted until their reader is closed
+        self.in_use = {}
+        self.index_dirty = False
+        self.load_index()
+
+    def load_index(self):
+        try:
+            if not folder_exists(self.directory):
+                os.mkdir(self.directory)
+            if file_exists(self.directory + INDEX_FILE):
+                with open(self.directory + INDEX_FILE, "r") as f:
+                    index = json.load(f)
+                self.entries = index.get("entries", {})
+                self.clock = index.get("clock", 0)
+        except Exception as e:
+            print(f"[LruFileCache] Error loading index, starting empty: {e}")
+            self.entries = {}
+            self.clock = 0
+        # drop entries whose file has gone missing
+        for key in list(self.entries):
+            if not file_exists(self.path(key)):
+                del self.entries[key]
+                self.index_dirty = True
+        self.remove_unindexed_files()
+        self.total_bytes = 0
+        for key in self.entries:
+            self.total_bytes += self.entries[key]["size"]
+        print(f"[LruFileCache] {len(self.entries)} entries, {self.total_bytes}/{self.max_bytes} bytes")
+
+    # entries added since the index was last flushed are lost if the app doesn't exit cleanly, their files
+    # (and those of interrupted writes) would otherwise take up flash without counting towards max_bytes
+    def remove_unindexed_files(self):
+        indexed = {}
+        for key in self.entries:
+            indexed[self.path(key)] = True
+        try:
+            names = os.listdir(self.directory)
+        except Exception as e:
+            print(f"[LruFileCache] Error listing {self.directory}: {e}")
+            return
+        for name in names:
+            path = self.directory + name
+            if name == INDEX_FILE or path in indexed:
+                continue
+            print(f"[LruFileCache] Removing unindexed file {name}")
+            try:
+                os.remove(path)
+            except Exception as e:
+                print(f"[LruFileCache] Error removing {name}: {e}")
+
+    def save_index(self):
+        try:
+            with open(self.directory + INDEX_FILE, "w") as f:
+                json.dump({"entries": self.entries, "clock": self.clock}, f)
+            self.index_dirty = False
+        except Exception as e:
+            print(f"[LruFileCache] Error saving index: {e}")
+
+    # writes out new entries and the last use of entries, which aren't saved on every change to spare the flash
+    def flush(self):
+        if self.index_dirty:
+            self.save_index()
+
+    def path(self, key):
+        name = ""
+        for c in key:
+            name += c if c.isalpha() or c.isdigit() or c in "-_" else "_"
+        return self.directory + name + ".bin"
+
+    def contains(self, key):
+        return key in self.entries
+
+    def meta(self, key):
+        entry = self.entries.get(key)
+        return entry["meta"] if entry is not None else None
+
+    def touch(self, key):
+        self.clock += 1
+        self.entries[key]["used"] = self.clock
+        self.index_dirty = True
+
+    # returns a reader for the entry, or None if it isn't cached
+    def open(self, key):
+        if key not in self.entries:
+            return None
+        try:
+            f = open(self.path(key), "rb")
+        except Exception as e:
+            print(f"[LruFileCache] Error opening {key}, dropping it: {e}")
+            self.remove(key)
+            return None
+        self.touch(key)
+        self.in_use[key] = self.in_use.get(key, 0) + 1
+        return CacheReader(self, key, f)
+
+    # returns the whole entry, or None if it isn't cached
+    def read(self, key):
+        if key not in self.entries:
+            return None
+        try:
+            with open(self.path(key), "rb") as f:
+                data = f.read()
+        except Exception as e:
+            print(f"[LruFileCache] Error reading {key}, dropping it: {e}")
+            self.remove(key)
+            return None
+        self.touch(key)
+        return data
+
+    def begin_write(self, key):
+        return CacheWriter(self, key)
+
+    def remove(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            return
+        self.total_bytes -= entry["size"]
+        try:
+            os.remove(self.path(key))
+        except Exception as e:
+            print(f"[LruFileCache] Error removing {key}: {e}")
+        self.index_dirty = True
+
+    # removes the least recently used entries until extra_bytes more fit, returns False if they can't
+    def make_room(self, extra_bytes):
+        while self.total_bytes + extra_bytes > self.max_bytes:
+            oldest = None
+            for key in self.entries:
+                if key in self.in_use:
+                    continue
+                if oldest is None or self.entries[key]["used"] < self.entries[oldest]["used"]:
+                    oldest = key
+            if oldest is None:
+                return False
+            print(f"[LruFileCache] Evicting {oldest}")
+            self.remove(oldest)
+        return True
+
+    def add_entry(self, key, size, meta):
+        self.clock += 1
+        self.entries[key] = {"size": size, "used": self.clock, "meta": meta}
+        self.total_bytes += size
+        # written out by flush(), like the last use of entries
+        self.index_dirty = True
+
+
+# async read(size) like async_http.Response, so cached blobs can be streamed the same way as downloads
+class CacheReader:
+    def __init__(self, cache, key, f):
+        self.cache = cache
+        self.key = key
+        self.f = f
+
+    async def read(self, size=READ_SIZE):
+        if self.f is None:
+            return b""
+        data = self.f.read(size)
+        # reading from flash blocks, give the rest of the app a turn between chunks
+        await asyncio.sleep(0)
+        return data
+
+    def close(self):
+        if self.f is not None:
+            self.f.close()
+            self.f = None
+            count = self.cache.in_use.get(self.key, 0) - 1
+            if count > 0:
+                self.cache.in_use[self.key] = count
+            else:
+                self.cache.in_use.pop(self.key, None)
+
+
+# Streams a new entry to a temporary file, which only replaces the cached entry on commit()
+class CacheWriter:
+    def __init__(self, cache, key):
+        self.cache = cache
+        self.key = key
+        self.size = 0
+        self.tmp_path = cache.path(key) + ".tmp"
+        self.f = None
+        try:
+            self.f = open(self.tmp_path, "wb")
+        except Exception as e:
+            print(f"[LruFileCache] Error creating {self.tmp_path}: {e}")
+
+    def write(self, data):
+        if self.f is None:
+            return
+        try:
+            self.f.write(data)
+            self.size += len(data)
+            if self.size > self.cache.max_bytes:
+                print(f"[LruFileCache] {self.key} is larger than the whole cache, not caching it")
+                self.abort()
+        except Exception as e:
+            print(f"[LruFileCache] Error writing {self.key}: {e}")
+            self.abort()
+
+    def commit(self, meta):
+        if self.f is None:
+            return False
+        self.f.close()
+        self.f = None
+        if self.key in self.cache.in_use:
+            # the current entry is being read, keep it
+            self.discard()
+            return False
+        self.cache.remove(self.key)
+        if not self.cache.make_room(self.size):
+            self.discard()
+            return False
+        try:
+            os.rename(self.tmp_path, self.cache.path(self.key))
+        except Exception as e:
+            print(f"[LruFileCache] Error committing {self.key}: {e}")
+            self.discard()
+            return False
+        self.cache.add_entry(self.key, self.size, meta)
+        return True
+
+    def abort(self):
+        if self.f is not None:
+            self.f.close()
+            self.f = None
+        self.discard()
+
+    def discard(self):
+        try:
+            os.remove(self.tmp_path)
+        except OSError:
+            pass
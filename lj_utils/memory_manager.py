@@ -0,0 +1,127 @@
+import gc
+import time
+
+# how long until the next frame is due for a collection to be run, ms
+COLLECT_MIN_IDLE_MS = 40
+# a requested collection runs even without an idle frame after this long, ms
+COLLECT_MAX_DELAY_MS = 3000
+
+
+# Keeps track of the bytes held by the app's caches ("holders", like decoded frames, thumbnails or
+# pages kept for later) against a single budget, evicting the least recently used entries of any
+# holder once it's exceeded. Entries that are in use (a playing animation, the thumbnails on screen)
+# are pinned, they count towards the budget but are never evicted.
+# Collections are requested instead of running gc.collect() inline, and run by update() once there's
+# enough time before the next frame is due:
+#   memory = MemoryManager(256 * 1024)
+#   memory.add_holder("page_cache", lambda key: drop_page(key))
+#   memory.track("page_cache", "popular_2", 9000)
+#   memory.untrack("page_cache", "popular_2")
+#   memory.request_collect()
+#   memory.update(ms_until_next_frame)
+class MemoryManager:
+    def __init__(self, budget_bytes):
+        self.budget_bytes = budget_bytes
+        # holder name -> function called with the key of an entry to evict, the holder frees it
+        self.holders = {}
+        # (holder name, key) -> {"bytes", "used": clock value of the last use, "pinned"}
+        self.entries = {}
+        self.clock = 0
+        self.total_bytes = 0
+        # ticks_ms of the oldest request not collected yet, None if there's none
+        self.collect_requested_at = None
+        self.stats = {"evictions": 0, "evicted_bytes": 0, "collections": 0, "forced_collections": 0}
+        # called with (duration ms, forced) after every collection, see HeapMonitor.record_collection
+        self.on_collect = None
+
+    def add_holder(self, name, evict):
+        self.holders[name] = evict
+
+    # Sets the size of an entry, adding it if it's new, and evicts others if that goes over the budget.
+    # The entry itself is never evicted here, since the caller is about to use it. Returns False if the
+    # total is still over the budget, with nothing else left to evict.
+    def track(self, holder, key, size, pinned=False):
+        entry_key = (holder, key)
+        entry = self.entries.get(entry_key)
+        if entry is not None:
+            self.total_bytes -= entry["bytes"]
+        self.clock += 1
+        self.entries[entry_key] = {"bytes": size, "used": self.clock, "pinned": pinned}
+        self.total_bytes += size
+        if self.total_bytes > self.budget_bytes:
+            self.make_room(entry_key)
+        return self.total_bytes <= self.budget_bytes
+
+    def untrack(self, holder, key):
+        entry = self.entries.pop((holder, key), None)
+        if entry is not None:
+            self.total_bytes -= entry["bytes"]
+
+    def untrack_all(self, holder):
+        for entry_key in list(self.entries):
+            if entry_key[0] == holder:
+                self.untrack(holder, entry_key[1])
+
+    def touch(self, holder, key):
+        entry = self.entries.get((holder, key))
+        if entry is not None:
+            self.clock += 1
+            entry["used"] = self.clock
+
+    def set_pinned(self, holder, key, pinned):
+        entry = self.entries.get((holder, key))
+        if entry is not None:
+            entry["pinned"] = pinned
+
+    # evicts the least recently used unpinned entries, other than keep, until the total fits the budget
+    def make_room(self, keep=None):
+        evicted = False
+        while self.total_bytes > self.budget_bytes:
+            oldest = None
+            for entry_key in self.entries:
+                entry = self.entries[entry_key]
+                if entry["pinned"] or entry_key == keep:
+                    continue
+                if oldest is None or entry["used"] < self.entries[oldest]["used"]:
+                    oldest = entry_key
+            if oldest is None:
+                print(f"[MemoryManager] {self.total_bytes}/{self.budget_bytes} bytes, over budget with nothing left to evict")
+                break
+            holder, key = oldest
+            size = self.entries[oldest]["bytes"]
+            self.untrack(holder, key)
+            print(f"[MemoryManager] Evicting {holder} {key} ({size} bytes)")
+            self.stats["evictions"] += 1
+            self.stats["evicted_bytes"] += size
+            try:
+                self.holders[holder](key)
+            except Exception as e:
+                print(f"[MemoryManager] Error evicting {holder} {key}: {e}")
+            evicted = True
+        if evicted:
+            self.request_collect()
+
+    # asks for a gc.collect() at the next idle frame, for after something big was dropped
+    def request_collect(self):
+        if self.collect_requested_at is None:
+            self.collect_requested_at = time.ticks_ms()
+
+    # runs a requested collection if the next frame isn't due for a while (ms_until_deadline None
+    # means nothing is animating), or if it has been waiting for too long
+    def update(self, ms_until_deadline=None):
+        if self.collect_requested_at is None:
+            return
+        waited_ms = time.ticks_diff(time.ticks_ms(), self.collect_requested_at)
+        idle = ms_until_deadline is None or ms_until_deadline >= COLLECT_MIN_IDLE_MS
+        if not idle and waited_ms < COLLECT_MAX_DELAY_MS:
+            return
+        self.collect_requested_at = None
+        start = time.ticks_ms()
+        gc.collect()
+        duration_ms = time.ticks_diff(time.ticks_ms(), start)
+        self.stats["collections"] += 1
+        if not idle:
+            self.stats["forced_collections"] += 1
+        print(f"[MemoryManager] gc.collect() took {duration_ms}ms, {waited_ms}ms after it was requested{'' if idle else ' (no idle frame)'}")
+        if self.on_collect is not None:
+            self.on_collect(duration_ms, not idle)
@@ -0,0 +1,98 @@
+import array
+import time
+
+# frames of timings kept per utility and phase
+PROFILE_SAMPLE_COUNT = 64
+# a frame (update + update_leds + draw) taking longer than this counts as over budget, ms
+FRAME_BUDGET_MS = 40
+PROFILE_PHASES = ("update", "update_leds", "draw", "frame")
+
+
+# Times the calls UtilityMenuApp makes into the active Utility, keeping the last PROFILE_SAMPLE_COUNT
+# timings of every utility and phase in fixed-size arrays, in microseconds. A frame is everything recorded
+# for a utility since its previous end_frame():
+#   start = profiler.start()
+#   utility.draw(ctx)
+#   profiler.stop("ThumbnailBrowser", "draw", start)
+#   profiler.end_frame("ThumbnailBrowser")
+#   profiler.stats("ThumbnailBrowser", "frame")  # {"min", "avg", "p95", "max", "count"} in ms
+class FrameProfiler:
+    def __init__(self):
+        # utility name -> {phase: {"times": array, "index", "count"}, "frame_us", "frames", "over_budget"}
+        self.utilities = {}
+
+    def utility(self, name):
+        utility = self.utilities.get(name)
+        if utility is None:
+            utility = {"frame_us": 0, "frames": 0, "over_budget": 0}
+            for phase in PROFILE_PHASES:
+                utility[phase] = {"times": array.array("i", [0] * PROFILE_SAMPLE_COUNT), "index": 0, "count": 0}
+            self.utilities[name] = utility
+        return utility
+
+    def start(self):
+        return time.ticks_us()
+
+    def stop(self, name, phase, start):
+        elapsed_us = time.ticks_diff(time.ticks_us(), start)
+        utility = self.utility(name)
+        self.add_time(utility[phase], elapsed_us)
+        utility["frame_us"] += elapsed_us
+
+    def end_frame(self, name):
+        utility = self.utility(name)
+        self.add_time(utility["frame"], utility["frame_us"])
+        utility["frames"] += 1
+        if utility["frame_us"] > FRAME_BUDGET_MS * 1000:
+            utility["over_budget"] += 1
+        utility["frame_us"] = 0
+
+    def add_time(self, timings, elapsed_us):
+        timings["times"][timings["index"]] = elapsed_us
+        timings["index"] = (timings["index"] + 1) % PROFILE_SAMPLE_COUNT
+        timings["count"] = min(timings["count"] + 1, PROFILE_SAMPLE_COUNT)
+
+    # rolling figures over the kept timings, in ms, None if nothing was recorded
+    def stats(self, name, phase):
+        utility = self.utilities.get(name)
+        if utility is None or utility[phase]["count"] == 0:
+            return None
+        timings = utility[phase]
+        times = sorted(timings["times"][:timings["count"]])
+        count = len(times)
+        return {
+            "min": times[0] / 1000,
+            "avg": sum(times) / count / 1000,
+            "p95": times[min(count - 1, count * 95 // 100)] / 1000,
+            "max": times[-1] / 1000,
+            "count": count,
+        }
+
+    def print_stats(self):
+        for name in self.utilities:
+            utility = self.utilities[name]
+            print(f"[FrameProfiler] {name}: {utility['over_budget']}/{utility['frames']} frames over {FRAME_BUDGET_MS}ms")
+            for phase in PROFILE_PHASES:
+                stats = self.stats(name, phase)
+                if stats is not None:
+                    print(f"[FrameProfiler]   {phase:<12} min {stats['min']:.1f} avg {stats['avg']:.1f} p95 {stats['p95']:.1f} max {stats['max']:.1f} ms")
+
+    def draw_overlay(self, ctx, name):
+        ctx.save()
+        ctx.rgba(0, 0, 0, 0.75).rectangle(-105, -70, 210, 140).fill()
+        ctx.font_size = 14
+        ctx.text_align = ctx.LEFT
+        ctx.text_baseline = ctx.TOP
+        ctx.rgb(1, 1, 1)
+        ctx.move_to(-97, -64).text(name)
+        utility = self.utilities.get(name)
+        if utility is not None:
+            ctx.move_to(-97, -48).text(f"{utility['over_budget']}/{utility['frames']} over {FRAME_BUDGET_MS}ms")
+            ctx.move_to(-97, -28).text("ms     min  avg  p95  max")
+            y = -12
+            for phase in PROFILE_PHASES:
+                stats = self.stats(name, phase)
+                if stats is not None:
+                    ctx.move_to(-97, y).text(f"{phase[:6]:<6} {stats['min']:>4.1f} {stats['avg']:>4.1f} {stats['p95']:>4.1f} {stats['max']:>4.1f}")
+                y += 16
+        ctx.restore()
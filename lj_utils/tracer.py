@@ -0,0 +1,155 @@
+import array
+import json
+import time
+
+# spans kept in RAM, the oldest ones are overwritten once it's full
+TRACE_EVENT_COUNT = 2048
+# distinct (category, name) labels kept, spans with new names are recorded as "other" after that
+TRACE_LABEL_COUNT = 256
+OTHER_LABEL = "other"
+
+# the Tracer spans are recorded into, None while tracing is off
+active = None
+
+
+# Records spans (frame calls, asyncio task steps, HTTP requests) into fixed-size arrays, and writes them as
+# Chrome trace-event JSON that chrome://tracing or https://ui.perfetto.dev can open. Each category gets its own
+# row, so task steps and requests show up next to the draws they delayed.
+# Everything goes through the module functions, which do nothing until enable() is called:
+#   tracer.enable()
+#   start = tracer.start_span()
+#   utility.draw(ctx)
+#   tracer.end_span("draw", "ThumbnailBrowser", start)
+#   asyncio.create_task(tracer.trace_task(self.fetch_sequences(), "fetch_sequences"))
+#   tracer.flush(DATA_BASE_PATH + "trace.json")
+class Tracer:
+    def __init__(self, event_count):
+        self.event_count = event_count
+        # microseconds since tracing was enabled, kept as a 64 bit count since ticks_us wraps
+        self.starts = array.array("q", [0] * event_count)
+        self.durations = array.array("i", [0] * event_count)
+        # index into labels
+        self.label_indices = array.array("H", [0] * event_count)
+        # (category, name) of every span recorded so far
+        self.labels = []
+        self.label_lookup = {}
+        self.categories = []
+        self.index = 0
+        self.count = 0
+        self.clock_us = 0
+        self.last_ticks = time.ticks_us()
+
+    # labels are kept for as long as tracing is on, so names must come from a small set (no ids or urls)
+    def label_index(self, category, name):
+        label = (category, name)
+        index = self.label_lookup.get(label)
+        if index is None:
+            if len(self.labels) >= TRACE_LABEL_COUNT and name != OTHER_LABEL:
+                return self.label_index(category, OTHER_LABEL)
+            index = len(self.labels)
+            self.labels.append(label)
+            self.label_lookup[label] = index
+            if category not in self.categories:
+                self.categories.append(category)
+        return index
+
+    # records a span from start (a ticks_us value) until now
+    def record(self, category, name, start):
+        now = time.ticks_us()
+        self.clock_us += time.ticks_diff(now, self.last_ticks)
+        self.last_ticks = now
+        duration = time.ticks_diff(now, start)
+        k = self.index
+        self.starts[k] = self.clock_us - duration
+        self.durations[k] = duration
+        self.label_indices[k] = self.label_index(category, name)
+        self.index = (k + 1) % self.event_count
+        self.count = min(self.count + 1, self.event_count)
+
+    # writes the spans oldest first, one event per line so the whole file is never built in memory
+    def write(self, path):
+        with open(path, "w") as f:
+            f.write('{"displayTimeUnit": "ms", "traceEvents": [\n')
+            for tid in range(len(self.categories)):
+                f.write(json.dumps({"name": "thread_name", "ph": "M", "pid": 1, "tid": tid + 1, "args": {"name": self.categories[tid]}}) + ",\n")
+            start = (self.index - self.count) % self.event_count
+            for i in range(self.count):
+                k = (start + i) % self.event_count
+                category, name = self.labels[self.label_indices[k]]
+                f.write(("" if i == 0 else ",\n") + json.dumps({
+                    "name": name, "cat": category, "ph": "X", "pid": 1, "tid": self.categories.index(category) + 1,
+                    "ts": self.starts[k], "dur": self.durations[k],
+                }))
+            f.write("\n]}\n")
+
+
+# Wraps a coroutine so every step the event loop runs of it is recorded as a span named after the task.
+# Has the methods asyncio needs to run it as a task, on MicroPython and CPython.
+class TracedCoroutine:
+    def __init__(self, coro, name):
+        self.coro = coro
+        self.name = name
+
+    def send(self, value):
+        start = time.ticks_us()
+        try:
+            return self.coro.send(value)
+        finally:
+            end_span("task", self.name, start)
+
+    def throw(self, *args):
+        start = time.ticks_us()
+        try:
+            return self.coro.throw(*args)
+        finally:
+            end_span("task", self.name, start)
+
+    def close(self):
+        return self.coro.close()
+
+    def __await__(self):
+        return self
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return self.send(None)
+
+
+def enable(event_count=TRACE_EVENT_COUNT):
+    global active
+    if active is None:
+        print(f"[Tracer] Tracing enabled, keeping the last {event_count} spans")
+        active = Tracer(event_count)
+
+
+def disable():
+    global active
+    active = None
+
+
+# ticks_us to pass to end_span, None while tracing is off
+def start_span():
+    return time.ticks_us() if active is not None else None
+
+
+def end_span(category, name, start):
+    if active is not None and start is not None:
+        active.record(category, name, start)
+
+
+def trace_task(coro, name):
+    if active is None:
+        return coro
+    return TracedCoroutine(coro, name)
+
+
+def flush(path):
+    if active is None:
+        return
+    print(f"[Tracer] Writing {active.count} spans to {path}")
+    try:
+        active.write(path)
+    except Exception as e:
+        print(f"[Tracer] Error writing trace: {e}")
@@ -0,0 +1,138 @@
+import array
+
+# One sequence of the list, with the fields sent by the server and the ones added on the badge while
+# it's shown and played. Slots instead of a dict per sequence, and frame ids and main colors packed:
+#   frame_ids holds the utf8 frame ids back to back, frame_id_ends the offset after each of them
+#   main_colors holds [r, g, b] triplets, main_color_ends the offset (in colors) after each frame's colors
+class Sequence:
+    __slots__ = (
+        "id", "frame_time_ms", "username", "title", "favorited_by_current_user",
+        "frame_ids", "frame_id_ends", "main_colors", "main_color_ends",
+        # raw thumbnail, or the path of the thumbnail file, or the base64 thumbnail of the list if thumbnail_inline
+        "thumbnail_path", "thumbnail_render_cache", "thumbnail_palette", "thumbnail_base64", "thumbnail_inline",
+        # set by AnimationPlayer.init_sequence_frames while the sequence is played
+        "local_frames", "frame_render_cache", "frame_changes_render_cache", "frame_palette", "frame_palette_rgb", "frame_arena",
+    )
+
+    def __init__(self, sequence_id):
+        self.id = sequence_id
+        self.frame_time_ms = 0
+        self.username = None
+        self.title = None
+        self.favorited_by_current_user = False
+        self.frame_ids = None
+        self.frame_id_ends = None
+        self.main_colors = None
+        self.main_color_ends = None
+        self.thumbnail_path = None
+        self.thumbnail_render_cache = None
+        self.thumbnail_palette = None
+        self.thumbnail_base64 = None
+        self.thumbnail_inline = False
+        self.local_frames = None
+        self.frame_render_cache = None
+        self.frame_changes_render_cache = None
+        self.frame_palette = None
+        self.frame_palette_rgb = None
+        self.frame_arena = None
+
+    def frame_count(self):
+        return len(self.frame_id_ends) if self.frame_id_ends is not None else 0
+
+    def frame_id(self, frame):
+        start = self.frame_id_ends[frame - 1] if frame > 0 else 0
+        return str(self.frame_ids[start:self.frame_id_ends[frame]], "utf-8")
+
+    def set_frame_ids(self, frame_ids):
+        packed = bytearray()
+        ends = array.array("H")
+        for frame_id in frame_ids:
+            packed += frame_id.encode()
+            ends.append(len(packed))
+        self.frame_ids = bytes(packed)
+        self.frame_id_ends = ends
+
+    # list of (r, g, b) of the frame, None if the server didn't send any
+    def frame_main_colors(self, frame):
+        if self.main_color_ends is None or frame >= len(self.main_color_ends):
+            return None
+        start = self.main_color_ends[frame - 1] if frame > 0 else 0
+        colors = []
+        for k in range(start * 3, self.main_color_ends[frame] * 3, 3):
+            colors.append((self.main_colors[k], self.main_colors[k + 1], self.main_colors[k + 2]))
+        return colors
+
+    # colors_per_frame is the frame_main_colors of the JSON list, a list of [r, g, b] lists for every frame
+    def set_main_colors(self, colors_per_frame):
+        if colors_per_frame is None:
+            self.main_colors = None
+            self.main_color_ends = None
+            return
+        packed = bytearray()
+        ends = array.array("H")
+        for colors in colors_per_frame:
+            for color in colors or []:
+                packed.append(color[0])
+                packed.append(color[1])
+                packed.append(color[2])
+            ends.append(len(packed) // 3)
+        self.main_colors = bytes(packed)
+        self.main_color_ends = ends
+
+    # True if the server sent the same sequence for both, the fields added on the badge aren't compared
+    def same_as(self, other):
+        return (
+            self.id == other.id and self.frame_time_ms == other.frame_time_ms
+            and self.username == other.username and self.title == other.title
+            and self.favorited_by_current_user == other.favorited_by_current_user
+            and self.frame_ids == other.frame_ids and packed_ends(self.frame_id_ends) == packed_ends(other.frame_id_ends)
+            and self.main_colors == other.main_colors and packed_ends(self.main_color_ends) == packed_ends(other.main_color_ends)
+        )
+
+    # approximate bytes held by the server fields, not counting the thumbnail
+    def packed_size(self):
+        size = 64 + len(self.id)
+        for value in (self.username, self.title, self.frame_ids, self.main_colors):
+            if value is not None:
+                size += len(value)
+        for ends in (self.frame_id_ends, self.main_color_ends):
+            if ends is not None:
+                size += 2 * len(ends)
+        return size
+
+    # the fields kept with a cached copy of the animation, as json friendly values
+    def cached_fields(self):
+        frames = None
+        if self.frame_id_ends is not None:
+            frames = [self.frame_id(frame) for frame in range(self.frame_count())]
+        frame_main_colors = None
+        if self.main_color_ends is not None:
+            frame_main_colors = [self.frame_main_colors(frame) for frame in range(len(self.main_color_ends))]
+        return {"frames": frames, "frame_time_ms": self.frame_time_ms, "frame_main_colors": frame_main_colors}
+
+    # fills in the fields that are missing from what cached_fields() returned
+    def restore_cached_fields(self, fields):
+        if self.frame_id_ends is None and fields.get("frames") is not None:
+            self.set_frame_ids(fields["frames"])
+        if not self.frame_time_ms and fields.get("frame_time_ms"):
+            self.frame_time_ms = fields["frame_time_ms"]
+        if self.main_color_ends is None and fields.get("frame_main_colors") is not None:
+            self.set_main_colors(fields["frame_main_colors"])
+
+
+def packed_ends(ends):
+    return bytes(ends) if ends is not None else None
+
+
+# builds a Sequence from an item of the JSON sequence list
+def sequence_from_json(item):
+    sequence = Sequence(item.get("id"))
+    sequence.frame_time_ms = item.get("frame_time_ms") or 0
+    sequence.username = item.get("username")
+    sequence.title = item.get("title")
+    sequence.favorited_by_current_user = item.get("favorited_by_current_user", False)
+    if item.get("frames") is not None:
+        sequence.set_frame_ids(item["frames"])
+    sequence.set_main_colors(item.get("frame_main_colors"))
+    sequence.thumbnail_path = item.get("thumbnail_path")
+    return sequence
@@ -0,0 +1,173 @@
+# Decoding for the binary sequence list returned by /api/sequences?...&format=binary
+# Servers that don't support it send the usual JSON list, which starts with "{", so a leading 0 marks the binary format.
+#
+# Header:
+#   [0, version, total_page_count (u16), flags, uuid length (u8), random_uuid utf8...]
+#   flags has NEXT_PAGE_EXISTS set if there's a page after this one.
+# Followed by one record per sequence, until the end of the body:
+#   [record length (u16), id, frame_time_ms (u16), flags, username, title, frame count (u16),
+#    frame ids..., main colors of each frame..., thumbnail length (u16), thumbnail...]
+#   record length counts the bytes after it, fields added in later versions go at the end of the record.
+#   id, username, title and frame ids are [length (u8), utf8...].
+#   main colors of a frame are [color count (u8), r, g, b, r, g, b, ...].
+#   flags has FAVORITED_BY_CURRENT_USER set if the logged in user favorited the sequence.
+#   thumbnail holds the same bytes as the base64 decoded thumbnail_path of the JSON list, a length of 0 means none.
+# u16 values are big endian.
+#
+# Records are decoded into the same Sequence objects as the items of the JSON list (see sequence.py).
+
+import array
+from .sequence import Sequence
+
+SEQUENCE_LIST_MARKER = 0
+SEQUENCE_LIST_VERSION = 1
+HEADER_LENGTH = 6
+NEXT_PAGE_EXISTS = 0x01
+FAVORITED_BY_CURRENT_USER = 0x01
+
+
+def is_sequence_list_blob(data):
+    return len(data) > 0 and data[0] == SEQUENCE_LIST_MARKER
+
+
+def read_u16(data, offset):
+    return (data[offset] << 8) | data[offset + 1]
+
+
+# returns (string, offset after it)
+def read_str(data, offset):
+    length = data[offset]
+    return str(data[offset + 1:offset + 1 + length], "utf-8"), offset + 1 + length
+
+
+# decodes the record body starting at offset into a Sequence, copying frame ids and colors straight into its packed fields
+def decode_sequence_record(data, offset):
+    sequence_id, offset = read_str(data, offset)
+    sequence = Sequence(sequence_id)
+    sequence.frame_time_ms = read_u16(data, offset)
+    sequence.favorited_by_current_user = (data[offset + 2] & FAVORITED_BY_CURRENT_USER) != 0
+    offset += 3
+    sequence.username, offset = read_str(data, offset)
+    sequence.title, offset = read_str(data, offset)
+    frame_count = read_u16(data, offset)
+    offset += 2
+    frame_ids = bytearray()
+    frame_id_ends = array.array("H")
+    for _ in range(frame_count):
+        length = data[offset]
+        frame_ids += data[offset + 1:offset + 1 + length]
+        frame_id_ends.append(len(frame_ids))
+        offset += 1 + length
+    sequence.frame_ids = bytes(frame_ids)
+    sequence.frame_id_ends = frame_id_ends
+    main_colors = bytearray()
+    main_color_ends = array.array("H")
+    for _ in range(frame_count):
+        length = data[offset] * 3
+        main_colors += data[offset + 1:offset + 1 + length]
+        main_color_ends.append(len(main_colors) // 3)
+        offset += 1 + length
+    sequence.main_colors = bytes(main_colors)
+    sequence.main_color_ends = main_color_ends
+    thumbnail_length = read_u16(data, offset)
+    offset += 2
+    if thumbnail_length > 0:
+        sequence.thumbnail_path = bytes(data[offset:offset + thumbnail_length])
+    return sequence
+
+
+# Decodes a binary sequence list as it arrives, handing every sequence to on_item once its record is
+# complete, like lj_utils.json_stream.JsonArrayStream does for the JSON list. finish() returns the header
+# fields as {"total_page_count", "next_page_exists", "random_uuid"}.
+class SequenceListDecoder:
+    def __init__(self, on_item):
+        self.on_item = on_item
+        self.result = None
+        # the header or record split across chunks is assembled here, reused for every record, see FastloadDecoder
+        self.pending = bytearray()
+        self.pending_view = memoryview(self.pending)
+        self.pending_length = 0
+
+    # records that are whole in the chunk are decoded straight from it, one split across chunks is
+    # copied into pending once, a chunk at a time, and decoded when its last chunk arrives
+    def feed(self, chunk):
+        chunk = memoryview(chunk)
+        offset = 0
+        while offset < len(chunk):
+            if self.pending_length > 0:
+                offset = self.assemble(chunk, offset)
+                continue
+            length = self.unit_length(chunk, offset)
+            if length < 0 or offset + length > len(chunk):
+                # everything left belongs to the next record, or it would be whole
+                self.append_pending(chunk[offset:], length)
+                break
+            self.decode_unit(chunk, offset)
+            offset += length
+
+    # adds the start of chunk at offset to the record in pending, decoding it once it's complete, and
+    # returns the offset in chunk after the bytes used
+    def assemble(self, chunk, offset):
+        length = self.unit_length(self.pending_view[:self.pending_length], 0)
+        if length >= 0:
+            used = min(length - self.pending_length, len(chunk) - offset)
+            self.append_pending(chunk[offset:offset + used], length)
+            offset += used
+        else:
+            # not enough yet to tell its length, take the rest of the chunk and look again
+            previous_length = self.pending_length
+            self.append_pending(chunk[offset:], -1)
+            length = self.unit_length(self.pending_view[:self.pending_length], 0)
+            if length < 0 or length > self.pending_length:
+                return len(chunk)
+            # the bytes after it are the next record's, they're read from chunk again
+            offset += length - previous_length
+            self.pending_length = length
+        if self.pending_length == length:
+            self.pending_length = 0
+            self.decode_unit(self.pending_view[:length], 0)
+        return offset
+
+    # copies data to the end of pending, growing it to hold length bytes when that's known
+    def append_pending(self, data, length):
+        needed = self.pending_length + len(data)
+        if needed > len(self.pending):
+            grown = bytearray(max(needed, length, 2 * len(self.pending)))
+            grown[:self.pending_length] = self.pending_view[:self.pending_length]
+            self.pending = grown
+            self.pending_view = memoryview(grown)
+        self.pending_view[self.pending_length:needed] = data
+        self.pending_length = needed
+
+    # length of the header or record at offset, or -1 if there isn't enough data yet to tell
+    def unit_length(self, data, offset):
+        if self.result is None:
+            if offset + HEADER_LENGTH > len(data):
+                return -1
+            return HEADER_LENGTH + data[offset + 5]
+        if offset + 2 > len(data):
+            return -1
+        return 2 + read_u16(data, offset)
+
+    def decode_unit(self, data, offset):
+        if self.result is not None:
+            self.on_item(decode_sequence_record(data, offset + 2))
+            return
+        if data[offset] != SEQUENCE_LIST_MARKER:
+            raise ValueError("not a binary sequence list")
+        if data[offset + 1] != SEQUENCE_LIST_VERSION:
+            raise ValueError(f"unsupported sequence list version: {data[offset + 1]}")
+        random_uuid, _ = read_str(data, offset + 5)
+        self.result = {
+            "total_page_count": read_u16(data, offset + 2),
+            "next_page_exists": (data[offset + 4] & NEXT_PAGE_EXISTS) != 0,
+            "random_uuid": random_uuid,
+        }
+
+    # returns the header fields, raises ValueError if the list was cut short
+    def finish(self):
+        if self.result is None:
+            raise ValueError("sequence list header truncated")
+        if self.pending_length > 0:
+            raise ValueError(f"sequence list truncated: {self.pending_length} bytes of an incomplete record")
+        return self.result
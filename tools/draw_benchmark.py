@@ -0,0 +1,280 @@
+# Measures the per-frame draw cost of every utility on tools/simulator, counting the calls made on the
+# ctx and the wall time of update() + draw(), and compares them with a stored baseline.
+#   python3 tools/draw_benchmark.py                         # compare with tools/draw_benchmark_baseline.json
+#   python3 tools/draw_benchmark.py --output results.json   # also save the results
+#   python3 tools/draw_benchmark.py --update-baseline       # after an intended change
+#   python3 tools/draw_benchmark.py --only ConwaysGameOfLife
+# Exits with 1 if a scenario makes more rgb/rectangle/fill/text calls per frame than the baseline. Call counts
+# are deterministic (random is seeded and the clock simulated). Wall times are desktop CPython ones, only
+# comparable on the same machine and noisy for the cheaper utilities, so getting slower than the baseline is
+# only reported, unless --check-time is given.
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+from http.server import ThreadingHTTPServer
+
+TOOLS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, TOOLS_DIR)
+import stub_server
+from simulator import Simulator, RecordingCtx
+
+BASELINE_PATH = os.path.join(TOOLS_DIR, "draw_benchmark_baseline.json")
+COUNTED_CALLS = ("rgb", "rectangle", "fill", "text")
+GAME_OF_LIFE_CELL_SIZES = [6, 8, 10, 12, 15, 20, 24, 30, 40]
+ANIMATION_SIZES = [16, 32, 64]
+# the badge's frame interval, ms
+FRAME_MS = 33
+# real time given to the stub server's responses after each frame while a utility loads, ms
+IO_WAIT_MS = 2
+SETUP_MAX_FRAMES = 3000
+
+
+class StubServer:
+    def __init__(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), stub_server.StubHandler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def serve(self, sizes, frame_count=12):
+        stub_server.StubHandler.state = stub_server.StubState(stub_server.PAGE_SIZE * 2, sizes, frame_count, True, True, False)
+        stub_server.StubHandler.state.quiet = True
+
+    def shutdown(self):
+        self.server.shutdown()
+
+
+def result_from_frames(frames, wall_ms_total, wall_ms_max, calls):
+    result = {
+        "frames": frames,
+        "wall_ms_avg": round(wall_ms_total / frames, 3),
+        "wall_ms_max": round(wall_ms_max, 3),
+        "calls_per_frame": {},
+    }
+    for method in COUNTED_CALLS:
+        result["calls_per_frame"][method] = round(calls.get(method, 0) / frames, 2)
+    result["calls_per_frame"]["total"] = round(sum(calls.values()) / frames, 2)
+    return result
+
+
+# measures the frames the simulator ran since its stats were reset, for the utility given
+def result_from_simulator(sim, utility):
+    stats = sim.utility_stats[utility]
+    return result_from_frames(stats["frames"], stats["wall_ms"], stats["max_wall_ms"], stats["calls"])
+
+
+def new_simulator(server, sizes):
+    random.seed(0)
+    server.serve(sizes)
+    return Simulator(frame_ms=FRAME_MS, api_base_url=server.url, io_wait_ms=IO_WAIT_MS)
+
+
+def setup_failed(name, sim):
+    sim.close()
+    raise RuntimeError(f"{name}: the utility didn't get into the state to measure within {SETUP_MAX_FRAMES} frames")
+
+
+def bench_main_menu(server, frames):
+    sim = new_simulator(server, [16])
+    sim.step(5)
+    sim.reset_stats()
+    sim.step(frames)
+    results = {"MainMenu": result_from_simulator(sim, "MainMenu")}
+    sim.close()
+    return results
+
+
+def bench_game_of_life(server, frames):
+    sim = new_simulator(server, [16])
+    sim.set_screen("Game of Life")
+    game = sim.app.utilities["Game of Life"]
+    results = {}
+    # UP goes through the cell sizes in order, starting after the default one
+    for _ in GAME_OF_LIFE_CELL_SIZES:
+        sim.tap("UP")
+        sim.step(2)
+        sim.reset_stats()
+        sim.step(frames)
+        results[f"ConwaysGameOfLife/cell_{game.cell_size}"] = result_from_simulator(sim, "ConwaysGameOfLife")
+    sim.close()
+    return dict(sorted(results.items(), key=lambda item: int(item[0].split("_")[-1])))
+
+
+def thumbnails_loaded(browser):
+    if browser.is_loading_sequences_list or browser.sequences is None or len(browser.sequences) == 0:
+        return False
+    for seq in browser.sequences:
+        if seq.thumbnail_path is None:
+            return False
+    return True
+
+
+# nothing left in the background that changes what's drawn: the next page has been prefetched and the
+# Wi-Fi notifications are gone
+def thumbnails_settled(sim, browser):
+    prefetch = browser.page_prefetch
+    return thumbnails_loaded(browser) and prefetch is not None and prefetch['sequences'] is not None and len(sim.app.notifications) == 0
+
+
+def bench_thumbnail_browser(server, frames):
+    sim = new_simulator(server, [16, 32])
+    sim.set_screen("Pixel Art")
+    browser = sim.app.animation_app.thumbnail_browser
+    if not sim.step_until(lambda: thumbnails_settled(sim, browser), SETUP_MAX_FRAMES):
+        setup_failed("ThumbnailBrowser", sim)
+    results = {}
+    sim.reset_stats()
+    sim.step(frames)
+    results["ThumbnailBrowser/idle"] = result_from_simulator(sim, "ThumbnailBrowser")
+    sim.reset_stats()
+    # down a row every 10 frames, DOWN wraps around to the top of the page (UP changes the sort mode instead)
+    for _ in range(frames // 10):
+        sim.tap("DOWN")
+        sim.step(10)
+    results["ThumbnailBrowser/scrolling"] = result_from_simulator(sim, "ThumbnailBrowser")
+    sim.close()
+    return results
+
+
+def bench_animation_player(server, frames):
+    results = {}
+    for size in ANIMATION_SIZES:
+        sim = new_simulator(server, [size])
+        sim.set_screen("Pixel Art")
+        browser = sim.app.animation_app.thumbnail_browser
+        player = sim.app.animation_app.animation_player
+        if not sim.step_until(lambda: thumbnails_loaded(browser), SETUP_MAX_FRAMES):
+            setup_failed(f"AnimationPlayer/{size}px", sim)
+        sim.tap("CONFIRM")
+        sim.step(2)
+        if not sim.step_until(lambda: player.current_sequence is not None and not player.downloading, SETUP_MAX_FRAMES):
+            setup_failed(f"AnimationPlayer/{size}px", sim)
+        # the first loop fills the render caches
+        sim.step(60)
+        sim.reset_stats()
+        sim.step(frames)
+        results[f"AnimationPlayer/{size}px"] = result_from_simulator(sim, "AnimationPlayer")
+        sim.close()
+    return results
+
+
+# runs a component that isn't a utility on its own, for as many frames as given
+def measure_component(update, draw, frames):
+    ctx = RecordingCtx()
+    wall_ms_total = 0
+    wall_ms_max = 0
+    calls = {}
+    for _ in range(frames):
+        ctx.reset()
+        start = time.perf_counter()
+        update(FRAME_MS)
+        draw(ctx)
+        wall_ms = (time.perf_counter() - start) * 1000
+        wall_ms_total += wall_ms
+        wall_ms_max = max(wall_ms_max, wall_ms)
+        for method in ctx.counts:
+            calls[method] = calls.get(method, 0) + ctx.counts[method]
+    return result_from_frames(frames, wall_ms_total, wall_ms_max, calls)
+
+
+def bench_components(server, frames):
+    sim = new_simulator(server, [16])
+    from pixelbadge.lj_utils.lj_notification import Notification
+    from pixelbadge.lj_utils.lj_button_labels import ButtonLabels
+    results = {}
+    notification = Notification("Wi-Fi Connection Failed", open=True, animate_duration=200, display_time=1000)
+    # opening, shown, and closing again
+    results["Notification"] = measure_component(notification.update, notification.draw, (1000 + 600) // FRAME_MS)
+    labels = ButtonLabels(sim.app, labels={"LEFT": "Left", "RIGHT": "Right", "UP": "Up", "DOWN": "Down", "CANCEL": "Cancel", "CONFIRM": "Confirm"})
+    labels.reset()
+    results["ButtonLabels"] = measure_component(labels.update, labels.draw, frames)
+    sim.close()
+    return results
+
+
+BENCHMARKS = {
+    "MainMenu": bench_main_menu,
+    "ConwaysGameOfLife": bench_game_of_life,
+    "ThumbnailBrowser": bench_thumbnail_browser,
+    "AnimationPlayer": bench_animation_player,
+    "Components": bench_components,
+}
+
+
+# returns (call count regressions, wall time regressions) of results against baseline, as lines to print
+def compare(results, baseline, call_tolerance, time_tolerance, time_floor_ms):
+    regressions = []
+    slower = []
+    print(f"{'scenario':<32} {'calls':>8} {'baseline':>9} {'ms':>8} {'baseline':>9}")
+    for name in results:
+        result = results[name]
+        calls = result["calls_per_frame"]["total"]
+        base = baseline.get(name)
+        if base is None:
+            print(f"{name:<32} {calls:>8.1f} {'-':>9} {result['wall_ms_avg']:>8.3f} {'-':>9}  (new)")
+            continue
+        print(f"{name:<32} {calls:>8.1f} {base['calls_per_frame']['total']:>9.1f} {result['wall_ms_avg']:>8.3f} {base['wall_ms_avg']:>9.3f}")
+        for method in COUNTED_CALLS + ("total",):
+            before = base["calls_per_frame"].get(method, 0)
+            after = result["calls_per_frame"].get(method, 0)
+            if after > before * (1 + call_tolerance) + 0.01:
+                regressions.append(f"{name}: {method} calls per frame {before} -> {after}")
+        if result["wall_ms_avg"] > base["wall_ms_avg"] * (1 + time_tolerance) and result["wall_ms_avg"] - base["wall_ms_avg"] > time_floor_ms:
+            slower.append(f"{name}: wall time per frame {base['wall_ms_avg']}ms -> {result['wall_ms_avg']}ms")
+    return regressions, slower
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-frame draw cost of every utility, compared with a baseline")
+    parser.add_argument("--frames", type=int, default=120, help="frames measured per scenario")
+    parser.add_argument("--only", action="append", choices=list(BENCHMARKS), help="run only these benchmarks")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--output", help="write the results as JSON here")
+    parser.add_argument("--update-baseline", action="store_true", help="store the results as the new baseline")
+    parser.add_argument("--call-tolerance", type=float, default=0.0, help="allowed increase of calls per frame, 0.05 is 5%%")
+    parser.add_argument("--time-tolerance", type=float, default=0.5, help="allowed increase of wall time per frame, 0.5 is 50%%")
+    parser.add_argument("--time-floor-ms", type=float, default=0.5, help="increases of wall time per frame smaller than this are ignored")
+    parser.add_argument("--check-time", action="store_true", help="fail on wall time regressions too")
+    args = parser.parse_args()
+
+    server = StubServer()
+    scenarios = {}
+    try:
+        for name in args.only or BENCHMARKS:
+            scenarios.update(BENCHMARKS[name](server, args.frames))
+    finally:
+        server.shutdown()
+    results = {"frame_ms": FRAME_MS, "frames": args.frames, "python": sys.version.split()[0], "scenarios": scenarios}
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=1)
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)["scenarios"]
+    regressions, slower = compare(scenarios, baseline, args.call_tolerance, args.time_tolerance, args.time_floor_ms)
+    if args.check_time:
+        regressions += slower
+    else:
+        for line in slower:
+            print("SLOWER " + line)
+    if args.update_baseline:
+        if args.only and os.path.exists(args.baseline):
+            # keep the scenarios that weren't run
+            baseline.update(scenarios)
+            results["scenarios"] = baseline
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=1)
+        print(f"Saved the baseline to {args.baseline}")
+        return
+    for regression in regressions:
+        print("REGRESSION " + regression)
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+# Runs lj_utils/async_http.py against tools/stub_server.py on a desktop python, checking that
+# requests complete correctly and that the event loop keeps running while they're in flight.
+#   python3 tools/http_client_check.py
+import asyncio
+import os
+import sys
+import tempfile
+import threading
+import time
+from http.server import ThreadingHTTPServer
+
+TOOLS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, TOOLS_DIR)
+sys.path.insert(0, os.path.join(TOOLS_DIR, ".."))
+import stub_server
+
+# MicroPython's tick functions, used by the client
+if not hasattr(time, "ticks_ms"):
+    time.ticks_ms = lambda: int(time.monotonic() * 1000)
+    time.ticks_diff = lambda a, b: a - b
+
+from lj_utils import async_http
+from lj_utils.lru_file_cache import LruFileCache
+
+failures = []
+
+
+def check(name, condition, detail=""):
+    print(("PASS " if condition else "FAIL ") + name + (f" ({detail})" if detail else ""))
+    if not condition:
+        failures.append(name)
+
+
+def start_server(latency):
+    stub_server.StubHandler.state = stub_server.StubState(12, [16, 32], 8, True, True, False)
+    stub_server.StubHandler.state.quiet = True
+    stub_server.StubHandler.latency = latency
+    server = ThreadingHTTPServer(("127.0.0.1", 0), stub_server.StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+async def run_checks(base_url, latency):
+    http = async_http.HttpSession()
+    response = await http.get(base_url + "/api/sequences?page=1&sort=new")
+    check("get json", response.status_code == 200 and len(response.json()["sequences"]) == 9)
+
+    response = await http.get(base_url + "/api/sequences?page=1", json={"list": ["seq1"]})
+    check("get with json body", response.status_code == 200)
+
+    response = await http.get(base_url + "/api/sequence/seq1/thumbnail?fallback=true")
+    expected = stub_server.StubHandler.state.thumbnail(stub_server.StubHandler.state.by_id["seq1"])
+    check("get binary", response.content == expected, f"{len(response.content)} bytes")
+
+    response = await http.post(base_url + "/api/get_login_code", json={"badge_uuid": None})
+    check("post json", response.status_code == 200 and response.json()["code"] == "123456")
+
+    response = await http.get(base_url + "/api/does_not_exist")
+    check("404", response.status_code == 404)
+
+    url = base_url + "/images/seq1/frame0?fallback=true&fastload=true&palette=true&delta=true"
+    full = (await http.get(url)).content
+    response = await http.get(url, stream=True)
+    chunks = []
+    while True:
+        chunk = await response.read(100)
+        if not chunk:
+            break
+        chunks.append(chunk)
+    response.close()
+    check("streamed body", b"".join(chunks) == full and len(chunks) > 1, f"{len(chunks)} chunks")
+
+    # the loop has to keep ticking while several slow requests are in flight
+    ticks = 0
+    running = True
+
+    async def ticker():
+        nonlocal ticks
+        while running:
+            ticks += 1
+            await asyncio.sleep(0.005)
+
+    ticker_task = asyncio.create_task(ticker())
+    requests = [http.get(base_url + f"/api/sequence/seq{i}/thumbnail") for i in range(4)]
+    start = asyncio.get_event_loop().time()
+    responses = await asyncio.gather(*requests)
+    elapsed = asyncio.get_event_loop().time() - start
+    running = False
+    await ticker_task
+    check("concurrent requests", all(r.status_code == 200 for r in responses))
+    check("loop not blocked", ticks >= int(latency / 0.005 * 0.5), f"{ticks} ticks in {elapsed:.2f}s")
+    check("requests overlap", elapsed < latency * 3, f"{elapsed:.2f}s for 4 requests with {latency}s latency")
+    http.close()
+
+    # sequential requests share one connection and one DNS lookup
+    http = async_http.HttpSession()
+    for i in range(5):
+        response = await http.get(base_url + f"/api/sequence/seq{i}/thumbnail")
+    check("keep-alive reuse", http.stats["connections"] == 1 and http.stats["reused"] == 4, str(http.stats))
+    check("dns cached", http.stats["dns_lookups"] == 1)
+    check("timings", response.timings["reused"] and response.timings["handshake_ms"] == 0, str(response.timings))
+
+    # a streamed response that isn't read to the end can't be reused
+    response = await http.get(url, stream=True)
+    await response.read(10)
+    response.close()
+    response = await http.get(base_url + "/api/sequence/seq1/thumbnail")
+    check("partial stream not reused", http.stats["connections"] == 2 and response.content == expected)
+
+    # the server closes idle connections, the next request has to reconnect
+    http.close()
+    stub_server.StubHandler.timeout = 0.1
+    response = await http.get(base_url + "/api/sequence/seq1/thumbnail")
+    await asyncio.sleep(0.3)
+    response = await http.post(base_url + "/api/get_login_code", json={"badge_uuid": None})
+    check("reconnect after server close", response.status_code == 200 and http.stats["reconnects"] == 1, str(http.stats))
+    stub_server.StubHandler.timeout = 30
+
+    stub_server.StubHandler.chunked = True
+    response = await http.get(base_url + "/api/sequence/seq1/thumbnail")
+    chunked_content = response.content
+    response = await http.get(url, stream=True)
+    chunks = []
+    while True:
+        chunk = await response.read(300)
+        if not chunk:
+            break
+        chunks.append(chunk)
+    response.close()
+    stub_server.StubHandler.chunked = False
+    response = await http.get(base_url + "/api/sequences?page=1")
+    check("chunked body", chunked_content == expected and b"".join(chunks) == full)
+    check("reuse after chunked body", response.status_code == 200 and response.timings["reused"], str(http.stats))
+    http.close()
+
+    # conditional requests, served from the validator cache on a 304
+    with tempfile.TemporaryDirectory() as cache_dir:
+        http = async_http.HttpSession(validator_cache=LruFileCache(cache_dir + "/", 64 * 1024))
+        list_url = base_url + "/api/sequences?page=1&sort=popular"
+        first = await http.get(list_url, revalidate=True)
+        second = await http.get(list_url, revalidate=True)
+        check("304 served from cache", second.status_code == 200 and second.from_cache and second.json() == first.json(), str(http.stats))
+        check("bytes saved", http.stats["bytes_saved"] == len(first.content) and http.cache_hit_rate() == 1)
+        response = await http.get(url, stream=True, revalidate=True)
+        while await response.read(100):
+            pass
+        response.close()
+        response = await http.get(url, stream=True, revalidate=True)
+        chunks = []
+        while True:
+            chunk = await response.read(100)
+            if not chunk:
+                break
+            chunks.append(chunk)
+        response.close()
+        check("streamed 304", response.from_cache and b"".join(chunks) == full)
+        # a new session with the same cache directory still has the validators
+        http.validator_cache.flush()
+        http = async_http.HttpSession(validator_cache=LruFileCache(cache_dir + "/", 64 * 1024))
+        response = await http.get(list_url, revalidate=True)
+        check("validators persist", response.from_cache and response.json() == first.json())
+        stub_server.StubHandler.validators = False
+        response = await http.get(list_url, revalidate=True)
+        stub_server.StubHandler.validators = True
+        check("200 without validators", response.status_code == 200 and not response.from_cache and response.json() == first.json())
+        http.close()
+
+
+def main():
+    latency = 0.2
+    server, base_url = start_server(latency)
+    try:
+        asyncio.run(run_checks(base_url, latency))
+    finally:
+        server.shutdown()
+    if failures:
+        print(f"{len(failures)} check(s) failed")
+        sys.exit(1)
+    print("All checks passed")
+
+
+if __name__ == "__main__":
+    main()
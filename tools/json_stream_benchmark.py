@@ -0,0 +1,109 @@
+# Compares the peak heap of parsing /api/sequences responses with json.loads (after reading the whole
+# body, like Response.read_all) against lj_utils/json_stream.py fed in socket sized chunks, on a desktop python.
+#   python3 tools/json_stream_benchmark.py                      # pages recorded from tools/stub_server.py
+#   python3 tools/json_stream_benchmark.py page1.json page2.json
+#   python3 tools/json_stream_benchmark.py --record "https://<server>/api/sequences?page=1&sort=popular&fallback=true" page1.json
+# Heap figures come from tracemalloc, so they're CPython object sizes rather than MicroPython ones,
+# but the difference between the two approaches carries over.
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+import urllib.request
+from http.server import ThreadingHTTPServer
+
+TOOLS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, TOOLS_DIR)
+sys.path.insert(0, os.path.join(TOOLS_DIR, ".."))
+import stub_server
+
+from lj_utils.json_stream import JsonArrayStream
+
+CHUNK_SIZE = 1024
+
+
+def chunks(payload):
+    for k in range(0, len(payload), CHUNK_SIZE):
+        yield payload[k:k + CHUNK_SIZE]
+
+
+def parse_with_json_loads(payload):
+    # what Response.read_all + Response.json do
+    body = b"".join(list(chunks(payload)))
+    result = json.loads(body)
+    return result["sequences"]
+
+
+def parse_with_json_stream(payload):
+    sequences = []
+    parser = JsonArrayStream("sequences", sequences.append)
+    for chunk in chunks(payload):
+        parser.feed(chunk)
+    parser.finish()
+    return sequences
+
+
+# returns (peak bytes while parsing, bytes still held by the parsed sequences, ms)
+def measure(parse, payload):
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    start_bytes = tracemalloc.get_traced_memory()[0]
+    start = time.perf_counter()
+    sequences = parse(payload)
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del sequences
+    return peak - start_bytes, current - start_bytes, elapsed_ms
+
+
+def record_stub_pages(page_count):
+    stub_server.StubHandler.state = stub_server.StubState(stub_server.PAGE_SIZE * page_count, [16, 32], 8, True, True, True)
+    stub_server.StubHandler.state.quiet = True
+    server = ThreadingHTTPServer(("127.0.0.1", 0), stub_server.StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    payloads = []
+    for page in range(1, page_count + 1):
+        url = f"http://127.0.0.1:{server.server_address[1]}/api/sequences?page={page}&sort=popular&fallback=true"
+        with urllib.request.urlopen(url) as response:
+            payloads.append((f"stub page {page}", response.read()))
+    server.shutdown()
+    return payloads
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Peak heap of json.loads vs lj_utils.json_stream")
+    parser.add_argument("payloads", nargs="*", help="recorded /api/sequences responses")
+    parser.add_argument("--record", nargs=2, metavar=("URL", "FILE"), help="save a response to FILE and exit")
+    parser.add_argument("--stub-pages", type=int, default=2, help="pages to record from the stub server if no payloads are given")
+    args = parser.parse_args()
+
+    if args.record:
+        with urllib.request.urlopen(args.record[0]) as response, open(args.record[1], "wb") as f:
+            f.write(response.read())
+        print(f"Saved {args.record[0]} to {args.record[1]}")
+        return
+
+    if args.payloads:
+        payloads = []
+        for path in args.payloads:
+            with open(path, "rb") as f:
+                payloads.append((path, f.read()))
+    else:
+        payloads = record_stub_pages(args.stub_pages)
+
+    print(f"{'payload':<24} {'bytes':>8} {'method':<12} {'peak':>9} {'retained':>9} {'ms':>7}")
+    for name, payload in payloads:
+        if parse_with_json_loads(payload) != parse_with_json_stream(payload):
+            print(f"{name}: json_stream result differs from json.loads")
+            sys.exit(1)
+        for method, parse in (("json.loads", parse_with_json_loads), ("json_stream", parse_with_json_stream)):
+            peak, retained, elapsed_ms = measure(parse, payload)
+            print(f"{name:<24} {len(payload):>8} {method:<12} {peak:>9} {retained:>9} {elapsed_ms:>7.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+# Compares the heap held by a full page of the sequence list as the dicts of json.loads against
+# the Sequence objects of sequence.py, on a desktop python.
+#   python3 tools/sequence_memory_benchmark.py                  # a page generated by tools/stub_server.py
+#   python3 tools/sequence_memory_benchmark.py --frames 60      # longer animations
+#   python3 tools/sequence_memory_benchmark.py page1.json       # a recorded /api/sequences response
+# Thumbnails are left out of both, they take the same space either way. Heap figures come from
+# tracemalloc, so they're CPython object sizes rather than MicroPython ones.
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+TOOLS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, TOOLS_DIR)
+sys.path.insert(0, os.path.join(TOOLS_DIR, ".."))
+import stub_server
+
+from sequence import sequence_from_json
+
+
+def stub_page(frame_count):
+    state = stub_server.StubState(stub_server.PAGE_SIZE, [16, 32], frame_count, True, True, False)
+    items = [seq["metadata"] for seq in state.sequences]
+    return json.dumps({"sequences": items}).encode()
+
+
+# returns the bytes still allocated by whatever build(text) returns, and how long it took
+def measure(build, text):
+    tracemalloc.start()
+    start_bytes = tracemalloc.get_traced_memory()[0]
+    start = time.perf_counter()
+    value = build(text)
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    held = tracemalloc.get_traced_memory()[0] - start_bytes
+    tracemalloc.stop()
+    del value
+    return held, elapsed_ms
+
+
+def without_thumbnails(text):
+    items = json.loads(text)["sequences"]
+    for item in items:
+        item.pop("thumbnail_path", None)
+    return json.dumps({"sequences": items}).encode()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Heap held by a page of sequence dicts vs Sequence objects")
+    parser.add_argument("payload", nargs="?", help="recorded /api/sequences response")
+    parser.add_argument("--frames", type=int, default=12, help="frames per animation of the generated page")
+    args = parser.parse_args()
+
+    if args.payload:
+        with open(args.payload, "rb") as f:
+            text = without_thumbnails(f.read())
+    else:
+        text = stub_page(args.frames)
+    count = len(json.loads(text)["sequences"])
+
+    dicts, dicts_ms = measure(lambda t: json.loads(t)["sequences"], text)
+    # the dicts of json.loads are only held while each Sequence is built
+    objects, objects_ms = measure(lambda t: [sequence_from_json(item) for item in json.loads(t)["sequences"]], text)
+    print(f"{count} sequences, {len(text)} bytes of JSON")
+    print(f"dicts      {dicts:>8} bytes  {dicts // count:>6} per sequence  {dicts_ms:>6.1f} ms")
+    print(f"Sequence   {objects:>8} bytes  {objects // count:>6} per sequence  {objects_ms:>6.1f} ms")
+    print(f"saved      {dicts - objects:>8} bytes ({(dicts - objects) * 100 // dicts}%)")
+
+
+if __name__ == "__main__":
+    main()
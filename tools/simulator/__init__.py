@@ -0,0 +1,3 @@
+from .simulator import Simulator, load_app_package, DEFAULT_FRAME_MS
+from .recording_ctx import RecordingCtx
+from .clock import SimClock
@@ -0,0 +1,72 @@
+# Steps every screen of the app headless against tools/stub_server.py and prints the wall time and draw
+# calls per frame of each utility, exiting with 1 if any of them raised.
+#   python3 tools/simulator                                  # every screen, 200 frames each
+#   python3 tools/simulator --screen "Pixel Art" --frames 600 --press 300:DOWN --press 320:CONFIRM
+#   python3 tools/simulator --api https://badge.pixelbadge.xyz --no-wifi
+import argparse
+import os
+import sys
+import threading
+import traceback
+from http.server import ThreadingHTTPServer
+
+TOOLS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, TOOLS_DIR)
+import stub_server
+from simulator import Simulator, DEFAULT_FRAME_MS
+
+
+def start_stub_server():
+    stub_server.StubHandler.state = stub_server.StubState(20, [16, 32], 12, True, True, False)
+    stub_server.StubHandler.state.quiet = True
+    server = ThreadingHTTPServer(("127.0.0.1", 0), stub_server.StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the app headless and measure every utility")
+    parser.add_argument("--screen", action="append", help="screen to run (a key of UtilityMenuApp.utilities), all of them if not given")
+    parser.add_argument("--frames", type=int, default=200, help="frames to run each screen for")
+    parser.add_argument("--frame-ms", type=int, default=DEFAULT_FRAME_MS)
+    parser.add_argument("--press", action="append", default=[], metavar="FRAME:BUTTON", help="tap a button at a frame of each screen")
+    parser.add_argument("--api", help="api_base_url to use instead of a local stub server")
+    parser.add_argument("--no-wifi", action="store_true", help="run with Wi-Fi disconnected")
+    parser.add_argument("--io-wait-ms", type=float, default=1, help="real time given to network tasks after each frame")
+    args = parser.parse_args()
+
+    server = None
+    api_base_url = args.api
+    if api_base_url is None:
+        server, api_base_url = start_stub_server()
+    sim = Simulator(frame_ms=args.frame_ms, api_base_url=api_base_url, wifi_connected=not args.no_wifi, io_wait_ms=args.io_wait_ms)
+    screens = args.screen or [screen for screen in sim.app.utilities if screen != "main"] + ["main"]
+    failed = False
+    for screen in screens:
+        print(f"[simulator] {screen}")
+        try:
+            sim.set_screen(screen)
+            start_frame = sim.frame
+            for press in args.press:
+                frame, button = press.split(":")
+                sim.schedule(start_frame + int(frame), "press", button)
+                sim.schedule(start_frame + int(frame) + 1, "release", button)
+            sim.step(args.frames)
+        except Exception:
+            traceback.print_exc()
+            failed = True
+    stats = sim.stats()
+    sim.close()
+    if server is not None:
+        server.shutdown()
+
+    print(f"{'utility':<32} {'frames':>7} {'avg ms':>8} {'max ms':>8}  calls per frame")
+    for name in stats:
+        utility = stats[name]
+        calls = ", ".join(f"{method} {count:.1f}" for method, count in utility["calls_per_frame"].items())
+        print(f"{name:<32} {utility['frames']:>7} {utility['avg_ms']:>8.2f} {utility['max_ms']:>8.2f}  {calls}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,27 @@
+import time
+
+
+# MicroPython's tick functions on a clock that only moves when advance() is called, so a run of the simulator
+# does the same thing every time. install() puts them on the time module, where the app code looks for them.
+class SimClock:
+    def __init__(self):
+        self.now_us = 0
+
+    def advance(self, ms):
+        self.now_us += int(ms * 1000)
+
+    def ticks_ms(self):
+        return self.now_us // 1000
+
+    def ticks_us(self):
+        return self.now_us
+
+    def ticks_cpu(self):
+        return self.now_us
+
+    def install(self):
+        time.ticks_ms = self.ticks_ms
+        time.ticks_us = self.ticks_us
+        time.ticks_cpu = self.ticks_cpu
+        time.ticks_diff = lambda end, start: end - start
+        time.ticks_add = lambda ticks, delta: ticks + delta
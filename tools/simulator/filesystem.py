@@ -0,0 +1,40 @@
+import builtins
+import os
+
+# os functions the app uses with badge paths
+REDIRECTED_OS_FUNCTIONS = ("listdir", "mkdir", "remove", "rename", "rmdir", "stat")
+
+
+# Maps the badge's absolute paths (like /data/pixelbadge/ or /apps/pixelbadge/) to desktop directories for
+# open() and the os functions the app uses, so it reads its images from the repo and writes its data to a
+# scratch directory instead of the desktop's root.
+class PathRedirect:
+    def __init__(self, mapping):
+        # badge path prefix -> desktop directory, longest prefixes are matched first
+        self.mapping = sorted(mapping.items(), key=lambda item: -len(item[0]))
+        self.originals = {}
+
+    def map_path(self, path):
+        if isinstance(path, str):
+            for prefix, directory in self.mapping:
+                if path == prefix.rstrip("/") or path.startswith(prefix):
+                    return os.path.join(directory, path[len(prefix):])
+        return path
+
+    def wrap(self, function):
+        def redirected(*args, **kwargs):
+            return function(*[self.map_path(arg) for arg in args], **kwargs)
+        return redirected
+
+    def install(self):
+        self.originals["open"] = builtins.open
+        builtins.open = self.wrap(builtins.open)
+        for name in REDIRECTED_OS_FUNCTIONS:
+            self.originals[name] = getattr(os, name)
+            setattr(os, name, self.wrap(getattr(os, name)))
+
+    def uninstall(self):
+        if "open" in self.originals:
+            builtins.open = self.originals.pop("open")
+        for name in list(self.originals):
+            setattr(os, name, self.originals.pop(name))
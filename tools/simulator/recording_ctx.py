@@ -0,0 +1,50 @@
+# Stand-in for the badge's ctx that draws nothing and counts every call made on it, optionally keeping
+# the calls with their arguments:
+#   ctx = RecordingCtx(keep_calls=True)
+#   utility.draw(ctx)
+#   ctx.counts["rectangle"], ctx.calls[0]  # ("rgb", (1, 1, 1))
+# Like the real one, drawing methods return the ctx so they can be chained.
+DRAW_METHODS = (
+    "rgb", "rgba", "rectangle", "round_rectangle", "arc", "move_to", "line_to", "begin_path", "close_path",
+    "fill", "stroke", "text", "image", "save", "restore", "translate", "rotate", "scale",
+)
+
+
+class RecordingCtx:
+    LEFT = "left"
+    RIGHT = "right"
+    CENTER = "center"
+    TOP = "top"
+    BOTTOM = "bottom"
+    MIDDLE = "middle"
+    ALPHABETIC = "alphabetic"
+
+    def __init__(self, keep_calls=False):
+        self.keep_calls = keep_calls
+        self.font_size = 10
+        self.text_align = self.LEFT
+        self.text_baseline = self.ALPHABETIC
+        self.line_width = 1
+        self.image_smoothing = True
+        self.global_alpha = 1
+        self.reset()
+
+    def reset(self):
+        self.counts = {}
+        self.calls = []
+
+    def record(self, name, args):
+        self.counts[name] = self.counts.get(name, 0) + 1
+        if self.keep_calls:
+            self.calls.append((name, args))
+        return self
+
+    # roughly what the badge's font measures, text is laid out by its width in a few places
+    def text_width(self, text):
+        self.record("text_width", (text,))
+        return len(text) * self.font_size * 0.55
+
+    def __getattr__(self, name):
+        if name not in DRAW_METHODS:
+            raise AttributeError(name)
+        return lambda *args: self.record(name, args)
@@ -0,0 +1,179 @@
+import asyncio
+import importlib.util
+import os
+import sys
+import tempfile
+import time
+
+from .clock import SimClock
+from .filesystem import PathRedirect
+from .recording_ctx import RecordingCtx
+
+SIMULATOR_DIR = os.path.dirname(os.path.abspath(__file__))
+STUBS_DIR = os.path.join(SIMULATOR_DIR, "stubs")
+REPO_DIR = os.path.abspath(os.path.join(SIMULATOR_DIR, "..", ".."))
+# the app's modules import each other relatively, so the repo is loaded as a package under this name
+PACKAGE_NAME = "pixelbadge"
+# the badge redraws about this often
+DEFAULT_FRAME_MS = 33
+
+
+# Imports the repo as the pixelbadge package, with the firmware modules replaced by the ones in stubs/
+def load_app_package():
+    if PACKAGE_NAME in sys.modules:
+        return sys.modules[PACKAGE_NAME]
+    if STUBS_DIR in sys.path:
+        sys.path.remove(STUBS_DIR)
+    # ahead of the repo, whose app.py would otherwise shadow the firmware's app module
+    sys.path.insert(0, STUBS_DIR)
+    spec = importlib.util.spec_from_file_location(PACKAGE_NAME, os.path.join(REPO_DIR, "__init__.py"), submodule_search_locations=[REPO_DIR])
+    package = importlib.util.module_from_spec(spec)
+    sys.modules[PACKAGE_NAME] = package
+    spec.loader.exec_module(package)
+    return package
+
+
+# Runs UtilityMenuApp on a desktop python, doing what the badge's scheduler does: each step() advances a
+# simulated clock by frame_ms, delivers the scripted button presses, calls update() and draw() with a
+# RecordingCtx, then lets the asyncio tasks the app started run a step.
+#   sim = Simulator(api_base_url="http://127.0.0.1:8080")
+#   sim.set_screen("Game of Life")
+#   sim.schedule(10, "press", "DOWN")
+#   sim.schedule(12, "release", "DOWN")
+#   sim.step(100)
+#   sim.stats()  # per utility frames, wall time and draw calls
+# The tick functions the app uses only move with the simulated clock, so frame callbacks run the same every
+# time. Tasks waiting on the network or asyncio.sleep() still follow real time, give them io_wait_ms per frame.
+class Simulator:
+    def __init__(self, frame_ms=DEFAULT_FRAME_MS, data_dir=None, api_base_url=None, wifi_connected=True, accept_disclaimer=True, io_wait_ms=0):
+        self.frame_ms = frame_ms
+        self.io_wait_ms = io_wait_ms
+        self.clock = SimClock()
+        self.clock.install()
+        if data_dir is None:
+            data_dir = tempfile.mkdtemp(prefix="pixelbadge_sim_")
+        self.data_dir = data_dir
+        # the app writes thumbnails and frames under its own directory, only its images are read from the repo
+        os.makedirs(os.path.join(data_dir, "apps", "pixelbadge"), exist_ok=True)
+        self.paths = PathRedirect({
+            "/data/": os.path.join(data_dir, "data"),
+            "/apps/pixelbadge/images/": os.path.join(REPO_DIR, "images"),
+            "/apps/pixelbadge/": os.path.join(data_dir, "apps", "pixelbadge"),
+        })
+        self.paths.install()
+        self.package = load_app_package()
+        import wifi
+        from events.input import BUTTON_TYPES, ButtonDownEvent, ButtonUpEvent
+        from system.eventbus import eventbus
+        from tildagonos import tildagonos
+        self.wifi = wifi
+        self.button_types = BUTTON_TYPES
+        self.button_events = {"press": ButtonDownEvent, "release": ButtonUpEvent}
+        self.eventbus = eventbus
+        self.leds = tildagonos.leds
+        self.viewer = sys.modules[PACKAGE_NAME + ".animation_viewer"]
+        if api_base_url is not None:
+            self.viewer.api_base_url = api_base_url
+        self.set_wifi(wifi_connected)
+        if accept_disclaimer:
+            os.makedirs(os.path.join(data_dir, "data", "pixelbadge"), exist_ok=True)
+            with open(self.viewer.DATA_BASE_PATH + "_seen_disclaimer.txt", "w") as f:
+                f.write("simulator")
+        self.loop = asyncio.new_event_loop()
+        self.ctx = RecordingCtx()
+        self.frame = 0
+        # frame -> [(action, button name)]
+        self.script = {}
+        # utility name -> {"frames", "wall_ms", "max_wall_ms", "calls": {method: count}}
+        self.utility_stats = {}
+        self.app = self.loop.run_until_complete(self.start_app())
+
+    async def start_app(self):
+        app = self.package.app.UtilityMenuApp()
+        app._focused = True
+        return app
+
+    def close(self):
+        self.app._focused = False
+        tasks = asyncio.all_tasks(self.loop)
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            self.loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+        self.loop.close()
+        self.paths.uninstall()
+
+    def set_wifi(self, connected):
+        self.wifi.set_connected(connected)
+
+    def set_screen(self, screen):
+        self.loop.run_until_complete(self.call(self.app.set_screen, screen))
+
+    async def call(self, function, *args):
+        return function(*args)
+
+    # delivers a button event at the start of the given frame, action is "press" or "release"
+    def schedule(self, frame, action, button):
+        self.script.setdefault(frame, []).append((action, button))
+
+    # presses the button now and releases it after hold_frames
+    def tap(self, button, hold_frames=1):
+        self.schedule(self.frame, "press", button)
+        self.schedule(self.frame + hold_frames, "release", button)
+
+    def send_button(self, action, button):
+        self.eventbus.emit(self.button_events[action](self.button_types[button]))
+
+    def step(self, frames=1):
+        for _ in range(frames):
+            self.loop.run_until_complete(self.run_frame())
+
+    # steps until condition() is True, returns False if it still isn't after max_frames
+    def step_until(self, condition, max_frames=1000):
+        for _ in range(max_frames):
+            if condition():
+                return True
+            self.step()
+        return condition()
+
+    async def run_frame(self):
+        for action, button in self.script.pop(self.frame, []):
+            self.send_button(action, button)
+        self.clock.advance(self.frame_ms)
+        name = self.app.active_utility_name()
+        self.ctx.reset()
+        start = time.perf_counter()
+        self.app.update(self.frame_ms)
+        self.app.draw(self.ctx)
+        self.record_frame(name, (time.perf_counter() - start) * 1000)
+        self.frame += 1
+        await asyncio.sleep(self.io_wait_ms / 1000)
+
+    def record_frame(self, name, wall_ms):
+        stats = self.utility_stats.get(name)
+        if stats is None:
+            stats = {"frames": 0, "wall_ms": 0, "max_wall_ms": 0, "calls": {}}
+            self.utility_stats[name] = stats
+        stats["frames"] += 1
+        stats["wall_ms"] += wall_ms
+        stats["max_wall_ms"] = max(stats["max_wall_ms"], wall_ms)
+        for method in self.ctx.counts:
+            stats["calls"][method] = stats["calls"].get(method, 0) + self.ctx.counts[method]
+
+    # starts measuring afresh, for leaving out the frames spent getting a utility into the state to measure
+    def reset_stats(self):
+        self.utility_stats = {}
+
+    # per utility: frames, average and max wall ms per frame, and draw calls per frame
+    def stats(self):
+        result = {}
+        for name in self.utility_stats:
+            stats = self.utility_stats[name]
+            frames = stats["frames"]
+            result[name] = {
+                "frames": frames,
+                "avg_ms": stats["wall_ms"] / frames,
+                "max_ms": stats["max_wall_ms"],
+                "calls_per_frame": {method: count / frames for method, count in sorted(stats["calls"].items())},
+            }
+        return result
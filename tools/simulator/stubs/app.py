@@ -0,0 +1,8 @@
+# Stand-in for the firmware's app module: the scheduler normally sets _focused and calls update/draw,
+# tools/simulator/simulator.py does that instead.
+class App:
+    def __init__(self):
+        self.minimised = False
+
+    def minimise(self):
+        self.minimised = True
@@ -0,0 +1,2 @@
+display_x = 240
+display_y = 240
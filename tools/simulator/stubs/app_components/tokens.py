@@ -0,0 +1,22 @@
+one_pt = 1
+label_font_size = 18
+heading_font_size = 24
+line_height = 1.2
+
+colors = {
+    "pale_green": (175 / 255, 201 / 255, 68 / 255),
+    "mid_green": (82 / 255, 131 / 255, 41 / 255),
+    "dark_green": (33 / 255, 48 / 255, 24 / 255),
+    "yellow": (294 / 255, 226 / 255, 0),
+    "orange": (246 / 255, 127 / 255, 2 / 255),
+    "pink": (245 / 255, 80 / 255, 137 / 255),
+    "blue": (46 / 255, 173 / 255, 217 / 255),
+}
+
+
+def set_color(ctx, color):
+    ctx.rgb(*colors.get(color, (1, 1, 1)))
+
+
+def clear_background(ctx):
+    ctx.rgb(0, 0, 0).rectangle(-120, -120, 240, 240).fill()
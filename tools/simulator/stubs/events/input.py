@@ -0,0 +1,28 @@
+class Button:
+    def __init__(self, name):
+        self.name = name
+
+    # the firmware's buttons can be checked against a group with "in", each of these is its own group
+    def __contains__(self, other):
+        return other is self
+
+    def __repr__(self):
+        return f"Button({self.name})"
+
+
+BUTTON_TYPES = {name: Button(name) for name in ("UP", "DOWN", "LEFT", "RIGHT", "CANCEL", "CONFIRM")}
+
+
+class ButtonDownEvent:
+    def __init__(self, button):
+        self.button = button
+
+
+class ButtonUpEvent:
+    def __init__(self, button):
+        self.button = button
+
+
+class Buttons:
+    def __init__(self, app):
+        self.app = app
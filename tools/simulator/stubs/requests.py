@@ -0,0 +1,46 @@
+# Blocking requests shim over urllib, for the few places that use the firmware's requests module.
+import json as json_module
+import urllib.error
+import urllib.request
+
+TIMEOUT = 10
+
+
+class Response:
+    def __init__(self, status_code, content, headers):
+        self.status_code = status_code
+        self.content = content
+        self.headers = headers
+
+    @property
+    def text(self):
+        return self.content.decode()
+
+    def json(self):
+        return json_module.loads(self.content)
+
+    def close(self):
+        pass
+
+
+def request(method, url, data=None, json=None, headers=None, **kwargs):
+    headers = dict(headers or {})
+    if json is not None:
+        data = json_module.dumps(json)
+        headers["Content-Type"] = "application/json"
+    if isinstance(data, str):
+        data = data.encode()
+    req = urllib.request.Request(url, data=data, method=method, headers=headers)
+    try:
+        with urllib.request.urlopen(req, timeout=TIMEOUT) as response:
+            return Response(response.status, response.read(), dict(response.headers))
+    except urllib.error.HTTPError as e:
+        return Response(e.code, e.read(), dict(e.headers))
+
+
+def get(url, **kwargs):
+    return request("GET", url, **kwargs)
+
+
+def post(url, **kwargs):
+    return request("POST", url, **kwargs)
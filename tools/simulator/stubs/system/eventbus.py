@@ -0,0 +1,27 @@
+# Dispatches events to the handlers registered for their type, synchronously, like the firmware's eventbus
+# does for the button events.
+class EventBus:
+    def __init__(self):
+        # event type -> [(handler, app)]
+        self.handlers = {}
+        self.emitted = []
+
+    def on(self, event_type, handler, app):
+        self.handlers.setdefault(event_type, []).append((handler, app))
+
+    def remove(self, event_type, handler, app):
+        handlers = self.handlers.get(event_type, [])
+        for entry in list(handlers):
+            if entry[0] == handler and entry[1] is app:
+                handlers.remove(entry)
+
+    def emit(self, event):
+        self.emitted.append(event)
+        for handler, app in list(self.handlers.get(type(event), [])):
+            handler(event)
+
+    async def emit_async(self, event):
+        self.emit(event)
+
+
+eventbus = EventBus()
@@ -0,0 +1,6 @@
+class PatternDisable:
+    pass
+
+
+class PatternEnable:
+    pass
@@ -0,0 +1,3 @@
+class RequestStopAppEvent:
+    def __init__(self, app=None):
+        self.app = app
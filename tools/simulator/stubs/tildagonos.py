@@ -0,0 +1,28 @@
+# The 12 LEDs around the badge (plus index 0, which the app doesn't use). write() keeps a copy of what was
+# written so the simulator can check the colors shown.
+class LedArray:
+    def __init__(self, count=13):
+        self.colors = [(0, 0, 0)] * count
+        self.written = list(self.colors)
+        self.write_count = 0
+
+    def __getitem__(self, index):
+        return self.colors[index]
+
+    def __setitem__(self, index, color):
+        self.colors[index] = tuple(color)
+
+    def __len__(self):
+        return len(self.colors)
+
+    def write(self):
+        self.written = list(self.colors)
+        self.write_count += 1
+
+
+class Tildagonos:
+    def __init__(self):
+        self.leds = LedArray()
+
+
+tildagonos = Tildagonos()
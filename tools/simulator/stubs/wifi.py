@@ -0,0 +1,37 @@
+# Wi-Fi that is connected or not depending on set_connected(), for trying the app with the network dropping out.
+connected = True
+ssid = "simulator"
+connection_timeout = 10
+
+
+def set_connected(value):
+    global connected
+    connected = value
+
+
+def status():
+    return connected
+
+
+def get_ssid():
+    return ssid
+
+
+def get_connection_timeout():
+    return connection_timeout
+
+
+def connect():
+    pass
+
+
+def disconnect():
+    pass
+
+
+def wait():
+    return connected
+
+
+def stop():
+    pass
@@ -0,0 +1,151 @@
+# Runs scenarios that have broken the app before on tools/simulator, against tools/stub_server.py,
+# checking that no frame raises and that the app ends up in the expected state.
+#   python3 tools/simulator_check.py
+import os
+import sys
+import threading
+import traceback
+from http.server import ThreadingHTTPServer
+
+TOOLS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, TOOLS_DIR)
+import stub_server
+from simulator import Simulator
+
+# real time given to the stub server's responses after each frame, ms
+IO_WAIT_MS = 2
+SETUP_MAX_FRAMES = 3000
+# WiFiManager only looks at the connection once a second
+WIFI_CHECK_FRAMES = 40
+
+failures = []
+
+
+def check(name, condition, detail=""):
+    print(("PASS " if condition else "FAIL ") + name + (f" ({detail})" if detail else ""))
+    if not condition:
+        failures.append(name)
+
+
+def serve(inline_thumbnails=False, binary_list=True):
+    stub_server.StubHandler.state = stub_server.StubState(20, [16, 32], 12, True, True, inline_thumbnails, supports_binary_list=binary_list)
+    stub_server.StubHandler.state.quiet = True
+
+
+def start_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), stub_server.StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+# steps the simulator, returning the exception a frame raised as a string, or None
+def step_safely(sim, frames):
+    try:
+        sim.step(frames)
+    except Exception as e:
+        traceback.print_exc()
+        return f"{type(e).__name__}: {e}"
+    return None
+
+
+def page_loaded(browser):
+    if browser.is_loading_sequences_list or browser.sequences is None or len(browser.sequences) == 0:
+        return False
+    for seq in browser.sequences:
+        if seq.thumbnail_path is None:
+            return False
+    return True
+
+
+# the page on screen is moved to the page cache when another sort mode is opened, while the new
+# one waits for Wi-Fi the old page used to still be drawn with its thumbnails already compacted
+def check_sort_mode_change_offline(base_url):
+    serve()
+    sim = Simulator(api_base_url=base_url, io_wait_ms=IO_WAIT_MS)
+    try:
+        sim.set_screen("Pixel Art")
+        browser = sim.app.animation_app.thumbnail_browser
+        check("first page loaded", sim.step_until(lambda: page_loaded(browser), SETUP_MAX_FRAMES))
+        sort_mode = browser.sort_mode()
+        sim.set_wifi(False)
+        sim.step(WIFI_CHECK_FRAMES)
+        sim.tap("UP")
+        error = step_safely(sim, WIFI_CHECK_FRAMES)
+        check("sort mode changed offline", error is None and browser.sort_mode() != sort_mode, error or "")
+        sim.set_wifi(True)
+        loaded = sim.step_until(lambda: page_loaded(browser), SETUP_MAX_FRAMES)
+        check("new sort mode loaded once back online", loaded and browser.loaded_page_identifier == browser.page_identifier())
+        # the first page comes back from the page cache
+        while browser.sort_mode() != sort_mode:
+            sim.tap("UP")
+            sim.step(2)
+        error = step_safely(sim, 10)
+        check("cached page shown again", error is None and page_loaded(browser), error or "")
+    finally:
+        sim.close()
+
+
+# with the pinned entries alone over the memory budget, decoding an inline thumbnail used to evict it
+# again in the same track() call, so it was drawn from its base64 text and decoded on every frame
+def check_thumbnails_over_budget(base_url):
+    # only JSON lists hold base64 thumbnails, binary ones have them raw
+    serve(inline_thumbnails=True, binary_list=False)
+    sim = Simulator(api_base_url=base_url, io_wait_ms=IO_WAIT_MS)
+    try:
+        sim.app.animation_app.memory.budget_bytes = 1
+        sim.set_screen("Pixel Art")
+        browser = sim.app.animation_app.thumbnail_browser
+        check("inline page loaded over budget", sim.step_until(lambda: page_loaded(browser), SETUP_MAX_FRAMES))
+        error = step_safely(sim, 10)
+        decodes = []
+        decode_thumbnail = browser.decode_thumbnail
+        browser.decode_thumbnail = lambda seq: decodes.append(seq.id) or decode_thumbnail(seq)
+        if error is None:
+            error = step_safely(sim, 20)
+        check("thumbnails decoded once over budget", error is None and len(decodes) == 0, error or f"{len(decodes)} decodes in 20 frames")
+        drawn = browser.sequences[:browser.visible_thumbnails]
+        check("thumbnails drawn decoded", all(not isinstance(seq.thumbnail_path, str) for seq in drawn))
+    finally:
+        sim.close()
+
+
+# a fastload blob cut off mid-download used to be taken as a finished download, leaving the animation
+# stuck on the frames that arrived, the whole blob has to be requested again
+def check_truncated_fastload(base_url):
+    serve()
+    sim = Simulator(api_base_url=base_url, io_wait_ms=IO_WAIT_MS)
+    try:
+        sim.set_screen("Pixel Art")
+        browser = sim.app.animation_app.thumbnail_browser
+        player = sim.app.animation_app.animation_player
+        check("page loaded for playback", sim.step_until(lambda: page_loaded(browser), SETUP_MAX_FRAMES))
+        stub_server.StubHandler.truncate_frames = 1
+        frame_requests = stub_server.StubHandler.frame_requests
+        sim.tap("CONFIRM")
+        sim.step(2)
+        loaded = sim.step_until(lambda: player.current_sequence is not None and not player.downloading, SETUP_MAX_FRAMES)
+        sequence = player.current_sequence
+        requests = stub_server.StubHandler.frame_requests - frame_requests
+        check("truncated blob requested again", requests == 2, f"{requests} frame requests")
+        check("all frames loaded after a truncated blob", loaded and all(frame is not None for frame in sequence.local_frames), f"{player.downloaded_count}/{sequence.frame_count()}")
+    finally:
+        stub_server.StubHandler.truncate_frames = 0
+        sim.close()
+
+
+def main():
+    server, base_url = start_server()
+    try:
+        check_sort_mode_change_offline(base_url)
+        check_thumbnails_over_budget(base_url)
+        check_truncated_fastload(base_url)
+    finally:
+        server.shutdown()
+    if failures:
+        print(f"{len(failures)} check(s) failed")
+        sys.exit(1)
+    print("All checks passed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,349 @@
+# Local stand-in for the pixelbadge API, for trying client changes without the real server.
+# Serves a few generated animations. Run on a desktop and point api_base_url at it:
+#   python3 tools/stub_server.py --port 8080
+#   api_base_url = "http://<desktop ip>:8080"
+import argparse
+import base64
+import hashlib
+import json
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+PAGE_SIZE = 9
+
+
+def make_animation(seq_index, size, frame_count):
+    # a square moving over a striped background, using only a handful of colors
+    background = [(20 + 40 * (seq_index % 5), 30, 60), (10, 10 + 30 * (seq_index % 4), 40)]
+    square_color = (250, 200 - 20 * (seq_index % 8), 30)
+    square = max(2, size // 4)
+    frames = []
+    for f in range(frame_count):
+        pixels = []
+        sx = (f * 2) % (size - square + 1)
+        sy = (f + seq_index) % (size - square + 1)
+        for y in range(size):
+            for x in range(size):
+                if sx <= x < sx + square and sy <= y < sy + square:
+                    pixels.append(square_color)
+                else:
+                    pixels.append(background[(y // 4) % 2])
+        frames.append(pixels)
+    return frames
+
+
+def encode_raw_frame(size, pixels):
+    data = bytearray([size, size])
+    for r, g, b in pixels:
+        data += bytes((r, g, b))
+    return bytes(data)
+
+
+def encode_raw_blob(size, frames):
+    return b"".join(encode_raw_frame(size, pixels) for pixels in frames)
+
+
+def pack_indices(indices, bits_per_index):
+    if bits_per_index == 8:
+        return bytes(indices)
+    data = bytearray()
+    for k in range(0, len(indices), 2):
+        high = indices[k]
+        low = indices[k + 1] if k + 1 < len(indices) else 0
+        data.append((high << 4) | low)
+    return bytes(data)
+
+
+# runs of (start, length) covering the pixels that differ between two frames
+def changed_runs(previous, current, max_length=255):
+    runs = []
+    k = 0
+    while k < len(current):
+        if current[k] == previous[k]:
+            k += 1
+            continue
+        start = k
+        while k < len(current) and current[k] != previous[k] and k - start < max_length:
+            k += 1
+        runs.append((start, k - start))
+    return runs
+
+
+def encode_delta_frame(previous, current, bits_per_index):
+    runs = changed_runs(previous, current)
+    data = bytearray([1, len(runs) >> 8, len(runs) & 0xff])
+    for start, length in runs:
+        data += bytes([start >> 8, start & 0xff, length])
+        data += pack_indices(current[start:start + length], bits_per_index)
+    return bytes(data)
+
+
+# see fastload.py for the format, returns None if the animation has too many colors
+def encode_palette_blob(size, frames, delta=False):
+    palette = []
+    indices = {}
+    for pixels in frames:
+        for color in pixels:
+            if color not in indices:
+                indices[color] = len(palette)
+                palette.append(color)
+    if len(palette) > 256:
+        return None
+    bits_per_index = 4 if len(palette) <= 16 else 8
+    data = bytearray([0, bits_per_index | (0x80 if delta else 0), len(palette) % 256])
+    for color in palette:
+        data += bytes(color)
+    previous = None
+    for pixels in frames:
+        frame_indices = [indices[color] for color in pixels]
+        keyframe = bytes([size, size]) + pack_indices(frame_indices, bits_per_index)
+        if delta:
+            if previous is not None:
+                delta_frame = encode_delta_frame(previous, frame_indices, bits_per_index)
+                if len(delta_frame) < len(keyframe) + 1:
+                    keyframe = None
+                    data += delta_frame
+            if keyframe is not None:
+                data.append(0)
+        if keyframe is not None:
+            data += keyframe
+        previous = frame_indices
+    return bytes(data)
+
+
+def encode_str(value):
+    data = value.encode()[:255]
+    return bytes([len(data)]) + data
+
+
+# see sequence_list.py for the format, items are the dicts of the JSON list with thumbnail_path as raw bytes
+def encode_sequence_list(items, total_page_count, next_page_exists, random_uuid):
+    data = bytearray([0, 1, total_page_count >> 8, total_page_count & 0xff, 1 if next_page_exists else 0])
+    data += encode_str(random_uuid)
+    for item in items:
+        record = bytearray(encode_str(item["id"]))
+        record += item["frame_time_ms"].to_bytes(2, "big")
+        record.append(1 if item.get("favorited_by_current_user") else 0)
+        record += encode_str(item["username"]) + encode_str(item["title"])
+        record += len(item["frames"]).to_bytes(2, "big")
+        for frame_id in item["frames"]:
+            record += encode_str(frame_id)
+        for colors in item["frame_main_colors"]:
+            record.append(len(colors))
+            for color in colors:
+                record += bytes(color)
+        thumbnail = item.get("thumbnail_path") or b""
+        record += len(thumbnail).to_bytes(2, "big") + thumbnail
+        data += len(record).to_bytes(2, "big") + record
+    return bytes(data)
+
+
+class StubState:
+    def __init__(self, sequence_count, sizes, frame_count, supports_palette, supports_delta, inline_thumbnails, supports_thumbnail_bundles=True, supports_binary_list=True):
+        self.supports_palette = supports_palette
+        self.supports_thumbnail_bundles = supports_thumbnail_bundles
+        self.supports_binary_list = supports_binary_list
+        self.supports_delta = supports_delta
+        self.inline_thumbnails = inline_thumbnails
+        self.quiet = False
+        self.sequences = []
+        for i in range(sequence_count):
+            size = sizes[i % len(sizes)]
+            frames = make_animation(i, size, frame_count)
+            self.sequences.append({
+                "id": f"seq{i}",
+                "size": size,
+                "frames": frames,
+                "metadata": {
+                    "id": f"seq{i}",
+                    "frames": [f"frame{j}" for j in range(frame_count)],
+                    "frame_time_ms": 150,
+                    "frame_main_colors": [[list(frames[j][0])] for j in range(frame_count)],
+                    "username": "stub",
+                    "title": f"Stub animation {i}",
+                },
+            })
+        self.by_id = {seq["id"]: seq for seq in self.sequences}
+
+    def thumbnail(self, seq):
+        return encode_raw_frame(seq["size"], seq["frames"][0])
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    state = None
+    # seconds to wait before answering, to emulate slow badge wifi
+    latency = 0
+    # send bodies with Transfer-Encoding: chunked instead of Content-Length
+    chunked = False
+    # seconds before an idle keep-alive connection is closed
+    timeout = 30
+    # send ETags and answer If-None-Match with 304
+    validators = True
+    # the next this many frame blobs are cut off halfway and the connection closed
+    truncate_frames = 0
+    frame_requests = 0
+
+    def log_message(self, format, *args):
+        if not self.state.quiet:
+            super().log_message(format, *args)
+
+    def send_body(self, status, body, content_type="application/octet-stream"):
+        if status == 200 and self.validators:
+            etag = '"' + hashlib.sha1(body).hexdigest()[:16] + '"'
+            if self.headers.get("If-None-Match") == etag:
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.end_headers()
+                return
+            self.send_response(status)
+            self.send_header("ETag", etag)
+        else:
+            self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        if self.chunked:
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            for k in range(0, len(body), 512):
+                chunk = body[k:k + 512]
+                self.wfile.write(f"{len(chunk):x}\r\n".encode() + chunk + b"\r\n")
+            self.wfile.write(b"0\r\n\r\n")
+            return
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_json(self, status, value):
+        self.send_body(status, json.dumps(value).encode(), "application/json")
+
+    def read_request_body(self):
+        length = int(self.headers.get("Content-Length", 0))
+        return self.rfile.read(length) if length else b""
+
+    def do_GET(self):
+        self.read_request_body()
+        time.sleep(self.latency)
+        url = urlparse(self.path)
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        parts = [part for part in url.path.split("/") if part]
+        if parts[:2] == ["api", "sequences"]:
+            self.handle_sequences(query)
+        elif len(parts) == 4 and parts[:2] == ["api", "sequence"] and parts[3] == "thumbnail":
+            seq = self.state.by_id.get(parts[2])
+            if seq is None:
+                self.send_json(404, {"error": "not_found"})
+            else:
+                self.send_body(200, self.state.thumbnail(seq))
+        elif parts == ["api", "thumbnails"] and self.state.supports_thumbnail_bundles:
+            self.handle_thumbnail_bundle(query)
+        elif len(parts) == 3 and parts[0] == "images":
+            self.handle_frames(parts[1], query)
+        else:
+            self.send_json(404, {"error": "not_found"})
+
+    def do_POST(self):
+        self.read_request_body()
+        time.sleep(self.latency)
+        url = urlparse(self.path)
+        if url.path == "/api/get_login_code":
+            self.send_json(200, {"code": "123456", "badge_uuid": "stub-badge"})
+        elif url.path == "/api/check_login_code":
+            self.send_json(401, {"error": "not_yet"})
+        elif url.path.endswith("_favorite") or url.path == "/api/logout_badge":
+            self.send_json(200, {})
+        else:
+            self.send_json(404, {"error": "not_found"})
+
+    def handle_sequences(self, query):
+        page = int(query.get("page", 1))
+        sequences = self.state.sequences
+        page_count = max(1, (len(sequences) + PAGE_SIZE - 1) // PAGE_SIZE)
+        binary = query.get("format") == "binary" and self.state.supports_binary_list
+        items = []
+        for seq in sequences[(page - 1) * PAGE_SIZE:page * PAGE_SIZE]:
+            item = dict(seq["metadata"])
+            if self.state.inline_thumbnails:
+                item["thumbnail_path"] = self.state.thumbnail(seq)
+                if not binary:
+                    item["thumbnail_path"] = base64.b64encode(item["thumbnail_path"]).decode()
+            items.append(item)
+        if binary:
+            self.send_body(200, encode_sequence_list(items, page_count, page < page_count, "stub-badge"))
+            return
+        self.send_json(200, {
+            "sequences": items,
+            "total_page_count": page_count,
+            "next_page_exists": page < page_count,
+            "random_uuid": "stub-badge",
+        })
+
+    # [length (u32), raw thumbnail...] for every requested id, length 0 for unknown ids
+    def handle_thumbnail_bundle(self, query):
+        body = bytearray()
+        for sequence_id in query.get("ids", "").split(","):
+            seq = self.state.by_id.get(sequence_id)
+            thumbnail = self.state.thumbnail(seq) if seq is not None else b""
+            body += len(thumbnail).to_bytes(4, "big") + thumbnail
+        self.send_body(200, bytes(body))
+
+    def handle_frames(self, sequence_id, query):
+        seq = self.state.by_id.get(sequence_id)
+        if seq is None:
+            self.send_json(404, {"error": "not_found"})
+            return
+        body = None
+        if query.get("palette") == "true" and self.state.supports_palette:
+            delta = query.get("delta") == "true" and self.state.supports_delta
+            body = encode_palette_blob(seq["size"], seq["frames"], delta)
+        if body is None:
+            body = encode_raw_blob(seq["size"], seq["frames"])
+        StubHandler.frame_requests += 1
+        if StubHandler.truncate_frames > 0:
+            StubHandler.truncate_frames -= 1
+            self.send_truncated_body(body)
+            return
+        self.send_body(200, body)
+
+    # announces the whole body but only sends half of it, like a connection dropping mid-download
+    def send_truncated_body(self, body):
+        self.send_response(200)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body[:len(body) // 2])
+        self.wfile.flush()
+        self.close_connection = True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stand-in for the pixelbadge API")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--sequences", type=int, default=20)
+    parser.add_argument("--frames", type=int, default=12)
+    parser.add_argument("--sizes", default="16,32", help="comma separated animation sizes")
+    parser.add_argument("--no-palette", action="store_true", help="behave like a server without palette support")
+    parser.add_argument("--no-delta", action="store_true", help="behave like a server without delta frame support")
+    parser.add_argument("--latency", type=float, default=0, help="seconds to wait before answering each request")
+    parser.add_argument("--chunked", action="store_true", help="send bodies with chunked transfer encoding")
+    parser.add_argument("--keep-alive-timeout", type=float, default=30, help="seconds before idle connections are closed")
+    parser.add_argument("--no-thumbnail-bundle", action="store_true", help="answer /api/thumbnails with a 404 like older servers")
+    parser.add_argument("--no-validators", action="store_true", help="don't send ETags or answer conditional requests")
+    parser.add_argument("--inline-thumbnails", action="store_true", help="send base64 thumbnails in the sequence list")
+    parser.add_argument("--no-binary-list", action="store_true", help="send the JSON sequence list even if format=binary is requested")
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(",")]
+    StubHandler.state = StubState(args.sequences, sizes, args.frames, not args.no_palette, not args.no_delta, args.inline_thumbnails, not args.no_thumbnail_bundle, not args.no_binary_list)
+    StubHandler.latency = args.latency
+    StubHandler.chunked = args.chunked
+    StubHandler.validators = not args.no_validators
+    StubHandler.timeout = args.keep_alive_timeout
+    server = ThreadingHTTPServer((args.host, args.port), StubHandler)
+    print(f"Stub pixelbadge API listening on http://{args.host}:{args.port}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()